@@ -13,6 +13,8 @@ class SalesTrend(ReplicatedDocument):
     period_type = fields.StringField(required=True)  # 'weekly', 'monthly', 'yearly', 'seasonal'
     period_value = fields.StringField(required=True)  # e.g. '2023-W01', '2023-01', '2023', 'Spring'
     total_sales = fields.FloatField(required=True)
+    total_quantity = fields.IntField(default=0)
+    total_orders = fields.IntField(default=0)
     sales_growth_rate = fields.FloatField(required=True)
     sales_percentage = fields.FloatField(required=True)
     meta = {
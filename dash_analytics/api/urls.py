@@ -1,5 +1,8 @@
 from django.urls import path, include
-from .views.data_upload_views import DataUploadView
+from .views.data_upload_views import (
+    DataUploadView, StreamingUploadView, UploadResumeView, UploadRollbackView, UploadCancelView, UploadStatusStreamView,
+    UploadRejectedRowsView, EventIngestView
+)
 from .views.customer_views import CustomerViewSet
 from .views.product_views import ProductViewSet
 from .views.order_views import OrderViewSet
@@ -11,8 +14,20 @@ from analytics.product_performance_views import product_performance_api
 
 urlpatterns = [
     path('upload/', DataUploadView.as_view(), name='data-upload'),
+    path('upload/stream/', StreamingUploadView.as_view(), name='data-upload-stream'),
     path('upload/status/<str:upload_id>/',
          DataUploadView.as_view(), name='upload-status'),
+    path('upload/status/<str:upload_id>/stream/',
+         UploadStatusStreamView.as_view(), name='upload-status-stream'),
+    path('upload/resume/<str:upload_id>/',
+         UploadResumeView.as_view(), name='upload-resume'),
+    path('upload/rollback/<str:upload_id>/',
+         UploadRollbackView.as_view(), name='upload-rollback'),
+    path('upload/cancel/<str:upload_id>/',
+         UploadCancelView.as_view(), name='upload-cancel'),
+    path('upload/rejected/<str:upload_id>/',
+         UploadRejectedRowsView.as_view(), name='upload-rejected-rows'),
+    path('events/', EventIngestView.as_view(), name='event-ingest'),
     path('customers/',
          CustomerViewSet.as_view({'get': 'list'}), name='customer-list'),
     path('customers/demographics/',
@@ -3,7 +3,10 @@ from .customer_views import CustomerViewSet
 from .product_views import ProductViewSet
 from .order_views import OrderViewSet
 from .analytics_views import AnalyticsViewSet
-from .data_upload_views import DataUploadView
+from .data_upload_views import (
+    DataUploadView, StreamingUploadView, UploadResumeView, UploadStatusStreamView, UploadRejectedRowsView,
+    UploadRollbackView, EventIngestView, UploadCancelView
+)
 
 __all__ = [
     'AuthViewSet',
@@ -11,5 +14,12 @@ __all__ = [
     'ProductViewSet',
     'OrderViewSet',
     'AnalyticsViewSet',
-    'DataUploadView'
+    'DataUploadView',
+    'StreamingUploadView',
+    'UploadResumeView',
+    'UploadStatusStreamView',
+    'UploadRejectedRowsView',
+    'UploadRollbackView',
+    'EventIngestView',
+    'UploadCancelView'
 ]
\ No newline at end of file
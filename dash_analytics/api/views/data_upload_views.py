@@ -8,18 +8,37 @@ Provides enhanced data processing functionality with support for:
 - Optimized database operations
 """
 
+import hashlib
 import logging
 import pandas as pd
 import os
 import tempfile
+import time
+import uuid
+from datetime import datetime
 from decimal import Decimal
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import FileResponse, StreamingHttpResponse
 from core.models import Customer, Product, Order, Sales, RawDataUpload
 from core.utils import initialize_databases
 from core.fixed_bulk_processor import FixedBulkProcessor as BulkDataProcessor
-from core.bulk_sales_trend import update_sales_trend_in_bulk
+from core.csv_processing_config import BULK_PROCESSING, EVENT_INGEST, INGEST_SCHEDULER, UPLOAD_PROGRESS
+from core.batch_ingest import archive_type, create_batch_upload, ingest_archive
+from core.event_ingest import EventBufferFull, get_event_batcher, parse_event_lines
+from core.ingest_scheduler import AdmissionTimeout, admitted, estimate_rows
+from core.parsed_spool import parsed_spool_file
+from core.upload_cancellation import UploadCancelled, clear_cancellation, finish_cancellation, request_cancellation
+from core.upload_rollback import rollback_upload
+from core.upload_formats import (
+    COLUMNAR_FORMATS, PYARROW_AVAILABLE, compression_available, detect_compression,
+    detect_file_format, file_suffix
+)
+from core.streaming_upload import StreamingIngestUploadHandler
+from core.upload_progress import upload_progress, TERMINAL_STATUSES
 from analytics.models import (
     SalesTrend, ProductPerformance, CategoryPerformance,
     Demographics, GeographicalInsights, CustomerBehavior, Prediction
@@ -30,7 +49,10 @@ from mongoengine.connection import get_db
 
 # Import Celery tasks if using background processing
 try:
-    from celery_app import process_csv_data_task, process_analytics_task
+    from celery_app import (
+        process_csv_data_task, process_analytics_task, process_batch_upload_task, resume_csv_data_task,
+        rollback_upload_task
+    )
     CELERY_AVAILABLE = True
 except ImportError:
     CELERY_AVAILABLE = False
@@ -38,14 +60,105 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+def _content_hash(file):
+    """Return the SHA-256 of an uploaded file's content, leaving it rewound"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+def _spool_upload(file, suffix=None):
+    """Save an uploaded file to a temporary location and return its path"""
+    # Keep the suffix so the spooled copy is read in the upload's format
+    suffix = suffix or file_suffix(file.name) or '.csv'
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        for chunk in file.chunks():
+            temp_file.write(chunk)
+        return temp_file.name
+
+def _request_owner(request):
+    """Return who an upload is scheduled for: the user, or the client address for anonymous uploads"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user.get_username()
+    return request.META.get('REMOTE_ADDR') or 'anonymous'
+
+def _capacity_busy_response(upload_ids, busy):
+    """Fail an upload that was not admitted in time and tell the client when to retry"""
+    error_data = {'status': 'failed', 'error_message': str(busy)}
+    for upload_id in upload_ids:
+        RawDataUpload.objects(id=upload_id).update_one(**error_data)
+    retry_after = max(1, int(busy.estimate.get('estimated_start_seconds', 0)))
+    response = Response(
+        {'error': str(busy), 'scheduling': busy.estimate},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+def _upload_databases():
+    return {alias: get_db(alias) for alias in ('low_review_score_db', 'high_review_score_db')}
+
+def _cancelled_response(upload_id, other_ids=()):
+    """Finish an upload whose ingest stopped because it was cancelled"""
+    finish_cancellation(_upload_databases(), upload_id)
+    for other_id in other_ids:
+        RawDataUpload.objects(id=other_id).update_one(status='cancelled', cancelled_at=datetime.utcnow())
+    return Response(
+        {'error': 'Upload was cancelled', 'upload_id': str(upload_id), 'status': 'cancelled'},
+        status=status.HTTP_409_CONFLICT
+    )
+
+def _status_payload(upload_id, record):
+    """Build the upload status response from upload record fields"""
+    return {
+        'upload_id': str(upload_id),
+        'status': record.get('status'),
+        'file_name': record.get('file_name'),
+        'processed_records': record.get('processed_records', 0),
+        'total_records': record.get('total_records', 0),
+        'high_reviews': record.get('high_reviews_count', 0),
+        'low_reviews': record.get('low_reviews_count', 0),
+        'duplicate_records': record.get('duplicate_records', 0),
+        'rejected_records': record.get('rejected_records', 0),
+        'has_rejected_file': bool(record.get('rejected_file_path')),
+        'write_batching': record.get('write_batching', {}),
+        'error_message': record.get('error_message'),
+        'processing_time_seconds': record.get('processing_time'),
+        # Queue position and ETA, while the upload is waiting or running
+        'scheduling': None if record.get('status') in TERMINAL_STATUSES else record.get('scheduling'),
+        # Progress of each file of a multi-file upload
+        'files': _batch_files(upload_id) if record.get('batch_files') else None
+    }
+
+def _batch_files(upload_id):
+    """Return the status of each child upload of a multi-file upload"""
+    return [{
+        'upload_id': str(child.id),
+        'file_name': child.file_name,
+        'status': child.status,
+        'processed_records': child.processed_records,
+        'total_records': child.total_records,
+        'rejected_records': child.rejected_records,
+        'error_message': child.error_message
+    } for child in RawDataUpload.objects(parent_upload=upload_id).order_by('file_name')]
+
+def _upload_record(upload_id):
+    """Return the stored fields of an upload record, or None if it does not exist"""
+    upload = RawDataUpload.objects(id=upload_id).first()
+    return upload.to_mongo().to_dict() if upload else None
+
 class DataUploadView(APIView):
     """
     Optimized API view for data uploads and processing
     """
-    def get(self, request):
+    def get(self, request, upload_id=None):
         """
-        Get a list of all uploaded files/records
+        Get a list of all uploaded files/records, or the status of one upload
         """
+        if upload_id:
+            return self.get_upload_status(request, upload_id)
         try:
             uploads = RawDataUpload.objects.all().order_by('-upload_date')
             
@@ -91,15 +204,35 @@ class DataUploadView(APIView):
             file = request.FILES['file']
             if not isinstance(file, UploadedFile):
                 return Response({'error': 'Invalid file format'}, status=status.HTTP_400_BAD_REQUEST)
+            if archive_type(file.name):
+                return self.post_archive(request, file)
 
-            if not file.name.endswith('.csv'):
-                return Response({'error': 'File must be a CSV'}, status=status.HTTP_400_BAD_REQUEST)
+            file_format = detect_file_format(file.name)
+            if not file_format:
+                return Response(
+                    {'error': 'File must be a CSV (optionally .gz, .bz2 or .zst compressed), '
+                              'Parquet, Feather or Arrow IPC file, or a zip/tar archive of them'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if file_format in COLUMNAR_FORMATS and not PYARROW_AVAILABLE:
+                return Response(
+                    {'error': 'Parquet, Feather and Arrow uploads require pyarrow on the server'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            compression = detect_compression(file.name)
+            if not compression_available(compression):
+                return Response(
+                    {'error': f'{compression} compressed uploads are not supported on this server'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-            # Check for duplicate file
-            existing_upload = RawDataUpload.objects(file_name=file.name).first()
+            # Check for a file with identical content; files that only share
+            # rows with earlier uploads are accepted and ingested as a delta
+            content_hash = _content_hash(file)
+            existing_upload = RawDataUpload.objects(content_hash=content_hash, status='completed').first()
             if existing_upload:
                 return Response({
-                    'error': f'A file with name "{file.name}" has already been uploaded on {existing_upload.upload_date.strftime("%Y-%m-%d %H:%M:%S")}',
+                    'error': f'A file with identical content ("{existing_upload.file_name}") has already been uploaded on {existing_upload.upload_date.strftime("%Y-%m-%d %H:%M:%S")}',
                     'details': {
                         'upload_date': existing_upload.upload_date,
                         'file_name': existing_upload.file_name
@@ -109,7 +242,10 @@ class DataUploadView(APIView):
             # Create upload record with pending status
             upload_data = {
                 'file_name': file.name,
-                'status': 'pending'
+                'status': 'pending',
+                'content_hash': content_hash,
+                'file_size': file.size,
+                'uploaded_by': _request_owner(request)
             }
             low_doc, high_doc = RawDataUpload.save_to_all(upload_data)
             upload_id = low_doc.id  # Use ID for passing to background tasks
@@ -120,14 +256,11 @@ class DataUploadView(APIView):
             
             # If Celery is available and file is large, process in background
             if CELERY_AVAILABLE and is_large_file:
-                # Save uploaded file to a temporary location
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as temp_file:
-                    for chunk in file.chunks():
-                        temp_file.write(chunk)
-                    temp_file_path = temp_file.name
+                # Save uploaded file to a temporary location, still compressed
+                temp_file_path = _spool_upload(file)
                 
                 # Start background processing task
-                process_csv_data_task.delay(upload_id, temp_file_path)
+                process_csv_data_task.delay(str(upload_id), temp_file_path)
                 
                 # Return 202 Accepted for background processing
                 return Response({
@@ -139,22 +272,20 @@ class DataUploadView(APIView):
             else:
                 # For smaller files or when Celery isn't available, process synchronously
                 try:
-                    # Update status to processing
-                    upload_data = {'status': 'processing'}
-                    RawDataUpload.objects(id=upload_id).update_one(**upload_data)
-                    RawDataUpload.objects(id=high_doc.id).update_one(**upload_data)
-                    
-                    # Read CSV file
-                    df = pd.read_csv(file)
-                    
-                    # Initialize databases to ensure all collections exist
-                    initialize_databases()
-                      # Process data in bulk with optimized operations
-                    processor = BulkDataProcessor(chunk_size=200)
-                    result = processor.process_dataframe(df, upload_id)
-                    
-                    # Process sales trends in bulk
-                    update_sales_trend_in_bulk(df)
+                    # Waits, still pending, for write capacity shared with other uploads
+                    with admitted(upload_id, upload_data['uploaded_by'], BULK_PROCESSING['MAX_THREADS'],
+                                  estimate_rows(file_size), timeout=INGEST_SCHEDULER['SYNC_WAIT']) as write_slots:
+                        # Update status to processing
+                        upload_data = {'status': 'processing'}
+                        RawDataUpload.objects(id=upload_id).update_one(**upload_data)
+                        RawDataUpload.objects(id=high_doc.id).update_one(**upload_data)
+                        
+                        # Initialize databases to ensure all collections exist
+                        initialize_databases()
+                        
+                        # Stream the file through the bulk writers chunk by chunk
+                        processor = BulkDataProcessor(max_threads=write_slots)
+                        result = processor.process_file(file, upload_id, file_format, compression=compression)
                     
                     # Update upload record with counts and processing time
                     completed_data = {
@@ -163,6 +294,9 @@ class DataUploadView(APIView):
                         'total_records': result['total_records'],
                         'high_reviews_count': result['high_reviews_count'],
                         'low_reviews_count': result['low_reviews_count'],
+                        'duplicate_records': result['duplicate_records'],
+                        'rejected_records': result['rejected_records'],
+                        'rejected_file_path': result['rejected_file_path'],
                         'processing_time': result['processing_time']
                     }
                     RawDataUpload.objects(id=upload_id).update_one(**completed_data)
@@ -182,9 +316,15 @@ class DataUploadView(APIView):
                         'processed_records': result['processed_records'],
                         'high_reviews': result['high_reviews_count'],
                         'low_reviews': result['low_reviews_count'],
+                        'duplicate_records': result['duplicate_records'],
+                        'rejected_records': result['rejected_records'],
                         'processing_time_seconds': result['processing_time']
                     })
 
+                except AdmissionTimeout as busy:
+                    return _capacity_busy_response([upload_id, high_doc.id], busy)
+                except UploadCancelled:
+                    return _cancelled_response(upload_id, [high_doc.id])
                 except Exception as process_error:
                     # Update status to failed
                     error_data = {
@@ -207,26 +347,68 @@ class DataUploadView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def post_archive(self, request, file):
+        """
+        Ingest the files of a zip or tar archive concurrently as one upload,
+        with a child upload per file (see core/batch_ingest.py)
+        """
+        content_hash = _content_hash(file)
+        existing_upload = RawDataUpload.objects(content_hash=content_hash, status='completed').first()
+        if existing_upload:
+            return Response({
+                'error': f'An archive with identical content ("{existing_upload.file_name}") has already been uploaded on {existing_upload.upload_date.strftime("%Y-%m-%d %H:%M:%S")}',
+                'details': {
+                    'upload_date': existing_upload.upload_date,
+                    'file_name': existing_upload.file_name
+                }
+            }, status=status.HTTP_409_CONFLICT)
+        
+        owner = _request_owner(request)
+        upload_id = create_batch_upload(file.name, owner, content_hash=content_hash, file_size=file.size)
+        archive_path = _spool_upload(file, suffix=os.path.splitext(file.name)[1])
+        
+        if CELERY_AVAILABLE:
+            process_batch_upload_task.delay(str(upload_id), archive_path)
+            return Response({
+                'message': 'Archive upload accepted for processing',
+                'upload_id': str(upload_id),
+                'status': 'pending',
+                'is_background_process': True
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        try:
+            initialize_databases()
+            # Each file waits, still pending, for write capacity shared with other uploads
+            stats = ingest_archive(upload_id, archive_path, owner, admission_timeout=INGEST_SCHEDULER['SYNC_WAIT'])
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        finally:
+            os.remove(archive_path)
+        
+        return Response({
+            'message': 'Archive uploaded and processed' + (
+                f" with {stats['failed_files']} failed files" if stats['failed_files'] else ' successfully'
+            ),
+            'upload_id': str(upload_id),
+            'files': [{key: value for key, value in file_info.items() if key != 'path'} for file_info in stats['files']],
+            'processed_records': stats['processed_records'],
+            'high_reviews': stats['high_reviews_count'],
+            'low_reviews': stats['low_reviews_count'],
+            'duplicate_records': stats['duplicate_records'],
+            'rejected_records': stats['rejected_records'],
+            'processing_time_seconds': stats['processing_time']
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR if stats['failed_files'] else status.HTTP_200_OK)
+    
     def get_upload_status(self, request, upload_id):
         """
         Get status of a background upload process
         """
         try:
-            upload = RawDataUpload.objects(id=upload_id).first()
-            if not upload:
+            record = _upload_record(upload_id)
+            if not record:
                 return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
             
-            return Response({
-                'upload_id': str(upload.id),
-                'status': upload.status,
-                'file_name': upload.file_name,
-                'processed_records': upload.processed_records,
-                'total_records': upload.total_records,
-                'high_reviews': getattr(upload, 'high_reviews_count', 0),
-                'low_reviews': getattr(upload, 'low_reviews_count', 0),
-                'error_message': getattr(upload, 'error_message', None),
-                'processing_time_seconds': getattr(upload, 'processing_time', None)
-            })
+            return Response(_status_payload(upload_id, record))
             
         except Exception as e:
             logger.error(f"Error getting upload status: {str(e)}")
@@ -242,3 +424,451 @@ class DataUploadView(APIView):
         elif score <= 2:
             return 'Negative'
         return 'Neutral'
+
+
+class StreamingUploadView(APIView):
+    """
+    CSV upload that is ingested while the request body is still arriving
+    """
+    def post(self, request):
+        """
+        Parse and write the 'file' field chunk by chunk as it is received.
+        
+        The file is never stored, so identical content cannot be refused up
+        front as DataUploadView does; rows that were ingested before are
+        skipped by row-level de-duplication instead. Only CSV files
+        (optionally compressed) can be streamed.
+        """
+        processor = BulkDataProcessor()
+        high_ids = {}
+        owner = _request_owner(request)
+        
+        def start_upload(file_name):
+            low_doc, high_doc = RawDataUpload.save_to_all(
+                {'file_name': file_name, 'status': 'processing', 'uploaded_by': owner}
+            )
+            high_ids[low_doc.id] = high_doc.id
+            return low_doc.id
+        
+        handler = StreamingIngestUploadHandler(processor, start_upload)
+        try:
+            request._request.upload_handlers = [handler]
+        except AttributeError:
+            # The body was already read (e.g. by CSRF checking of a session login)
+            return Response(
+                {'error': 'Request body was read before it could be streamed; use the regular upload endpoint'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        upload_id = None
+        try:
+            initialize_databases()
+            # The upload record only exists once the body arrives, so the
+            # admission is keyed on the request and sized from its length
+            with admitted(None, owner, BULK_PROCESSING['MAX_THREADS'],
+                          estimate_rows(request.META.get('CONTENT_LENGTH')),
+                          ticket=f"stream-{uuid.uuid4().hex}", timeout=INGEST_SCHEDULER['SYNC_WAIT']) as write_slots:
+                processor.max_threads = write_slots
+                # Reading the body drives the ingest running on the handler's worker thread
+                request.FILES
+                if handler.error:
+                    return Response({'error': handler.error}, status=status.HTTP_400_BAD_REQUEST)
+                upload_id = handler.upload_id
+                if upload_id is None:
+                    return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+                
+                result = handler.wait()
+            
+            completed_data = {
+                'status': 'completed',
+                'content_hash': handler.content_hash,
+                'file_size': handler.received_bytes,
+                'processed_records': result['processed_records'],
+                'total_records': result['total_records'],
+                'high_reviews_count': result['high_reviews_count'],
+                'low_reviews_count': result['low_reviews_count'],
+                'duplicate_records': result['duplicate_records'],
+                'rejected_records': result['rejected_records'],
+                'rejected_file_path': result['rejected_file_path'],
+                'processing_time': result['processing_time']
+            }
+            RawDataUpload.objects(id=upload_id).update_one(**completed_data)
+            RawDataUpload.objects(id=high_ids[upload_id]).update_one(**completed_data)
+            
+            try:
+                from post_upload_hooks import post_csv_upload_hook
+                post_csv_upload_hook()
+            except Exception as hook_error:
+                logger.error(f"Error running post upload hooks: {str(hook_error)}")
+            
+            return Response({
+                'message': 'Data streamed and processed successfully',
+                'upload_id': str(upload_id),
+                'processed_records': result['processed_records'],
+                'high_reviews': result['high_reviews_count'],
+                'low_reviews': result['low_reviews_count'],
+                'duplicate_records': result['duplicate_records'],
+                'rejected_records': result['rejected_records'],
+                'processing_time_seconds': result['processing_time']
+            })
+        
+        except AdmissionTimeout as busy:
+            # Nothing was read or written yet
+            return _capacity_busy_response([], busy)
+        except UploadCancelled:
+            return _cancelled_response(handler.upload_id, [high_ids[handler.upload_id]])
+        except Exception as e:
+            logger.error(f"Error processing streamed upload: {str(e)}")
+            if handler.upload_id is not None:
+                # Let the worker finish with whatever it has before recording the failure
+                try:
+                    handler.wait()
+                except Exception:
+                    pass
+                error_data = {'status': 'failed', 'error_message': str(e)}
+                RawDataUpload.objects(id=handler.upload_id).update_one(**error_data)
+                RawDataUpload.objects(id=high_ids[handler.upload_id]).update_one(**error_data)
+            return Response(
+                {'error': 'Error processing upload: ' + str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class UploadResumeView(APIView):
+    """
+    Resume a failed or cancelled upload from its last committed chunk
+    """
+    def post(self, request, upload_id):
+        """
+        Continue processing an upload, skipping chunks that were already committed.
+        Replays the upload's parsed spool if there is one, then the retained
+        copy of the file; otherwise the same file must be sent again as 'file'.
+        """
+        try:
+            upload = RawDataUpload.objects(id=upload_id).first()
+            if not upload:
+                return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+            
+            if upload.status not in ('failed', 'cancelled'):
+                return Response(
+                    {'error': f"Only failed or cancelled uploads can be resumed (upload is {upload.status})"},
+                    status=status.HTTP_409_CONFLICT
+                )
+            
+            spool_path = parsed_spool_file(upload.parsed_spool)
+            file_path = spool_path or upload.source_file_path
+            if not file_path or not os.path.exists(file_path):
+                if 'file' not in request.FILES:
+                    return Response(
+                        {'error': 'The original file was not retained; send it again as "file" to resume'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                file_path = _spool_upload(request.FILES['file'])
+            
+            committed_chunks = len(upload.checkpoints)
+            
+            if CELERY_AVAILABLE:
+                resume_csv_data_task.delay(str(upload.id), file_path)
+                return Response({
+                    'message': 'Upload resume accepted for processing',
+                    'upload_id': str(upload.id),
+                    'committed_chunks': committed_chunks,
+                    'status': 'pending',
+                    'is_background_process': True
+                }, status=status.HTTP_202_ACCEPTED)
+            
+            # Without Celery, resume synchronously once write capacity is free
+            clear_cancellation(_upload_databases(), upload.id)
+            if not spool_path:
+                RawDataUpload.objects(id=upload.id).update_one(source_file_path=file_path)
+            try:
+                with admitted(upload.id, upload.uploaded_by or _request_owner(request), BULK_PROCESSING['MAX_THREADS'],
+                              estimate_rows(os.path.getsize(file_path)), timeout=INGEST_SCHEDULER['SYNC_WAIT']) as write_slots:
+                    RawDataUpload.objects(id=upload.id).update_one(status='processing')
+                    initialize_databases()
+                    processor = BulkDataProcessor(max_threads=write_slots)
+                    result = processor.process_file(
+                        file_path, upload.id, detect_file_format(file_path) or 'csv',
+                        resume=True, compression=detect_compression(file_path)
+                    )
+            except AdmissionTimeout as busy:
+                return _capacity_busy_response([upload.id], busy)
+            except UploadCancelled:
+                return _cancelled_response(upload.id)
+            
+            # The parsed spool is kept for reprocessing until its retention runs out
+            source_file_path = RawDataUpload.objects(id=upload.id).first().source_file_path
+            if source_file_path and os.path.exists(source_file_path):
+                os.remove(source_file_path)
+            RawDataUpload.objects(id=upload.id).update_one(
+                status='completed',
+                source_file_path=None,
+                processed_records=result['processed_records'],
+                total_records=result['total_records'],
+                high_reviews_count=result['high_reviews_count'],
+                low_reviews_count=result['low_reviews_count'],
+                rejected_records=result['rejected_records'],
+                rejected_file_path=result['rejected_file_path'],
+                processing_time=result['processing_time']
+            )
+            
+            return Response({
+                'message': 'Upload resumed and processed successfully',
+                'upload_id': str(upload.id),
+                'committed_chunks': committed_chunks,
+                'resumed_records': result['resumed_records'],
+                'processed_records': result['processed_records'],
+                'rejected_records': result['rejected_records'],
+                'processing_time_seconds': result['processing_time']
+            })
+            
+        except Exception as e:
+            logger.error(f"Error resuming upload {upload_id}: {str(e)}")
+            RawDataUpload.objects(id=upload_id).update_one(status='failed', error_message=str(e))
+            return Response(
+                {'error': 'Error resuming upload: ' + str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class UploadRollbackView(APIView):
+    """
+    Remove everything an upload wrote from both databases
+    """
+    def post(self, request, upload_id):
+        """
+        Delete the customers, products, orders, sales and reviews written by an
+        upload and take its sales out of the sales trend and customer
+        behavior analytics. Uploads that are still running cannot be rolled back.
+        """
+        try:
+            upload = RawDataUpload.objects(id=upload_id).first()
+            if not upload:
+                return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+            
+            if upload.status in ('pending', 'processing'):
+                return Response({'error': 'Upload is still running'}, status=status.HTTP_409_CONFLICT)
+            if upload.status == 'rolled_back':
+                return Response({'error': 'Upload has already been rolled back'}, status=status.HTTP_409_CONFLICT)
+            
+            if CELERY_AVAILABLE:
+                rollback_upload_task.delay(str(upload.id))
+                return Response({
+                    'message': 'Upload rollback accepted for processing',
+                    'upload_id': str(upload.id),
+                    'is_background_process': True
+                }, status=status.HTTP_202_ACCEPTED)
+            
+            start_time = time.time()
+            deleted = rollback_upload(_upload_databases(), upload.id)
+            upload.reload()
+            return Response({
+                'message': 'Upload rolled back successfully',
+                'upload_id': str(upload.id),
+                'deleted': deleted,
+                # Rows kept because other uploads contain them too
+                'shared': upload.rollback_shared,
+                'processing_time_seconds': time.time() - start_time
+            })
+        
+        except Exception as e:
+            logger.error(f"Error rolling back upload {upload_id}: {str(e)}")
+            return Response(
+                {'error': 'Error rolling back upload: ' + str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class UploadCancelView(APIView):
+    """
+    Stop a pending or running upload
+    """
+    def post(self, request, upload_id):
+        """
+        Ask the ingest of an upload to stop after the chunks it is writing.
+        
+        The upload is marked cancelled once its ingest has stopped. Pass
+        'rollback' to also remove what it committed; otherwise it can be
+        resumed later. Cancelling a multi-file upload cancels its files.
+        """
+        try:
+            upload = RawDataUpload.objects(id=upload_id).first()
+            if not upload:
+                return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+            
+            if upload.status in TERMINAL_STATUSES:
+                return Response(
+                    {'error': f"Upload has already finished ({upload.status})"}, status=status.HTTP_409_CONFLICT
+                )
+            
+            rollback = str(request.data.get('rollback', request.query_params.get('rollback', ''))).lower()
+            rollback = rollback in ('1', 'true', 'yes')
+            upload_ids = request_cancellation(_upload_databases(), upload.id, rollback)
+            return Response({
+                'message': 'Cancellation requested',
+                'upload_id': str(upload.id),
+                'rollback': rollback,
+                'uploads': len(upload_ids)
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        except Exception as e:
+            logger.error(f"Error cancelling upload {upload_id}: {str(e)}")
+            return Response(
+                {'error': 'Error cancelling upload: ' + str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class UploadRejectedRowsView(APIView):
+    """
+    Download the rows of an upload that failed schema validation
+    """
+    def get(self, request, upload_id):
+        """
+        Return the rejected-rows CSV: the original columns plus the file row
+        number and the reason each row was rejected.
+        """
+        upload = RawDataUpload.objects(id=upload_id).first()
+        if not upload:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        file_path = upload.rejected_file_path
+        if not file_path or not os.path.exists(file_path):
+            return Response({'error': 'Upload has no rejected rows'}, status=status.HTTP_404_NOT_FOUND)
+        
+        base_name = os.path.splitext(upload.file_name)[0]
+        return FileResponse(
+            open(file_path, 'rb'),
+            as_attachment=True,
+            filename=f"{base_name}_rejected.csv",
+            content_type='text/csv'
+        )
+
+
+class EventIngestView(APIView):
+    """
+    Append order events sent as newline-delimited JSON
+    """
+    def post(self, request):
+        """
+        Validate each line of the body as one order event (an object with the
+        retail CSV columns as keys) and queue the valid ones to be written in
+        the next micro-batch. With ``?wait=true`` the response is sent once
+        they are written.
+        """
+        try:
+            events_df, errors = parse_event_lines(request.stream or [])
+            batcher = get_event_batcher()
+            try:
+                sequence = batcher.submit(events_df)
+            except EventBufferFull as full:
+                response = Response({'error': str(full)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response['Retry-After'] = str(max(1, int(EVENT_INGEST['MAX_BATCH_SECONDS'])))
+                return response
+            
+            data = {
+                'accepted': len(events_df),
+                'rejected': len(errors),
+                'errors': errors[:EVENT_INGEST['MAX_ERRORS_REPORTED']],
+            }
+            if request.query_params.get('wait', '').lower() in ('1', 'true', 'yes'):
+                data['written'] = batcher.wait_written(sequence)
+                return Response(data, status=status.HTTP_201_CREATED if data['written'] else status.HTTP_202_ACCEPTED)
+            data['buffered'] = batcher.buffered()
+            return Response(data, status=status.HTTP_202_ACCEPTED)
+        
+        except Exception as e:
+            logger.error(f"Error ingesting events: {str(e)}")
+            return Response(
+                {'error': 'Error ingesting events: ' + str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Accepts 'text/event-stream' requests; error responses are sent as JSON
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+class UploadStatusStreamView(APIView):
+    """
+    Stream the progress of an upload as Server-Sent Events
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+    
+    def get(self, request, upload_id):
+        """
+        Send a 'progress' event whenever the upload's status changes, ending
+        with the event that reports it completed or failed.
+        
+        Progress of uploads processed in this process is pushed as the
+        processor publishes it; otherwise the upload record is re-read every
+        UPLOAD_PROGRESS['STREAM_POLL_INTERVAL'] seconds.
+        """
+        try:
+            record = _upload_record(upload_id)
+        except Exception as e:
+            logger.error(f"Error getting upload status: {str(e)}")
+            return Response(
+                {'error': 'Error getting upload status: ' + str(e)}, 
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        if not record:
+            return Response({'error': 'Upload not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        response = StreamingHttpResponse(
+            self.stream_events(upload_id, record),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def stream_events(self, upload_id, record):
+        """Yield SSE messages for an upload until it finishes or the stream times out"""
+        poll_interval = UPLOAD_PROGRESS['STREAM_POLL_INTERVAL']
+        heartbeat = UPLOAD_PROGRESS['STREAM_HEARTBEAT']
+        deadline = time.monotonic() + UPLOAD_PROGRESS['STREAM_TIMEOUT']
+        
+        version, progress = upload_progress.snapshot(upload_id)
+        if progress and record.get('status') not in TERMINAL_STATUSES:
+            record.update(progress)
+        last_payload = _status_payload(upload_id, record)
+        last_sent = time.monotonic()
+        yield self.format_event(last_payload)
+        
+        while record.get('status') not in TERMINAL_STATUSES and time.monotonic() < deadline:
+            new_version, progress = upload_progress.wait(upload_id, version, poll_interval)
+            if new_version != version:
+                version = new_version
+                record.update(progress)
+            else:
+                # Nothing published here; the upload may be running elsewhere or have failed
+                try:
+                    stored = _upload_record(upload_id)
+                except Exception as e:
+                    logger.error(f"Error getting upload status: {str(e)}")
+                    stored = None
+                if stored is None:
+                    break
+                if progress is None or stored.get('status') in TERMINAL_STATUSES:
+                    record = stored
+            
+            payload = _status_payload(upload_id, record)
+            if payload != last_payload:
+                last_payload = payload
+                last_sent = time.monotonic()
+                yield self.format_event(payload)
+            elif time.monotonic() - last_sent >= heartbeat:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+    
+    def format_event(self, payload):
+        """Format a status payload as an SSE 'progress' event"""
+        return f"event: progress\ndata: {json.dumps(payload, cls=DjangoJSONEncoder)}\n\n"
@@ -89,7 +89,7 @@ class DataUploadView(APIView):
                     temp_file_path = temp_file.name
                 
                 # Start background processing task
-                process_csv_data_task.delay(upload_id, temp_file_path)
+                process_csv_data_task.delay(str(upload_id), temp_file_path)
                 
                 # Return 202 Accepted for background processing
                 return Response({
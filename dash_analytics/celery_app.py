@@ -5,7 +5,9 @@ This module configures Celery for background processing tasks related to data up
 """
 
 import os
-from celery import Celery
+from contextlib import nullcontext
+from datetime import datetime
+from celery import Celery, chord
 import logging
 
 # Configure logging
@@ -17,20 +19,219 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dash_analytics.settings')
 # Create Celery app
 app = Celery('dash_analytics')
 
-# Load configuration from Django settings
+# Load configuration from Django settings (CELERY_BROKER_URL, CELERY_RESULT_BACKEND, ...)
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-# Configure for development (use SQLite for result backend in development mode)
-app.conf.update(
-    broker_url='memory://',
-    task_always_eager=True,  # For development - execute tasks immediately
-    task_eager_propagates=True,  # Show exceptions when in eager mode
-    result_backend='db+sqlite:///results.sqlite'  # Use SQLite for result backend in dev
-)
+def _configure_filesystem_broker():
+    """Point the filesystem broker at a shared message directory, if it is the configured broker"""
+    from django.conf import settings
+    
+    if not str(app.conf.broker_url or '').startswith('filesystem://'):
+        return
+    folder = getattr(settings, 'CELERY_BROKER_FILESYSTEM_DIR', None) or os.path.join(os.getcwd(), 'celery_broker')
+    messages = os.path.join(folder, 'messages')
+    processed = os.path.join(folder, 'processed')
+    for path in (messages, processed):
+        os.makedirs(path, exist_ok=True)
+    app.conf.broker_transport_options = {
+        'data_folder_in': messages,
+        'data_folder_out': messages,
+        'processed_folder': processed,
+        'store_processed': False
+    }
+
+_configure_filesystem_broker()
 
 # Auto-discover tasks from installed apps
 app.autodiscover_tasks()
 
+def _connect_databases():
+    """Ensure the review-score database connections exist in this worker"""
+    from mongoengine import connect
+    from django.conf import settings
+    
+    connect(
+        db=settings.MONGODB_DATABASES['low_review_score_db']['name'],
+        host=settings.MONGODB_DATABASES['low_review_score_db']['uri'],
+        alias='low_review_score_db'
+    )
+    connect(
+        db=settings.MONGODB_DATABASES['high_review_score_db']['name'],
+        host=settings.MONGODB_DATABASES['high_review_score_db']['uri'],
+        alias='high_review_score_db'
+    )
+
+def _ingest_csv_file(upload_id, file_path, resume=False):
+    """
+    Stream a spooled upload file (CSV or columnar) into the database for an upload record
+    
+    On failure the upload is marked as failed and the spooled file is kept
+    so the upload can be resumed from its last checkpoint; a cancelled upload
+    is marked as cancelled instead. ``file_path`` may also be the upload's
+    parsed spool (see core/parsed_spool.py).
+    """
+    from bson import ObjectId
+    from mongoengine import get_db
+    from core.bulk_load import DeferredIndexes, should_bulk_load
+    from core.bulk_processor import BulkDataProcessor
+    from core.csv_processing_config import BULK_PROCESSING
+    from core.ingest_scheduler import admitted, estimate_rows
+    from core.parsed_spool import is_parsed_spool
+    from core.upload_cancellation import UploadCancelled, finish_cancellation
+    from core.upload_formats import detect_compression, detect_file_format
+    
+    if isinstance(upload_id, str):
+        upload_id = ObjectId(upload_id)
+    
+    try:
+        # Ensure database connections
+        _connect_databases()
+        low_db = get_db('low_review_score_db')
+        high_db = get_db('high_review_score_db')
+        
+        # Waits here, still pending, until the scheduler grants write capacity
+        upload = low_db.raw_data_uploads.find_one({'_id': upload_id}, {'uploaded_by': 1}) or {}
+        file_size = os.path.getsize(file_path)
+        with admitted(upload_id, upload.get('uploaded_by'), BULK_PROCESSING['MAX_THREADS'],
+                      estimate_rows(file_size)) as write_slots:
+            # Set status to processing in both DBs
+            update_data = {'status': 'processing'}
+            if not is_parsed_spool(file_path):
+                update_data['source_file_path'] = file_path
+            low_db.raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
+            high_db.raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
+            
+            # Stream the file in chunks so it is never held in memory whole
+            processor = BulkDataProcessor(
+                chunk_size=BULK_PROCESSING['CHUNK_SIZE'],
+                max_threads=write_slots
+            )
+            file_format = detect_file_format(file_path) or 'csv'
+            # Large loads skip secondary index maintenance and rebuild the indexes once at the end
+            deferred_indexes = nullcontext()
+            if should_bulk_load(file_size):
+                deferred_indexes = DeferredIndexes(
+                    {'low_review_score_db': low_db, 'high_review_score_db': high_db}, upload_id
+                )
+            with deferred_indexes:
+                result = processor.process_file(
+                    file_path, upload_id, file_format,
+                    resume=resume, compression=detect_compression(file_path)
+                )
+            
+            return _complete_ingest(processor, upload_id, file_path, result)
+        
+    except UploadCancelled:
+        # Write slots were released as the ingest unwound
+        finish_cancellation({alias: get_db(alias) for alias in ('low_review_score_db', 'high_review_score_db')},
+                            upload_id)
+        return {'cancelled': True, 'upload_id': str(upload_id)}
+    except Exception as e:
+        logger.error(f"Error in background processing task: {str(e)}")
+        _mark_upload_failed(upload_id, e)
+        raise
+
+def _complete_ingest(processor, upload_id, file_path, result):
+    """Run the post-upload steps once every row of a spooled file is committed, then drop the file"""
+    from mongoengine import get_db
+    from core.parsed_spool import is_parsed_spool
+    
+    # Run post-processing hooks
+    from post_upload_hooks import post_csv_upload_hook
+    post_csv_upload_hook()
+    
+    # Clean up temp file now that every chunk is committed; the parsed spool
+    # is kept for reprocessing until its retention runs out
+    upload = get_db('low_review_score_db').raw_data_uploads.find_one({'_id': upload_id}, {'source_file_path': 1}) or {}
+    for path in {file_path, upload.get('source_file_path')}:
+        if path and not is_parsed_spool(path) and os.path.exists(path):
+            os.remove(path)
+    update_data = {'source_file_path': None}
+    get_db('low_review_score_db').raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
+    get_db('high_review_score_db').raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
+    
+    logger.info(f"Task completed: processed {result['processed_records']} records")
+    return result
+
+def _mark_upload_failed(upload_id, error):
+    """Set an upload to failed in both databases; its spooled file is kept for resuming"""
+    from mongoengine import get_db
+    
+    try:
+        update_data = {
+            'status': 'failed',
+            'error_message': str(error)
+        }
+        get_db('low_review_score_db').raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
+        get_db('high_review_score_db').raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
+    except Exception as e:
+        logger.error(f"Error updating upload status: {str(e)}")
+
+def _dispatch_distributed_ingest(upload_id, file_path, resume=False):
+    """
+    Ingest a large spooled file as a chord of row-range tasks
+    
+    Returns:
+        dict: Dispatch summary, or None if the file should be ingested by a
+        single task (distributed ingest disabled, file too small or not splittable)
+    """
+    from bson import ObjectId
+    from mongoengine import get_db
+    from core.bulk_load import DeferredIndexes, should_bulk_load
+    from core.csv_processing_config import BULK_PROCESSING, DISTRIBUTED_INGEST
+    from core.distributed_ingest import plan_ranges
+    from core.incremental_analytics import ensure_analytics_indexes
+    from core.upload_formats import detect_file_format
+    
+    if not DISTRIBUTED_INGEST['ENABLED'] or os.path.getsize(file_path) < DISTRIBUTED_INGEST['MIN_FILE_MB'] * 1024 * 1024:
+        return None
+    
+    object_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+    _connect_databases()
+    low_db = get_db('low_review_score_db')
+    high_db = get_db('high_review_score_db')
+    
+    chunk_size = BULK_PROCESSING['CHUNK_SIZE']
+    if resume:
+        # Offsets are only meaningful with the chunking of the original attempt
+        upload = low_db.raw_data_uploads.find_one({'_id': object_id}, {'chunk_size': 1}) or {}
+        chunk_size = upload.get('chunk_size') or chunk_size
+    file_format = detect_file_format(file_path) or 'csv'
+    ranges = plan_ranges(file_path, file_format, chunk_size)
+    if not ranges or len(ranges) < 2:
+        return None
+    
+    # Range tasks add their counts as they finish
+    update_data = {
+        'status': 'processing',
+        'source_file_path': file_path,
+        'chunk_size': chunk_size,
+        'total_records': sum(task_range['row_count'] for task_range in ranges),
+        'processed_records': 0,
+        'high_reviews_count': 0,
+        'low_reviews_count': 0,
+        'rejected_records': 0,
+        'ingest_tasks': len(ranges)
+    }
+    low_db.raw_data_uploads.update_one({'_id': object_id}, {'$set': update_data})
+    high_db.raw_data_uploads.update_one({'_id': object_id}, {'$set': update_data})
+    # Range tasks increment the same totals from several workers at once
+    ensure_analytics_indexes(low_db)
+    ensure_analytics_indexes(high_db)
+    if should_bulk_load(os.path.getsize(file_path)):
+        # Rebuilt by the chord callback once every range is loaded
+        DeferredIndexes({'low_review_score_db': low_db, 'high_review_score_db': high_db}, object_id).defer()
+    
+    upload_id = str(object_id)
+    chord(
+        ingest_range_task.s(upload_id, file_path, file_format, task_range, chunk_size, resume)
+        for task_range in ranges
+    )(finish_distributed_ingest_task.s(
+        upload_id, file_path, [task_range['offset'] for task_range in ranges], datetime.now().isoformat()
+    ))
+    logger.info(f"Dispatched upload {upload_id} as {len(ranges)} range tasks")
+    return {'upload_id': upload_id, 'ingest_tasks': len(ranges)}
+
 # Define Celery tasks
 @app.task(bind=True)
 def process_csv_data_task(self, upload_id, temp_file_path):
@@ -39,81 +240,217 @@ def process_csv_data_task(self, upload_id, temp_file_path):
     
     Args:
         upload_id: ID of upload record
-        temp_file_path: Path to temp CSV file
+        temp_file_path: Path to temp upload file (CSV, Parquet, Feather or Arrow IPC)
     """
-    import pandas as pd
-    from mongoengine import connect, get_db
-    from django.conf import settings
+    dispatched = _dispatch_distributed_ingest(upload_id, temp_file_path)
+    if dispatched:
+        return dispatched
+    return _ingest_csv_file(upload_id, temp_file_path)
+
+@app.task(bind=True)
+def resume_csv_data_task(self, upload_id, file_path=None):
+    """
+    Background task that resumes a failed upload from its last checkpoint
+    
+    The upload's parsed spool is replayed when there is one, so nothing is
+    parsed again; otherwise the file is read.
+    
+    Args:
+        upload_id: ID of upload record
+        file_path: CSV file to read; defaults to the upload's spooled file
+    """
+    from bson import ObjectId
+    from mongoengine import get_db
+    from core.parsed_spool import parsed_spool_file
+    from core.upload_cancellation import clear_cancellation
+    
+    _connect_databases()
+    object_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+    # Resuming a cancelled upload withdraws its cancellation
+    clear_cancellation({alias: get_db(alias) for alias in ('low_review_score_db', 'high_review_score_db')},
+                       object_id)
+    upload = get_db('low_review_score_db').raw_data_uploads.find_one(
+        {'_id': object_id}, {'source_file_path': 1, 'parsed_spool': 1}
+    ) or {}
+    spool_path = parsed_spool_file(upload.get('parsed_spool'))
+    if spool_path:
+        return _ingest_csv_file(object_id, spool_path, resume=True)
+    if file_path is None:
+        file_path = upload.get('source_file_path')
+    if not file_path or not os.path.exists(file_path):
+        raise FileNotFoundError(f"No retained source file for upload {upload_id}")
+    
+    dispatched = _dispatch_distributed_ingest(object_id, file_path, resume=True)
+    if dispatched:
+        return dispatched
+    return _ingest_csv_file(object_id, file_path, resume=True)
+
+@app.task(bind=True)
+def ingest_range_task(self, upload_id, file_path, file_format, task_range, chunk_size, resume=False):
+    """
+    Ingest one row range of a spooled upload (a chord header task)
+    
+    Errors are returned rather than raised so the chord callback always runs
+    and can mark the upload as failed.
+    
+    Args:
+        upload_id: ID of upload record
+        file_path: Spooled upload file, readable by every worker
+        file_format: Upload format of the file
+        task_range: Range dict from core.distributed_ingest.plan_ranges
+        chunk_size: Rows per chunk
+        resume: Skip chunks already committed by a previous attempt
+    """
+    from bson import ObjectId
+    from mongoengine import get_db
     from core.bulk_processor import BulkDataProcessor
-    from core.bulk_sales_trend import update_sales_trend_in_bulk
+    from core.csv_processing_config import BULK_PROCESSING
+    from core.distributed_ingest import iter_range_chunks
+    from core.ingest_scheduler import admitted
+    from core.upload_cancellation import UploadCancelled
     
     try:
-        # Ensure database connections
-        connect(
-            db=settings.MONGODB_DATABASES['low_review_score_db']['name'],
-            host=settings.MONGODB_DATABASES['low_review_score_db']['uri'],
-            alias='low_review_score_db'
-        )
-        connect(
-            db=settings.MONGODB_DATABASES['high_review_score_db']['name'],
-            host=settings.MONGODB_DATABASES['high_review_score_db']['uri'],
-            alias='high_review_score_db'
-        )
-        
-        # Read CSV file
-        df = pd.read_csv(temp_file_path)
-        
-        # Set status to processing in both DBs
-        low_db = get_db('low_review_score_db')
-        high_db = get_db('high_review_score_db')
+        _connect_databases()
+        # Each range is admitted separately, so an upload's ranges share capacity fairly with other uploads
+        upload = get_db('low_review_score_db').raw_data_uploads.find_one(
+            {'_id': ObjectId(upload_id)}, {'uploaded_by': 1}
+        ) or {}
+        with admitted(upload_id, upload.get('uploaded_by'), BULK_PROCESSING['MAX_THREADS'],
+                      task_range['row_count'], ticket=f"{upload_id}-{task_range['offset']}") as write_slots:
+            processor = BulkDataProcessor(chunk_size=chunk_size, max_threads=write_slots)
+            chunk_dfs = iter_range_chunks(file_path, file_format, task_range, chunk_size)
+            stats = processor.process_range(chunk_dfs, upload_id, task_range['offset'], resume=resume)
         
-        update_data = {'status': 'processing'}
-        low_db.raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
-        high_db.raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
+        # The chord callback refreshes the analytics the ranges incremented, once
+        stats['analytics_period_types'] = sorted(processor.analytics_period_types)
+        stats['analytics_customers'] = sorted(processor.analytics_customers)
+        stats['analytics_months'] = processor.analytics_months
         
-        # Process data in chunks
-        processor = BulkDataProcessor(chunk_size=1000, max_threads=4)
-        result = processor.process_dataframe(df, upload_id)
-        
-        # Update sales trends in bulk after data is inserted
-        update_sales_trend_in_bulk(df)
-        
-        # Run post-processing hooks
-        from post_upload_hooks import post_csv_upload_hook
-        post_csv_upload_hook()
-        
-        # Clean up temp file
-        os.remove(temp_file_path)
-        
-        logger.info(f"Task completed: processed {result['processed_records']} records")
-        return result
+        progress = {'$inc': {
+            'processed_records': stats['processed_records'],
+            'high_reviews_count': stats['high_reviews_count'],
+            'low_reviews_count': stats['low_reviews_count'],
+            'rejected_records': stats['rejected_records']
+        }}
+        get_db('low_review_score_db').raw_data_uploads.update_one({'_id': ObjectId(upload_id)}, progress)
+        get_db('high_review_score_db').raw_data_uploads.update_one({'_id': ObjectId(upload_id)}, progress)
         
+        logger.info(f"Range at offset {task_range['offset']} of upload {upload_id}: "
+                    f"processed {stats['processed_records']} records")
+        return stats
+    except UploadCancelled:
+        logger.info(f"Range at offset {task_range['offset']} of upload {upload_id} stopped: upload cancelled")
+        return {'cancelled': True, 'offset': task_range['offset']}
     except Exception as e:
-        logger.error(f"Error in background processing task: {str(e)}")
+        logger.error(f"Error ingesting range at offset {task_range['offset']} of upload {upload_id}: {str(e)}")
+        return {'error': str(e), 'offset': task_range['offset']}
+
+@app.task(bind=True)
+def finish_distributed_ingest_task(self, results, upload_id, file_path, offsets, started_at):
+    """
+    Merge the range results of a distributed ingest and finalize the upload (the chord callback)
+    
+    Post-upload analytics and hooks run here exactly once per upload.
+    
+    Args:
+        results: Statistics returned by each ingest_range_task
+        upload_id: ID of upload record
+        file_path: Spooled upload file
+        offsets: Row offsets of the ranges, in file order
+        started_at: ISO timestamp of the dispatch
+    """
+    from bson import ObjectId
+    from core.bulk_load import DeferredIndexes
+    from core.bulk_processor import BulkDataProcessor
+    from core.csv_processing_config import BULK_PROCESSING
+    from core.distributed_ingest import merge_range_stats
+    from core.schema_validation import merge_rejected_parts
+    from core.upload_cancellation import finish_cancellation
+    
+    object_id = ObjectId(upload_id)
+    try:
+        _connect_databases()
+        processor = BulkDataProcessor(
+            chunk_size=BULK_PROCESSING['CHUNK_SIZE'],
+            max_threads=BULK_PROCESSING['MAX_THREADS']
+        )
+        # Restore indexes deferred for a bulk load, whether or not every range succeeded
+        DeferredIndexes.from_upload(
+            {'low_review_score_db': processor.low_db, 'high_review_score_db': processor.high_db}, object_id
+        ).rebuild()
         
-        # Update status to failed
-        try:
-            low_db = get_db('low_review_score_db')
-            high_db = get_db('high_review_score_db')
-            
-            update_data = {
-                'status': 'failed',
-                'error_message': str(e)
-            }
-            low_db.raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
-            high_db.raw_data_uploads.update_one({'_id': upload_id}, {'$set': update_data})
-        except Exception as e2:
-            logger.error(f"Error updating upload status: {str(e2)}")
+        if any(result.get('cancelled') for result in results):
+            finish_cancellation({'low_review_score_db': processor.low_db, 'high_review_score_db': processor.high_db},
+                                object_id)
+            return {'cancelled': True, 'upload_id': upload_id}
         
-        # Attempt to clean up temp file if it exists
-        try:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-        except:
-            pass
+        errors = [result for result in results if result.get('error')]
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(results)} ranges failed; first error at offset "
+                               f"{errors[0]['offset']}: {errors[0]['error']}")
         
+        stats = merge_range_stats(results)
+        processor.analytics_period_types = stats.pop('analytics_period_types')
+        processor.analytics_customers = stats.pop('analytics_customers')
+        processor.analytics_months = stats.pop('analytics_months')
+        stats['rejected_file_path'] = merge_rejected_parts(upload_id, offsets)
+        processor._update_upload_status(object_id, {
+            'total_records': stats['total_records'],
+            'processed_records': stats['processed_records'],
+            'high_reviews_count': stats['high_reviews_count'],
+            'low_reviews_count': stats['low_reviews_count']
+        })
+        result = processor._finalize(stats, object_id, datetime.fromisoformat(started_at))
+        return _complete_ingest(processor, object_id, file_path, result)
+    except Exception as e:
+        logger.error(f"Error finishing distributed ingest of upload {upload_id}: {str(e)}")
+        _mark_upload_failed(object_id, e)
         raise
 
+@app.task(bind=True)
+def process_batch_upload_task(self, upload_id, archive_path):
+    """
+    Background task ingesting the files of an uploaded archive as one batch
+    
+    Args:
+        upload_id: ID of the parent upload record
+        archive_path: Spooled zip or tar archive, removed once extracted and ingested
+    """
+    from bson import ObjectId
+    from mongoengine import get_db
+    from core.batch_ingest import ingest_archive
+    
+    _connect_databases()
+    upload = get_db('low_review_score_db').raw_data_uploads.find_one(
+        {'_id': ObjectId(upload_id)}, {'uploaded_by': 1}
+    ) or {}
+    try:
+        stats = ingest_archive(upload_id, archive_path, upload.get('uploaded_by'))
+    finally:
+        # Failed files are kept extracted for resuming; the archive is no longer needed
+        if os.path.exists(archive_path):
+            os.remove(archive_path)
+    logger.info(f"Batch upload {upload_id}: {stats['completed_files']} of {len(stats['files'])} files completed")
+    return stats
+
+@app.task(bind=True)
+def rollback_upload_task(self, upload_id):
+    """
+    Background task that removes everything an upload wrote
+    
+    Args:
+        upload_id: ID of upload record
+    """
+    from mongoengine import get_db
+    from core.upload_rollback import rollback_upload
+    
+    _connect_databases()
+    deleted = rollback_upload(
+        {alias: get_db(alias) for alias in ('low_review_score_db', 'high_review_score_db')}, upload_id
+    )
+    logger.info(f"Rolled back upload {upload_id}")
+    return deleted
+
 @app.task(bind=True)
 def process_analytics_task(self, upload_id):
     """
@@ -122,21 +459,9 @@ def process_analytics_task(self, upload_id):
     Args:
         upload_id: ID of upload record
     """
-    from mongoengine import connect, get_db
-    from django.conf import settings
-    
     try:
         # Ensure database connections
-        connect(
-            db=settings.MONGODB_DATABASES['low_review_score_db']['name'],
-            host=settings.MONGODB_DATABASES['low_review_score_db']['uri'],
-            alias='low_review_score_db'
-        )
-        connect(
-            db=settings.MONGODB_DATABASES['high_review_score_db']['name'],
-            host=settings.MONGODB_DATABASES['high_review_score_db']['uri'],
-            alias='high_review_score_db'
-        )
+        _connect_databases()
         
         # Update predictions and additional analytics
         from core.utils import process_analytics_for_upload
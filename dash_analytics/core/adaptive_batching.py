@@ -0,0 +1,106 @@
+"""
+Adaptive Batch Sizing for Bulk Writes
+
+Measures the latency of each bulk_write per collection and grows or shrinks
+the number of operations sent per call so that calls stay close to a target
+latency. Small dimension collections and large fact collections therefore
+settle on different batch sizes, and sizes follow the server as its load
+changes.
+"""
+
+import logging
+import threading
+from core.csv_processing_config import ADAPTIVE_BATCHING
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatchSizer:
+    """
+    Tracks write latency and throughput per collection and picks batch sizes
+    """
+    def __init__(self, target_latency_ms=None, min_batch_size=None, max_batch_size=None,
+                 initial_batch_size=None, smoothing=None):
+        """
+        Initialize the sizer; unset arguments fall back to ADAPTIVE_BATCHING
+
+        Args:
+            target_latency_ms: Latency each bulk_write call should stay close to
+            min_batch_size: Smallest batch size that will be used
+            max_batch_size: Largest batch size that will be used
+            initial_batch_size: Batch size for a collection with no measurements
+            smoothing: Weight of the newest sample in the moving averages (0-1)
+        """
+        self.target_latency = (target_latency_ms or ADAPTIVE_BATCHING['TARGET_LATENCY_MS']) / 1000.0
+        self.min_batch_size = min_batch_size or ADAPTIVE_BATCHING['MIN_BATCH_SIZE']
+        self.max_batch_size = max_batch_size or ADAPTIVE_BATCHING['MAX_BATCH_SIZE']
+        self.initial_batch_size = initial_batch_size or ADAPTIVE_BATCHING['INITIAL_BATCH_SIZE']
+        self.smoothing = smoothing or ADAPTIVE_BATCHING['SMOOTHING']
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def batch_size(self, collection_name):
+        """Return the number of operations to send in the next write to a collection"""
+        with self._lock:
+            state = self._collections.get(collection_name)
+            return state['batch_size'] if state else self._clamp(self.initial_batch_size)
+
+    def record(self, collection_name, operation_count, seconds):
+        """
+        Record one completed write and adjust the collection's batch size
+
+        The new size is the one the measured per-operation latency predicts
+        would take the target latency, limited to halving or doubling per
+        step and kept within the configured bounds.
+
+        Args:
+            collection_name: Collection that was written to
+            operation_count: Number of operations in the write
+            seconds: Wall-clock duration of the write
+        """
+        if operation_count <= 0:
+            return
+        seconds = max(seconds, 1e-6)
+
+        with self._lock:
+            state = self._collections.setdefault(collection_name, {
+                'batch_size': self._clamp(self.initial_batch_size),
+                'latency': seconds,
+                'throughput': operation_count / seconds,
+                'writes': 0,
+                'operations': 0,
+            })
+            alpha = self.smoothing
+            state['latency'] = alpha * seconds + (1 - alpha) * state['latency']
+            state['throughput'] = alpha * (operation_count / seconds) + (1 - alpha) * state['throughput']
+            state['writes'] += 1
+            state['operations'] += operation_count
+
+            # Only batches that filled the current size say anything about a larger one
+            if operation_count < state['batch_size'] and seconds < self.target_latency:
+                return
+
+            predicted = state['throughput'] * self.target_latency
+            current = state['batch_size']
+            new_size = self._clamp(int(min(max(predicted, current / 2), current * 2)))
+            if new_size != current:
+                logger.debug(f"Batch size for {collection_name}: {current} -> {new_size} "
+                             f"(latency {state['latency'] * 1000:.0f}ms)")
+                state['batch_size'] = new_size
+
+    def snapshot(self):
+        """Return the current batch size and measurements for every collection"""
+        with self._lock:
+            return {
+                collection_name: {
+                    'batch_size': state['batch_size'],
+                    'avg_latency_ms': round(state['latency'] * 1000, 1),
+                    'ops_per_second': round(state['throughput'], 1),
+                    'writes': state['writes'],
+                    'operations': state['operations'],
+                }
+                for collection_name, state in self._collections.items()
+            }
+
+    def _clamp(self, size):
+        return max(self.min_batch_size, min(self.max_batch_size, size))
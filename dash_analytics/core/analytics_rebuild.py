@@ -0,0 +1,113 @@
+"""
+Full Rebuild of the Analytics Collections
+
+Recomputes sales trends, customer behavior, product performance and
+category performance from every stored sale, rather than from one upload,
+and swaps the results in through shadow collections so dashboards never
+read a partially rebuilt collection. Used to repair the incrementally
+maintained collections or to backfill them after a schema change.
+"""
+
+import logging
+import pandas as pd
+from core.csv_processing_config import ANALYTICS_REBUILD
+from core.incremental_analytics import AnalyticsPartials
+from core.shadow_collections import reload_collections
+
+logger = logging.getLogger(__name__)
+
+# Assumed profit margin, as in the per-upload performance analytics
+PROFIT_MARGIN = 0.3
+
+
+def load_sales(db):
+    """
+    Return every stored sale joined with its product's name and category
+
+    Returns:
+        pandas.DataFrame: customer_id, product_id, quantity, order_date,
+        revenue, product_name and category_name
+    """
+    sales = pd.DataFrame(list(db.sales.find(
+        {}, {'_id': 0, 'customer_id': 1, 'product_id': 1, 'quantity': 1, 'sale_date': 1, 'revenue': 1}
+    )), columns=['customer_id', 'product_id', 'quantity', 'sale_date', 'revenue'])
+    products = pd.DataFrame(list(db.products.find(
+        {}, {'_id': 0, 'product_id': 1, 'product_name': 1, 'category_name': 1}
+    )), columns=['product_id', 'product_name', 'category_name'])
+
+    # Sales reference products by the string form of their id
+    sales['product_id'] = sales['product_id'].astype(str)
+    products['product_id'] = products['product_id'].astype(str)
+    sales = sales.merge(products.drop_duplicates('product_id'), on='product_id', how='left')
+    sales['product_name'] = sales['product_name'].fillna('')
+    sales['category_name'] = sales['category_name'].fillna('Unknown')
+    return sales.rename(columns={'sale_date': 'order_date'})
+
+
+def product_performance_documents(sales):
+    """Return product_performance documents for a frame of sales"""
+    if sales.empty:
+        return []
+    stats = sales.groupby(['product_id', 'product_name', 'category_name'], as_index=False).agg(
+        total_quantity_sold=('quantity', 'sum'), total_revenue=('revenue', 'sum')
+    )
+    profits = sales.groupby('category_name')['revenue'].sum() * PROFIT_MARGIN
+    stats['average_revenue'] = stats['total_revenue'] / stats['total_quantity_sold']
+    stats['is_best_selling'] = stats.index == stats['total_quantity_sold'].idxmax()
+    stats['is_worst_selling'] = stats.index == stats['total_quantity_sold'].idxmin()
+    stats['is_highest_profit_category'] = stats['category_name'] == profits.idxmax()
+    stats['id'] = 'perf-' + stats['product_id']
+    return stats.rename(columns={'category_name': 'category'})[[
+        'id', 'product_id', 'category', 'total_quantity_sold', 'average_revenue',
+        'is_best_selling', 'is_worst_selling', 'is_highest_profit_category'
+    ]].to_dict('records')
+
+
+def category_performance_documents(sales):
+    """Return category_performance documents for a frame of sales"""
+    if sales.empty:
+        return []
+    stats = sales.groupby('category_name', as_index=False).agg(
+        total_quantity_sold=('quantity', 'sum'), total_revenue=('revenue', 'sum')
+    )
+    stats['average_revenue'] = stats['total_revenue'] / stats['total_quantity_sold']
+    stats['highest_profit'] = stats.index == (stats['total_revenue'] * PROFIT_MARGIN).idxmax()
+    stats['id'] = 'cat-' + stats['category_name'].str.replace(' ', '-').str.lower()
+    return stats.rename(columns={'category_name': 'category'})[[
+        'id', 'category', 'total_quantity_sold', 'average_revenue', 'highest_profit'
+    ]].to_dict('records')
+
+
+def build_analytics(sales):
+    """
+    Compute the complete analytics collections for a frame of sales
+
+    Returns:
+        dict: Collection name -> documents
+    """
+    partials = AnalyticsPartials.from_frame(sales)
+    return {
+        'sales_trends': partials.trend_documents() if partials.trends else [],
+        'customer_behavior': partials.customer_documents() if partials.customers else [],
+        'product_performance': product_performance_documents(sales),
+        'category_performance': category_performance_documents(sales),
+    }
+
+
+def rebuild_analytics(dbs, source_alias='low_review_score_db', collections=None):
+    """
+    Rebuild analytics collections from the stored sales and swap them in atomically
+
+    Args:
+        dbs: Dict of database alias to database; every one receives the rebuilt collections
+        source_alias: Database whose sales and products are read
+        collections: Collections to rebuild (defaults to ANALYTICS_REBUILD['COLLECTIONS'])
+
+    Returns:
+        dict: Collection name -> number of documents loaded
+    """
+    collections = collections or ANALYTICS_REBUILD['COLLECTIONS']
+    sales = load_sales(dbs[source_alias])
+    logger.info(f"Rebuilding {', '.join(collections)} from {len(sales)} sales")
+    documents = build_analytics(sales)
+    return reload_collections(dbs, {collection_name: documents[collection_name] for collection_name in collections})
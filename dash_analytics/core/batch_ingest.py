@@ -0,0 +1,425 @@
+"""
+Multi-File Batch Ingest
+
+Partitioned exports arrive as many files at once, either packed in a zip or
+tar archive or dropped into a watched directory. A batch is ingested as one
+parent upload record (``batch_files`` set) with a child record per file
+(``parent_upload`` set), so every file keeps its own progress, checkpoints,
+rejected rows, parsed spool and rollback.
+
+Files are ingested concurrently, up to ``BATCH_INGEST['MAX_PARALLEL_FILES']``
+at a time, and each is admitted by the ingest scheduler like any other
+upload. All files share one DimensionRegistry, so a customer or product that
+appears in several files is written once per batch. Sales trend and customer
+behavior totals are incremented as each file is written; growth rates,
+shares and segments, the bulk sales trends and the post-upload hooks run
+once, after the last file.
+
+A failed file leaves its child record failed with its file kept at
+``source_file_path``, so it can be resumed on its own; the parent is marked
+failed with the number of files that did not complete. Cancelling the
+parent cancels every file that has not finished.
+"""
+
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from mongoengine.connection import get_db
+
+from core.bulk_processor import BulkDataProcessor
+from core.csv_processing_config import BATCH_INGEST, BULK_PROCESSING, DIMENSION_CACHE
+from core.dimension_cache import DimensionRegistry
+from core.ingest_scheduler import AdmissionTimeout, admitted, estimate_rows
+from core.upload_cancellation import UploadCancelled, finish_cancellation, request_cancellation
+from core.upload_formats import detect_compression, detect_file_format
+
+logger = logging.getLogger(__name__)
+
+# Archive file name suffix -> archive type
+ARCHIVE_SUFFIXES = {
+    '.zip': 'zip',
+    '.tar': 'tar',
+    '.tar.gz': 'tar',
+    '.tgz': 'tar',
+    '.tar.bz2': 'tar',
+    '.tar.xz': 'tar',
+}
+
+# Subdirectories of a watched directory: files being ingested, and files ingested
+INGESTING_DIR = 'ingesting'
+PROCESSED_DIR = 'processed'
+
+DATABASES = ('low_review_score_db', 'high_review_score_db')
+
+# Counts of a child upload added to its parent as the child completes
+_SUMMED_COUNTS = ('total_records', 'processed_records', 'high_reviews_count', 'low_reviews_count',
+                  'duplicate_records', 'rejected_records')
+
+
+def archive_type(file_name):
+    """Return 'zip' or 'tar' for an archive file name, or None"""
+    name = file_name.lower()
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return ARCHIVE_SUFFIXES[suffix]
+    return None
+
+
+def _is_data_file(name):
+    """Whether an archive member or directory entry is a file in an upload format"""
+    base_name = os.path.basename(name)
+    if not base_name or base_name.startswith('.') or '__MACOSX' in name:
+        return False
+    return detect_file_format(base_name) is not None
+
+
+def _archive_members(archive_path):
+    """
+    Open an archive and list its data files
+
+    Returns:
+        tuple: (the open archive, list of (member name, uncompressed size,
+        callable opening the member) tuples)
+    """
+    if archive_type(archive_path) == 'zip':
+        archive = zipfile.ZipFile(archive_path)
+        return archive, [
+            (info.filename, info.file_size, lambda info=info: archive.open(info))
+            for info in archive.infolist() if not info.is_dir() and _is_data_file(info.filename)
+        ]
+    archive = tarfile.open(archive_path)
+    return archive, [
+        (member.name, member.size, lambda member=member: archive.extractfile(member))
+        for member in archive.getmembers() if member.isfile() and _is_data_file(member.name)
+    ]
+
+
+def extract_archive(archive_path, destination):
+    """
+    Extract the data files of a zip or tar archive
+
+    Members are written under their base names (numbered, so files with the
+    same name in different folders stay apart); folders, links and files in
+    no upload format are skipped.
+
+    Args:
+        archive_path: Path of the archive
+        destination: Directory the files are written to
+
+    Returns:
+        list: Paths of the extracted files, in archive order
+
+    Raises:
+        ValueError: If the archive has no data files or they exceed
+            BATCH_INGEST['MAX_ARCHIVE_MB'] uncompressed
+    """
+    archive, members = _archive_members(archive_path)
+    with archive:
+        if not members:
+            raise ValueError('Archive contains no CSV, Parquet, Feather or Arrow IPC files')
+        total_mb = sum(size for _, size, _ in members) / (1024 * 1024)
+        if total_mb > BATCH_INGEST['MAX_ARCHIVE_MB']:
+            raise ValueError(f"Archive files total {total_mb:.0f}MB uncompressed, "
+                             f"above the limit of {BATCH_INGEST['MAX_ARCHIVE_MB']}MB")
+        os.makedirs(destination, exist_ok=True)
+        paths = []
+        for index, (name, _, open_member) in enumerate(members):
+            path = os.path.join(destination, f"{index:04d}_{os.path.basename(name)}")
+            with open_member() as source, open(path, 'wb') as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            paths.append(path)
+    return paths
+
+
+def settled_files(directory, settle_seconds=None):
+    """
+    Return the data files directly in a directory that are no longer being written
+
+    Args:
+        directory: Watched directory
+        settle_seconds: Seconds a file must be unmodified
+            (defaults to BATCH_INGEST['SETTLE_SECONDS'])
+
+    Returns:
+        list: Paths sorted by name
+    """
+    if settle_seconds is None:
+        settle_seconds = BATCH_INGEST['SETTLE_SECONDS']
+    cutoff = time.time() - settle_seconds
+    paths = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and _is_data_file(entry.name) and entry.stat().st_mtime <= cutoff:
+            paths.append(entry.path)
+    return sorted(paths)
+
+
+def create_batch_upload(file_name, uploaded_by=None, upload_id=None, **fields):
+    """
+    Create the parent upload record of a batch in both databases
+
+    Args:
+        file_name: Archive or directory name shown for the batch
+        uploaded_by: User (or client address) the batch is scheduled for
+        upload_id: ID to create the record with (generated if None)
+        **fields: Other fields of the record (content_hash, file_size, ...)
+
+    Returns:
+        ObjectId: ID of the parent record
+    """
+    from core.models import RawDataUpload
+
+    upload_id = upload_id or ObjectId()
+    RawDataUpload.save_to_all({'id': upload_id, 'file_name': file_name, 'status': 'pending',
+                               'uploaded_by': uploaded_by, **fields})
+    return upload_id
+
+
+def _set_upload(dbs, upload_id, update):
+    for db in dbs.values():
+        db.raw_data_uploads.update_one({'_id': upload_id}, update)
+
+
+def _cancel_request(dbs, upload_id):
+    upload = dbs['low_review_score_db'].raw_data_uploads.find_one({'_id': upload_id}, {'cancel_requested': 1}) or {}
+    return upload.get('cancel_requested')
+
+
+def _ingest_file(dbs, child_id, path, registry, uploaded_by, admission_timeout):
+    """
+    Ingest one file of a batch into its child upload record
+
+    Returns:
+        tuple: (child status, statistics or None, the file's processor or None,
+        error message or None)
+    """
+    processor = None
+    try:
+        with admitted(child_id, uploaded_by, BULK_PROCESSING['MAX_THREADS'],
+                      estimate_rows(os.path.getsize(path)), timeout=admission_timeout, dbs=dbs) as write_slots:
+            _set_upload(dbs, child_id, {'$set': {'status': 'processing', 'source_file_path': path}})
+            processor = BulkDataProcessor(chunk_size=BULK_PROCESSING['CHUNK_SIZE'], max_threads=write_slots)
+            processor.dimension_registry = registry
+            processor.defer_analytics = True
+            result = processor.process_file(path, child_id, detect_file_format(path) or 'csv',
+                                            compression=detect_compression(path))
+    except UploadCancelled:
+        finish_cancellation(dbs, child_id)
+        return 'cancelled', None, processor, None
+    except Exception as e:
+        error = f"Not admitted: {str(e)}" if isinstance(e, AdmissionTimeout) else str(e)
+        logger.error(f"Error ingesting {path} of a batch upload: {error}")
+        _set_upload(dbs, child_id, {'$set': {'status': 'failed', 'error_message': error,
+                                             'source_file_path': path}})
+        return 'failed', None, processor, error
+    return 'completed', result, processor, None
+
+
+def ingest_batch(parent_id, paths, uploaded_by=None, max_parallel=None, admission_timeout=None):
+    """
+    Ingest several files as the children of one parent upload
+
+    Args:
+        parent_id: ID of the parent record (see create_batch_upload)
+        paths: Files to ingest; their names become the child records' file names
+        uploaded_by: User (or client address) the files are scheduled for
+        max_parallel: Files ingested at the same time
+            (defaults to BATCH_INGEST['MAX_PARALLEL_FILES'])
+        admission_timeout: Seconds each file may wait for write capacity,
+            or None to wait indefinitely
+
+    Returns:
+        dict: Summed statistics of the files, with a 'files' list of
+        {'upload_id', 'file_name', 'path', 'status', 'error'} per file
+    """
+    from core.models import RawDataUpload
+
+    parent_id = ObjectId(parent_id) if isinstance(parent_id, str) else parent_id
+    dbs = {alias: get_db(alias) for alias in DATABASES}
+    start_time = datetime.now()
+    _set_upload(dbs, parent_id, {'$set': {'status': 'processing', 'batch_files': len(paths),
+                                          **{field: 0 for field in _SUMMED_COUNTS}}})
+
+    files = []
+    for path in paths:
+        child_id = ObjectId()
+        file_name = os.path.basename(path)
+        RawDataUpload.save_to_all({'id': child_id, 'file_name': file_name, 'status': 'pending',
+                                   'parent_upload': parent_id, 'file_size': os.path.getsize(path),
+                                   'source_file_path': path, 'uploaded_by': uploaded_by})
+        files.append({'upload_id': str(child_id), 'file_name': file_name, 'path': path})
+    # A cancellation requested before the files were listed applies to them too
+    cancel_requested = _cancel_request(dbs, parent_id)
+    if cancel_requested:
+        request_cancellation(dbs, parent_id, cancel_requested.get('rollback'))
+
+    # Shared so a customer or product in several files is written once
+    registry = DimensionRegistry(dbs['low_review_score_db']) if DIMENSION_CACHE.get('ENABLED') else None
+    stats = {field: 0 for field in _SUMMED_COUNTS}
+    period_types = set()
+    customers = set()
+    months_before = []
+
+    def run(file_info):
+        file_status, result, processor, error = _ingest_file(
+            dbs, ObjectId(file_info['upload_id']), file_info['path'], registry, uploaded_by, admission_timeout
+        )
+        if result is not None:
+            # The parent shows the files' progress as each one completes
+            _set_upload(dbs, parent_id, {'$inc': {field: result.get(field, 0) for field in _SUMMED_COUNTS}})
+        return file_info, file_status, result, processor, error
+
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel or BATCH_INGEST['MAX_PARALLEL_FILES']),
+                            thread_name_prefix='batch-ingest') as executor:
+        for file_info, file_status, result, processor, error in executor.map(run, files):
+            file_info['status'] = file_status
+            file_info['error'] = error
+            if processor is not None:
+                # Totals of a failed file's committed chunks were incremented too
+                period_types.update(processor.analytics_period_types)
+                customers.update(processor.analytics_customers)
+                if processor.analytics_months is not None:
+                    months_before.append(processor.analytics_months)
+            if result is None:
+                continue
+            for field in _SUMMED_COUNTS:
+                stats[field] += result.get(field, 0)
+
+    # Post-upload analytics, once for the whole batch
+    processor = BulkDataProcessor(chunk_size=BULK_PROCESSING['CHUNK_SIZE'], max_threads=BULK_PROCESSING['MAX_THREADS'])
+    processor.analytics_period_types = period_types
+    processor.analytics_customers = customers
+    # The span only grows while files load, so the first file saw it before the batch
+    processor.analytics_months = min(months_before, default=None)
+    try:
+        processor._run_analytics(None, parent_id)
+        from post_upload_hooks import post_csv_upload_hook
+        post_csv_upload_hook()
+    except Exception as e:
+        logger.error(f"Error processing analytics for batch upload {parent_id}: {str(e)}")
+
+    failed = [file_info for file_info in files if file_info['status'] == 'failed']
+    cancelled = [file_info for file_info in files if file_info['status'] == 'cancelled']
+    stats.update({
+        'files': files,
+        'completed_files': len(files) - len(failed) - len(cancelled),
+        'failed_files': len(failed),
+        'cancelled_files': len(cancelled),
+        'processing_time': (datetime.now() - start_time).total_seconds()
+    })
+    if registry is not None:
+        stats.update(registry.summary())
+    update_data = {'status': 'completed', 'processing_time': stats['processing_time']}
+    if failed:
+        update_data = {
+            'status': 'failed',
+            'processing_time': stats['processing_time'],
+            'error_message': f"{len(failed)} of {len(files)} files failed; first: "
+                             f"{failed[0]['file_name']}: {failed[0]['error']}"
+        }
+    elif cancelled:
+        update_data = {
+            'status': 'failed',
+            'processing_time': stats['processing_time'],
+            'error_message': f"{len(cancelled)} of {len(files)} files were cancelled"
+        }
+    _set_upload(dbs, parent_id, {'$set': update_data})
+    if _cancel_request(dbs, parent_id):
+        # The files rolled themselves back if that was requested
+        finish_cancellation(dbs, parent_id)
+    logger.info(f"Batch upload {parent_id}: {stats['completed_files']} of {len(files)} files completed, "
+                f"{stats['processed_records']} records in {stats['processing_time']:.2f} seconds")
+    return stats
+
+
+def _remove_completed(dbs, files):
+    """Delete the files of completed children and clear their source_file_path"""
+    for file_info in files:
+        if file_info['status'] != 'completed':
+            continue
+        if os.path.exists(file_info['path']):
+            os.remove(file_info['path'])
+        _set_upload(dbs, ObjectId(file_info['upload_id']), {'$set': {'source_file_path': None}})
+
+
+def ingest_archive(parent_id, archive_path, uploaded_by=None, max_parallel=None, admission_timeout=None):
+    """
+    Extract a zip or tar archive and ingest its files as one batch
+
+    Extracted files are removed once their child upload completes; failed
+    ones are kept so they can be resumed. The archive itself is left in place.
+
+    Returns:
+        dict: Statistics from ingest_batch
+    """
+    parent_id = ObjectId(parent_id) if isinstance(parent_id, str) else parent_id
+    dbs = {alias: get_db(alias) for alias in DATABASES}
+    destination = os.path.join(tempfile.gettempdir(), 'dash_analytics_batches', str(parent_id))
+    try:
+        paths = extract_archive(archive_path, destination)
+    except Exception as e:
+        logger.error(f"Error extracting {archive_path}: {str(e)}")
+        _set_upload(dbs, parent_id, {'$set': {'status': 'failed', 'error_message': str(e)}})
+        shutil.rmtree(destination, ignore_errors=True)
+        raise
+
+    stats = ingest_batch(parent_id, paths, uploaded_by, max_parallel, admission_timeout)
+    _remove_completed(dbs, stats['files'])
+    if not any(os.path.exists(file_info['path']) for file_info in stats['files']):
+        shutil.rmtree(destination, ignore_errors=True)
+    return stats
+
+
+def ingest_directory(directory, uploaded_by=None, max_parallel=None, settle_seconds=None):
+    """
+    Ingest the settled files of a watched directory as one batch
+
+    The files are first moved to ``ingesting/<parent id>/`` in the directory,
+    so a concurrent scan does not pick them up again, and to
+    ``processed/<parent id>/`` once their child upload completes. Failed
+    files stay under ``ingesting/`` for resuming.
+
+    Returns:
+        dict: Statistics from ingest_batch, or None if no file was ready
+    """
+    paths = settled_files(directory, settle_seconds)
+    if not paths:
+        return None
+    parent_id = ObjectId()
+    claimed_dir = os.path.join(directory, INGESTING_DIR, str(parent_id))
+    os.makedirs(claimed_dir, exist_ok=True)
+    claimed = []
+    for path in paths:
+        target = os.path.join(claimed_dir, os.path.basename(path))
+        try:
+            os.rename(path, target)
+        except FileNotFoundError:
+            # Claimed by another scan in the meantime
+            continue
+        claimed.append(target)
+    if not claimed:
+        shutil.rmtree(claimed_dir, ignore_errors=True)
+        return None
+    create_batch_upload(os.path.basename(os.path.normpath(directory)), uploaded_by, upload_id=parent_id,
+                        file_size=sum(os.path.getsize(path) for path in claimed))
+
+    stats = ingest_batch(parent_id, claimed, uploaded_by, max_parallel)
+    dbs = {alias: get_db(alias) for alias in DATABASES}
+    processed_dir = os.path.join(directory, PROCESSED_DIR, str(parent_id))
+    for file_info in stats['files']:
+        if file_info['status'] != 'completed':
+            continue
+        os.makedirs(processed_dir, exist_ok=True)
+        os.rename(file_info['path'], os.path.join(processed_dir, os.path.basename(file_info['path'])))
+        _set_upload(dbs, ObjectId(file_info['upload_id']), {'$set': {'source_file_path': None}})
+    if not any(os.path.exists(file_info['path']) for file_info in stats['files']):
+        shutil.rmtree(claimed_dir, ignore_errors=True)
+    stats['upload_id'] = str(parent_id)
+    return stats
@@ -0,0 +1,242 @@
+"""
+Bulk-Load Mode for Large Initial Loads
+
+Every row written to orders, sales and the review collections also updates
+each secondary index of that collection. For very large loads it is cheaper
+to drop the non-unique secondary indexes, ingest, and rebuild them in one
+pass per collection afterwards. Unique indexes (and ``_id``) are kept, since
+upserts rely on them to find existing documents, and so are the upload tag
+indexes, which a rollback or cancellation of an upload still in progress
+finds its rows with.
+
+The dropped index definitions are recorded on the upload record before
+anything is dropped, so an interrupted load can still be rebuilt, e.g. by
+``rebuild_deferred_indexes`` from db_maintenance.py.
+
+Only one upload defers indexes at a time. It claims a single lock document
+in ``bulk_load_locks`` by inserting it under a fixed ``_id``, which the
+unique ``_id`` index makes atomic across processes, and releases it once
+the indexes are rebuilt.
+"""
+
+import logging
+import time
+from bson import ObjectId
+from pymongo import IndexModel
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from core.csv_processing_config import BULK_LOAD
+from core.upload_rollback import UPLOAD_INDEX_NAME, UPLOAD_OWNERS_INDEX_NAME
+
+logger = logging.getLogger(__name__)
+
+# Index options reported by index_information() that are not passed back to create_index
+_SERVER_OPTIONS = ('key', 'v', 'ns', 'background')
+
+# Indexes never deferred (see core.upload_rollback)
+_KEPT_INDEXES = ('_id_', UPLOAD_INDEX_NAME, UPLOAD_OWNERS_INDEX_NAME)
+
+# index_maintenance states in which indexes may be missing
+PENDING_STATES = ('deferring', 'deferred', 'rebuilding')
+
+LOCK_COLLECTION = 'bulk_load_locks'
+
+# Lock document claimed by the upload whose indexes are deferred
+_LOCK_ID = 'deferred_indexes'
+
+# Seconds after which a claim whose upload recorded no deferral is taken over
+_STALE_CLAIM_SECONDS = 300
+
+
+def should_bulk_load(file_size):
+    """Return whether an upload of ``file_size`` bytes should be ingested in bulk-load mode"""
+    return BULK_LOAD['ENABLED'] and file_size >= BULK_LOAD['MIN_FILE_MB'] * 1024 * 1024
+
+
+class DeferredIndexes:
+    """
+    Drops the non-unique secondary indexes of the bulk-loaded collections and rebuilds them
+
+    Progress is kept in the upload record's ``index_maintenance`` field:
+    state ('deferring', 'deferred', 'rebuilding', 'rebuilt' or 'failed'),
+    the dropped indexes, and how many collections have been rebuilt.
+    """
+    def __init__(self, dbs, upload_id, collections=None):
+        """
+        Args:
+            dbs: Dict of database alias to database
+            upload_id: ID of the upload record tracking the load
+            collections: Collections to defer indexes on (defaults to BULK_LOAD['COLLECTIONS'])
+        """
+        self.dbs = dbs
+        self.upload_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+        self.collections = collections or BULK_LOAD['COLLECTIONS']
+        self.indexes = []
+
+    @classmethod
+    def from_upload(cls, dbs, upload_id):
+        """Return the deferral recorded on an upload record, to rebuild indexes it left dropped"""
+        deferred = cls(dbs, upload_id)
+        upload = next(iter(dbs.values())).raw_data_uploads.find_one(
+            {'_id': deferred.upload_id}, {'index_maintenance': 1}
+        ) or {}
+        maintenance = upload.get('index_maintenance') or {}
+        if maintenance.get('state') in PENDING_STATES:
+            deferred.indexes = maintenance.get('indexes', [])
+        return deferred
+
+    def _record(self, update_data):
+        update = {'$set': {f'index_maintenance.{field}': value for field, value in update_data.items()}}
+        for db in self.dbs.values():
+            db.raw_data_uploads.update_one({'_id': self.upload_id}, update)
+
+    def _claim(self):
+        """
+        Claim the deferral lock, returning whether this upload holds it
+
+        A resumed load already holds its claim. A claim left by an upload that
+        died before recording any deferral is taken over once it is stale,
+        conditional on the holder so only one process takes it.
+        """
+        any_db = next(iter(self.dbs.values()))
+        locks = any_db[LOCK_COLLECTION]
+        claim = {'upload_id': self.upload_id, 'claimed_at': time.time()}
+        try:
+            locks.insert_one({'_id': _LOCK_ID, **claim})
+            return True
+        except DuplicateKeyError:
+            pass
+
+        holder = locks.find_one({'_id': _LOCK_ID})
+        if holder is None:
+            # Released in the meantime; one more attempt, whoever wins keeps it
+            try:
+                locks.insert_one({'_id': _LOCK_ID, **claim})
+                return True
+            except DuplicateKeyError:
+                return False
+        if holder['upload_id'] == self.upload_id:
+            return True
+        if holder['claimed_at'] > time.time() - _STALE_CLAIM_SECONDS or any_db.raw_data_uploads.find_one(
+            {'_id': holder['upload_id'], 'index_maintenance.state': {'$in': list(PENDING_STATES)}}, {'_id': 1}
+        ):
+            return False
+        taken = locks.find_one_and_update({'_id': _LOCK_ID, 'upload_id': holder['upload_id']}, {'$set': claim})
+        if taken:
+            logger.warning(f"Took over the stale index deferral claim of upload {holder['upload_id']}")
+        return bool(taken)
+
+    def _release(self):
+        next(iter(self.dbs.values()))[LOCK_COLLECTION].delete_one({'_id': _LOCK_ID, 'upload_id': self.upload_id})
+
+    def defer(self):
+        """
+        Drop the non-unique secondary indexes of the target collections, except the upload tag indexes
+
+        Only the upload that claims the deferral lock drops anything; the others
+        load with the indexes as they are, since the holder rebuilds them when it
+        finishes.
+
+        Returns:
+            int: Number of indexes dropped
+        """
+        if not self._claim():
+            logger.info("Indexes are already deferred by another upload, loading with them as they are")
+            return 0
+
+        # A resumed load keeps the indexes its earlier attempt already dropped
+        recorded = self.from_upload(self.dbs, self.upload_id).indexes
+        recorded_names = {(index['db'], index['collection'], index['name']) for index in recorded}
+        dropping = []
+        for alias, db in self.dbs.items():
+            for collection_name in self.collections:
+                for name, info in db[collection_name].index_information().items():
+                    if name in _KEPT_INDEXES or info.get('unique') or (alias, collection_name, name) in recorded_names:
+                        continue
+                    dropping.append({
+                        'db': alias,
+                        'collection': collection_name,
+                        'name': name,
+                        'key': [list(field) for field in info['key']],
+                        'options': {option: value for option, value in info.items() if option not in _SERVER_OPTIONS}
+                    })
+        self.indexes = recorded + dropping
+        if not self.indexes:
+            self._release()
+            return 0
+
+        # Recorded first so an interrupted load can still restore them
+        self._record({'state': 'deferring', 'indexes': self.indexes,
+                      'collections_rebuilt': 0, 'collections_total': 0})
+        for index in self.indexes:
+            try:
+                self.dbs[index['db']][index['collection']].drop_index(index['name'])
+            except OperationFailure:
+                # Already dropped by an earlier attempt of this load
+                pass
+        self._record({'state': 'deferred'})
+        logger.info(f"Dropped {len(dropping)} secondary indexes for bulk load of upload {self.upload_id}")
+        return len(dropping)
+
+    def rebuild(self):
+        """
+        Recreate the dropped indexes, building all of a collection's indexes in one pass
+
+        Returns:
+            bool: Whether every index was rebuilt
+        """
+        if not self.indexes:
+            return True
+        by_collection = {}
+        for index in self.indexes:
+            by_collection.setdefault((index['db'], index['collection']), []).append(index)
+
+        started = time.perf_counter()
+        self._record({'state': 'rebuilding', 'collections_rebuilt': 0, 'collections_total': len(by_collection)})
+        failed = False
+        for rebuilt, ((alias, collection_name), indexes) in enumerate(by_collection.items(), start=1):
+            models = [
+                IndexModel([tuple(field) for field in index['key']], name=index['name'], **index['options'])
+                for index in indexes
+            ]
+            try:
+                self.dbs[alias][collection_name].create_indexes(models)
+            except Exception as e:
+                logger.error(f"Error rebuilding indexes on {collection_name} in {alias}: {str(e)}")
+                failed = True
+            self._record({'collections_rebuilt': rebuilt})
+
+        elapsed = time.perf_counter() - started
+        self._record({'state': 'failed' if failed else 'rebuilt', 'rebuild_seconds': round(elapsed, 2)})
+        self._release()
+        logger.info(f"Rebuilt {len(self.indexes)} secondary indexes in {elapsed:.2f}s")
+        return not failed
+
+    def __enter__(self):
+        self.defer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Rebuilt on failure too, so queries do not run unindexed until a resume
+        self.rebuild()
+        return False
+
+
+def rebuild_deferred_indexes(dbs):
+    """
+    Rebuild indexes left dropped by bulk loads that were interrupted
+
+    Uploads still processing are skipped; they rebuild their own indexes.
+
+    Returns:
+        int: Number of uploads whose indexes were rebuilt
+    """
+    any_db = next(iter(dbs.values()))
+    interrupted = any_db.raw_data_uploads.find(
+        {'index_maintenance.state': {'$in': list(PENDING_STATES)}, 'status': {'$ne': 'processing'}},
+        {'_id': 1}
+    )
+    count = 0
+    for upload in interrupted:
+        if DeferredIndexes.from_upload(dbs, upload['_id']).rebuild():
+            count += 1
+    return count
@@ -3,40 +3,228 @@ Bulk Data Processing Module for DashAnalytics
 
 Provides high-performance data processing functionality for CSV uploads:
 1. Bulk inserts instead of individual .save() operations
-2. Threading for parallel data processing
+2. Staged pipeline: process-pool transform feeding MongoDB writer threads
 3. Chunk processing for large files
-4. Optimized database connections
+4. Optimized database connections, with replicated writes sent to both
+   review-score databases concurrently
+5. Columnar (vectorized) transform of each chunk into collection documents
 """
 
+import gc
+import hashlib
 import logging
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
 import pandas as pd
 import threading
 import queue
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from mongoengine import get_db
 from pymongo import UpdateOne, InsertOne
 from pymongo.errors import BulkWriteError
 from django.conf import settings
 from bson import ObjectId
+from core.adaptive_batching import AdaptiveBatchSizer
+from core.analytics_rebuild import rebuild_analytics
+from core.csv_processing_config import BULK_PROCESSING, DIMENSION_CACHE, SCHEMA_VALIDATION, STAGED_MERGE, UPLOAD_PROGRESS
+from core.dimension_cache import DimensionRegistry
+from core.incremental_analytics import (
+    TREND_PERIODS, AnalyticsPartials, customer_segment_updates, ensure_analytics_indexes, stored_months_spanned,
+    trend_ratio_updates
+)
+from core.ingest_strategies import resolve_strategies, row_transform
+from core.parsed_spool import (ParsedChunk, ParsedSpoolWriter, is_parsed_spool, iter_parsed_spool,
+                               parsed_spool_file, spooling_enabled)
+from core.schema_validation import RejectedRowSpool, get_retail_schema, rejected_rows_path
+from core.staged_merge import MERGE_KEYS, STAGED_SEQUENCE, StagingArea
+from core.upload_cancellation import CancellationCheck, UploadCancelled
+from core.upload_rollback import TAGGED_COLLECTIONS, UPLOAD_OWNERS, UPLOAD_TAG, owned_upsert, with_owners
+from core.upload_formats import COLUMNAR_FORMATS, iter_columnar_chunks
+from core.upload_progress import upload_progress
 
 logger = logging.getLogger(__name__)
 
+
+def get_rss_mb():
+    """
+    Return the resident set size of the current process in MB
+    
+    Reads /proc on Linux; elsewhere falls back to the peak RSS reported by
+    the resource module, and to 0 where neither is available.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        return 0.0
+
+
+def chunk_checksum(chunk_df):
+    """Return a stable, order-sensitive checksum of a chunk's contents"""
+    row_hashes = pd.util.hash_pandas_object(chunk_df, index=False).to_numpy()
+    return hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+
+
+# Collection holding one 64-bit content hash (as _id) per ingested row
+ROW_HASH_COLLECTION = 'ingested_row_hashes'
+
+
+def row_hashes(chunk_df):
+    """
+    Return a 64-bit content hash per row as an int64 array
+    
+    Values are hashed as text with columns in name order, so the same row
+    hashes identically whatever the column order of the file it came from.
+    """
+    columns = sorted(chunk_df.columns)
+    hashes = pd.util.hash_pandas_object(chunk_df[columns].astype(str), index=False)
+    return hashes.to_numpy().view('int64')
+
+
+def order_ids(chunk_df, order_dates=None):
+    """Return the ``ORD-`` id of each row, built from the raw column text so it matches stored orders"""
+    if order_dates is None:
+        order_dates = pd.to_datetime(chunk_df['order_date'])
+    return ('ORD-' + chunk_df['customer_id'].astype(str) + '-' + chunk_df['product_id'].astype(str) + '-'
+            + order_dates.dt.strftime('%Y%m%d%H%M%S'))
+
+
+# Shared pool that fans replicated writes out to both review-score databases
+_replica_executor = None
+_replica_executor_lock = threading.Lock()
+
+
+def get_replica_executor():
+    """Return the shared thread pool used for concurrent replicated writes"""
+    global _replica_executor
+    with _replica_executor_lock:
+        if _replica_executor is None:
+            _replica_executor = ThreadPoolExecutor(
+                max_workers=BULK_PROCESSING.get('REPLICA_WRITE_THREADS', 8),
+                thread_name_prefix='replica-write'
+            )
+    return _replica_executor
+
+
+def _counted_write(write, collection, batch):
+    """
+    Run a bulk write of one batch against one collection and count its outcome
+    
+    Partial failures (BulkWriteError) are logged and counted; any other
+    exception propagates to the caller.
+    """
+    try:
+        write(collection, batch)
+        return {'succeeded': len(batch), 'failed': 0}
+    except BulkWriteError as bwe:
+        failed = len(bwe.details.get('writeErrors', []))
+        logger.warning(f"Bulk write error for {collection.name}: {bwe.details}")
+        return {'succeeded': len(batch) - failed, 'failed': failed}
+
+
+def merge_write_counts(target, counts):
+    """Add per-database write counts from ``counts`` into ``target`` in place"""
+    for alias, db_counts in (counts or {}).items():
+        totals = target.setdefault(alias, {'succeeded': 0, 'failed': 0})
+        totals['succeeded'] += db_counts['succeeded']
+        totals['failed'] += db_counts['failed']
+    return target
+
+
 class BulkDataProcessor:
     """
     Handles bulk data processing and insertion for CSV uploads
     """
-    def __init__(self, chunk_size=1000, max_threads=4):
+    # Columns retained from each chunk for post-upload analytics
+    analytics_columns = ['customer_id', 'order_date', 'quantity', 'price']
+    # Whether _run_analytics reads the whole upload's rows from analytics_df;
+    # the incremental analytics do not, so the rows are only kept for
+    # subclasses that do, which bounds memory by the chunks in flight
+    keeps_analytics_frame = False
+    # Sales fields the incremental trend and customer behavior totals are built from
+    _SALES_COLUMNS = ['id', 'customer_id', 'sale_date', 'quantity', 'revenue']
+    # Totals are upserted on 'id', which ensure_analytics_indexes makes unique;
+    # uploads running side by side in one process (such as the files of a
+    # batch) also take turns, so a new period or customer is inserted once
+    # even where that index could not be built
+    _analytics_lock = threading.Lock()
+    # Databases (client, name) whose analytics indexes this process has checked
+    _analytics_indexed = set()
+    # Sales are read and upserted under this lock while their analytics deltas are
+    # taken, so two chunks holding the same order cannot both count it as new
+    _sales_lock = threading.Lock()
+    
+    def __init__(self, chunk_size=1000, max_threads=4, transform_processes=None, queue_depth=None,
+                 dedupe_rows=None, validate_rows=None, transform_strategy=None, write_strategy=None,
+                 analytics_strategy=None):
         """
         Initialize the processor
         
         Args:
             chunk_size: Number of records to process in a single batch
-            max_threads: Maximum number of worker threads for parallel processing
+            max_threads: Number of writer threads draining batches into MongoDB
+            transform_processes: Worker processes for the transform stage, 0 to
+                transform inline (defaults to BULK_PROCESSING['TRANSFORM_PROCESSES'])
+            queue_depth: Maximum transformed batches waiting for a writer
+                (defaults to BULK_PROCESSING['WRITE_QUEUE_DEPTH'])
+            dedupe_rows: Skip rows ingested by earlier uploads
+                (defaults to BULK_PROCESSING['ROW_DEDUP'])
+            validate_rows: Coerce rows against the retail CSV schema and
+                divert invalid ones to a rejected-rows file
+                (defaults to SCHEMA_VALIDATION['ENABLED'])
+            transform_strategy: 'columnar' or 'rows'
+            write_strategy: 'upsert', 'idempotent' or 'staged_merge'
+            analytics_strategy: 'incremental', 'rebuild' or 'none'
+                (strategies default to INGEST_ENGINE, see core/ingest_strategies.py)
         """
         self.chunk_size = chunk_size
         self.max_threads = max_threads
+        if transform_processes is None:
+            transform_processes = BULK_PROCESSING.get('TRANSFORM_PROCESSES', 0)
+        if queue_depth is None:
+            queue_depth = BULK_PROCESSING.get('WRITE_QUEUE_DEPTH', max_threads * 2)
+        self.transform_processes = transform_processes
+        self.queue_depth = queue_depth
+        if dedupe_rows is None:
+            dedupe_rows = BULK_PROCESSING.get('ROW_DEDUP', False)
+        self.dedupe_rows = dedupe_rows
+        if validate_rows is None:
+            validate_rows = SCHEMA_VALIDATION.get('ENABLED', False)
+        self.validate_rows = validate_rows
+        self.transform_strategy, self.write_strategy, self.analytics_strategy = resolve_strategies(
+            transform_strategy, write_strategy, analytics_strategy
+        )
+        self.transform = row_transform if self.transform_strategy == 'rows' else transform_chunk
+        self._staging = None
         self.results_queue = queue.Queue()
+        self.batch_sizer = AdaptiveBatchSizer()
+        self._pending_progress = {}
+        self._progress_flushed_at = 0.0
+        self.analytics_df = None
+        self.analytics_period_types = set()
+        # Behavior IDs of the customers whose totals the upload changed (None for all),
+        # and the months spanned by the stored sales before it changed any
+        self.analytics_customers = set()
+        self.analytics_months = None
+        # Set by callers ingesting several files as one upload (see core/batch_ingest.py):
+        # a DimensionRegistry shared with the other files, and whether _finalize
+        # leaves the analytics refresh to the caller
+        self.dimension_registry = None
+        self.defer_analytics = False
         self.low_db = get_db('low_review_score_db')
         self.high_db = get_db('high_review_score_db')
     
@@ -51,226 +239,1094 @@ class BulkDataProcessor:
         Returns:
             dict: Processing statistics and status
         """
+        start_time = datetime.now()
         total_records = len(df)
+        
+        # Update upload record with total records
+        self._update_upload_status(upload_id, {'total_records': total_records, 'chunk_size': self.chunk_size})
+        
+        # Slice lazily so only the chunks currently in flight are materialized
+        chunk_dfs = (df[i:i+self.chunk_size] for i in range(0, total_records, self.chunk_size))
+        logger.info(f"Processing {total_records} records in chunks of size {self.chunk_size}")
+        
+        stats = self._process_chunks(chunk_dfs, upload_id, total_records=total_records)
+        return self._finalize(stats, upload_id, start_time)
+    
+    def process_file(self, source, upload_id, file_format='csv', resume=False, compression=None):
+        """
+        Process an uploaded file of any supported format
+        
+        Args:
+            source: Path or file-like object
+            upload_id: ID of the upload record
+            file_format: Format from core.upload_formats.detect_file_format
+            resume: Skip chunks already committed by a previous attempt
+            compression: Codec of a compressed CSV, from detect_compression
+            
+        Returns:
+            dict: Processing statistics and status
+        """
+        if is_parsed_spool(source):
+            return self.process_parsed_spool(source, upload_id, resume=resume)
+        if file_format in COLUMNAR_FORMATS:
+            return self.process_columnar_file(source, upload_id, file_format, resume=resume)
+        if compression:
+            # pandas only decompresses handles it recognises as binary, so
+            # unwrap Django uploads to their underlying file object
+            source = getattr(source, 'file', source)
+            # Decompressed incrementally by the chunked reader
+            return self.process_csv_stream(source, upload_id, resume=resume, compression=compression)
+        return self.process_csv_stream(source, upload_id, resume=resume)
+    
+    def process_csv_stream(self, source, upload_id, resume=False, **read_csv_kwargs):
+        """
+        Stream a CSV file through the bulk writers without loading it whole
+        
+        The file is parsed with a chunked reader and each chunk is handed to
+        the writer pool as soon as it is parsed.
+        
+        Every fully written chunk is recorded as a checkpoint on the upload
+        record. With ``resume=True`` chunks whose offset and checksum match a
+        checkpoint are skipped, so a failed upload continues where it stopped.
+        
+        Args:
+            source: Path or file-like object containing CSV data
+            upload_id: ID of the upload record
+            resume: Skip chunks already committed by a previous attempt
+            **read_csv_kwargs: Extra arguments passed to ``pd.read_csv``
+            
+        Returns:
+            dict: Processing statistics and status
+        """
+        def chunk_dfs():
+            reader = pd.read_csv(source, chunksize=self.chunk_size, **read_csv_kwargs)
+            with reader:
+                yield from reader
+        
+        logger.info(f"Streaming CSV in chunks of size {self.chunk_size}")
+        return self._process_stream(chunk_dfs, upload_id, resume)
+    
+    def process_columnar_file(self, source, upload_id, file_format, resume=False):
+        """
+        Process a Parquet, Feather or Arrow IPC file through the bulk writers
+        
+        The file is memory-mapped where possible and converted to pandas one
+        chunk at a time, skipping CSV text parsing entirely. Checkpointing
+        and resuming work as for process_csv_stream.
+        
+        Args:
+            source: Path or file-like object
+            upload_id: ID of the upload record
+            file_format: 'parquet', 'feather', 'arrow' or 'arrow_stream'
+            resume: Skip chunks already committed by a previous attempt
+            
+        Returns:
+            dict: Processing statistics and status
+        """
+        def chunk_dfs():
+            return iter_columnar_chunks(source, file_format, self.chunk_size)
+        
+        logger.info(f"Reading {file_format} file in chunks of size {self.chunk_size}")
+        return self._process_stream(chunk_dfs, upload_id, resume)
+    
+    def process_parsed_spool(self, path, upload_id, resume=False):
+        """
+        Replay the parsed spool of an earlier attempt at an upload
+        
+        Chunks come back exactly as that attempt parsed and validated them,
+        so nothing is parsed or validated again and its checkpoints match.
+        Rows it rejected are not replayed; its rejected-rows file is kept.
+        
+        Args:
+            path: Path of the spool (see core/parsed_spool.py)
+            upload_id: ID of the upload record
+            resume: Skip chunks already committed by a previous attempt
+            
+        Returns:
+            dict: Processing statistics and status
+        """
+        logger.info(f"Replaying parsed spool {path}")
+        return self._process_stream(lambda: iter_parsed_spool(path), upload_id, resume)
+    
+    def recompute_analytics(self, upload_id):
+        """
+        Refresh the post-upload analytics of an upload from its parsed spool
+        
+        Only the analytics columns are read from the spool. Stored totals are
+        not incremented again; growth rates, shares and segments are
+        refreshed as at the end of an upload.
+        
+        Returns:
+            pandas.DataFrame: The upload's analytics columns, also left in ``self.analytics_df``
+        """
+        object_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+        upload = self.low_db.raw_data_uploads.find_one({'_id': object_id}, {'parsed_spool': 1}) or {}
+        path = parsed_spool_file(upload.get('parsed_spool'))
+        if path is None:
+            raise FileNotFoundError(f"No parsed spool retained for upload {upload_id}")
+        
+        parts = [self._analytics_slice(chunk.frame)
+                 for chunk in iter_parsed_spool(path, columns=self.analytics_columns)]
+        if parts:
+            self.analytics_df = pd.concat(parts, ignore_index=True)
+        else:
+            self.analytics_df = pd.DataFrame(columns=self.analytics_columns)
+        self.analytics_period_types = set(TREND_PERIODS) if len(self.analytics_df) else set()
+        self.analytics_customers = None
+        self._run_analytics(self.analytics_df, upload_id)
+        return self.analytics_df
+    
+    def write_micro_batch(self, valid_df, batch_index, refresh_analytics=False):
+        """
+        Write one micro-batch of already validated rows that belong to no upload
+        
+        Used for streamed events (see core/event_ingest.py). The rows go
+        through the same row dedup, transform, upserts, sharded review inserts
+        and incremental analytics as a chunk of an upload, without an upload
+        record, checkpoints or progress reporting.
+        
+        Args:
+            valid_df: Rows coerced by the retail schema
+            batch_index: Sequence number of the batch, for logging
+            refresh_analytics: Also refresh growth rates, shares and segments
+                for the period types written since the last refresh
+            
+        Returns:
+            dict: Statistics of the batch
+        """
         stats = {
-            'total_records': total_records,
             'processed_records': 0,
             'failed_records': 0,
+            'duplicate_records': 0,
             'high_reviews_count': 0,
             'low_reviews_count': 0,
-            'processing_time': 0
+            'database_writes': {}
         }
+        valid_df = valid_df.reset_index(drop=True)
+        hashes = None
+        if self.dedupe_rows:
+            kept_df, hashes, _ = self._drop_seen_rows(valid_df)
+            stats['duplicate_records'] = len(valid_df) - len(kept_df)
+            valid_df = kept_df
+        
+        if not valid_df.empty:
+            result = self._write_chunk(self.transform(valid_df), batch_index, len(valid_df))
+            stats['processed_records'] = result['processed']
+            stats['failed_records'] = result['failed']
+            stats['high_reviews_count'] = result['high_reviews']
+            stats['low_reviews_count'] = result['low_reviews']
+            merge_write_counts(stats['database_writes'], result['database_writes'])
+            # Includes the sales a failed batch did write, which its retry then only replaces
+            self._apply_analytics_partials(result['analytics'], stats)
+            if result['failed']:
+                return stats
+            if hashes is not None:
+                self._record_row_hashes(hashes)
         
+        if refresh_analytics and self.analytics_period_types:
+            self._run_analytics(None, None)
+            self.analytics_period_types.clear()
+            self.analytics_customers = set()
+            self.analytics_months = None
+        return stats
+    
+    def _process_stream(self, chunk_dfs, upload_id, resume):
+        """
+        Process chunks produced by ``chunk_dfs()`` when the row count is not known up front
+        
+        Args:
+            chunk_dfs: Callable returning an iterator of DataFrame chunks; it is
+                called after the chunk size for a resumed upload is restored
+            upload_id: ID of the upload record
+            resume: Skip chunks already committed by a previous attempt
+            
+        Returns:
+            dict: Processing statistics and status
+        """
         start_time = datetime.now()
+        committed = None
+        if resume:
+            committed, chunk_size = self._load_checkpoints(upload_id)
+            # Offsets are only meaningful with the chunking of the original attempt
+            self.chunk_size = chunk_size or self.chunk_size
+            logger.info(f"Resuming upload {upload_id} with {len(committed)} committed chunks")
+        self._update_upload_status(upload_id, {'chunk_size': self.chunk_size})
         
-        # Update upload record with total records
-        self._update_upload_status(upload_id, {'total_records': total_records})
+        stats = self._process_chunks(chunk_dfs(), upload_id, committed=committed)
+        self._update_upload_status(upload_id, {'total_records': stats['total_records']})
+        return self._finalize(stats, upload_id, start_time)
+    
+    def process_range(self, chunk_dfs, upload_id, first_offset, resume=False):
+        """
+        Process one row range of an upload that is ingested in parallel parts
         
-        # Split dataframe into chunks
-        chunk_dfs = [df[i:i+self.chunk_size] for i in range(0, len(df), self.chunk_size)]
-        logger.info(f"Processing {len(chunk_dfs)} chunks of size {self.chunk_size}")
+        Checkpoints, rejected rows and analytics increments are recorded as
+        for a whole file, but progress is not reported and the upload is not
+        finalized; the caller merges the statistics of all ranges and calls
+        ``_finalize`` once.
         
-        # Process chunks with thread pool
-        with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-            # Submit all chunks for processing
-            futures = [executor.submit(self._process_chunk, chunk_df, i, upload_id) 
-                      for i, chunk_df in enumerate(chunk_dfs)]
+        Args:
+            chunk_dfs: Iterable of DataFrame chunks of the range
+            upload_id: ID of the upload record
+            first_offset: Row offset of the range in the file
+            resume: Skip chunks already committed by a previous attempt
             
-            # Collect results as they complete
-            for future in futures:
-                chunk_result = future.result()
+        Returns:
+            dict: Processing statistics of the range
+        """
+        committed = self._load_checkpoints(upload_id)[0] if resume else None
+        return self._process_chunks(chunk_dfs, upload_id, committed=committed,
+                                    first_offset=first_offset, partial=True)
+    
+    def _process_chunks(self, chunk_dfs, upload_id, total_records=None, committed=None,
+                        first_offset=0, partial=False):
+        """
+        Run chunks through the staged transform/write pipeline
+        
+        Stage 1 turns each raw chunk into ready-to-write documents in a pool
+        of ``transform_processes`` worker processes (inline when 0). Stage 2
+        is ``max_threads`` writer threads draining a queue bounded at
+        ``queue_depth`` batches into MongoDB, so parsing and transforming
+        overlap with database round trips. Rows failing the retail CSV
+        schema are written to a rejected-rows file before the transform
+        instead of failing their chunk, and the validated chunks of a whole
+        upload to its parsed spool. Chunks replayed from a spool arrive as
+        ParsedChunk tuples and skip parsing and validation. Customers and products go through a
+        per-upload DimensionRegistry so each changed row is upserted once, in
+        a few large batches, and chunk checkpoints are only recorded once the
+        dimension rows they staged are written. Sales trend and customer
+        behavior totals are aggregated per chunk as deltas against the
+        stored sales each chunk replaces, and applied as increments whenever
+        checkpoints are due, so a resumed upload writing a chunk again
+        neither loses nor repeats them. When the resident set size
+        exceeds ``BULK_PROCESSING['MEMORY_LIMIT']`` the pipeline stops
+        reading until every queued batch has been written. A cancelled
+        upload (see core/upload_cancellation.py) is noticed between chunks
+        and before each transformed batch reaches the writers: reading stops,
+        batches already queued are written and checkpointed, and
+        UploadCancelled is raised.
+        
+        Args:
+            chunk_dfs: Iterable of DataFrame chunks, or of ParsedChunk tuples
+            upload_id: ID of the upload record
+            total_records: Total row count if known up front
+            committed: Checkpoints of an earlier attempt keyed by row offset;
+                matching chunks are counted but not written again
+            first_offset: Row offset of the first chunk in the file
+            partial: The chunks are one part of an upload (see process_range);
+                rejected rows go to a part file and no progress is reported
+            
+        Returns:
+            dict: Processing statistics; with ``keeps_analytics_frame``, the
+            columns post-upload analytics need are left in ``self.analytics_df``
+            
+        Raises:
+            UploadCancelled: If the upload was cancelled; its ``stats`` hold
+            what was written before it stopped
+        """
+        stats = {
+            'total_records': total_records or 0,
+            'processed_records': 0,
+            'failed_records': 0,
+            'high_reviews_count': 0,
+            'low_reviews_count': 0,
+            'processing_time': 0,
+            'peak_memory_mb': get_rss_mb(),
+            'memory_throttle_events': 0,
+            'resumed_records': 0,
+            'duplicate_records': 0,
+            'rejected_records': 0,
+            'rejected_file_path': None,
+            'database_writes': {}
+        }
+        committed = committed or {}
+        validator = get_retail_schema() if self.validate_rows else None
+        rejects = RejectedRowSpool(upload_id, part=first_offset if partial else None)
+        # Parts of an upload are not spooled
+        spool = ParsedSpoolWriter(upload_id) if spooling_enabled() and not partial else None
+        # Every document written is tagged with the upload, so it can be rolled back
+        upload_tag = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+        self._staging = None
+        if self.write_strategy == 'staged_merge':
+            self._staging = StagingArea(upload_id, part=first_offset if partial else None)
+            # Nothing an earlier attempt staged was committed, so its chunks are staged again
+            for db in (self.low_db, self.high_db):
+                self._staging.drop(db)
+        self._dimension_sequence = 0
+        dimensions = self.dimension_registry
+        if dimensions is None and DIMENSION_CACHE.get('ENABLED'):
+            dimensions = DimensionRegistry(self.low_db)
+        # A shared registry may flush this upload's rows in another upload's flush
+        dimension_failures = dimensions.failures if dimensions is not None else 0
+        unflushed_checkpoints = []
+        # Checkpoints of staged chunks, recorded once the merge has written them
+        staged_checkpoints = []
+        unflushed_partials = AnalyticsPartials()
+        self.analytics_period_types.clear()
+        self.analytics_customers = set()
+        self.analytics_months = None
+        analytics_parts = []
+        keep_analytics_rows = self.keeps_analytics_frame and self.analytics_strategy != 'none'
+        memory_limit = BULK_PROCESSING.get('MEMORY_LIMIT')
+        write_queue = queue.Queue(maxsize=max(1, self.queue_depth))
+        pending = deque()
+        max_pending = max(1, self.transform_processes) * 2
+        cancellation = CancellationCheck(upload_id, self.low_db)
+        cancelled = False
+        
+        def collect_results(final=False):
+            nonlocal dimension_failures
+            updated = False
+            checkpoints = []
+            while True:
+                try:
+                    chunk_result = self.results_queue.get_nowait()
+                except queue.Empty:
+                    break
                 stats['processed_records'] += chunk_result['processed']
                 stats['failed_records'] += chunk_result['failed']
                 stats['high_reviews_count'] += chunk_result['high_reviews']
                 stats['low_reviews_count'] += chunk_result['low_reviews']
-                
-                # Update progress in upload record every chunk
+                merge_write_counts(stats['database_writes'], chunk_result['database_writes'])
+                updated = True
+                # Sales a failed chunk did write are counted too; writing it again adds only the rest
+                unflushed_partials.merge(chunk_result['analytics'])
+                if chunk_result['failed'] == 0:
+                    checkpoints.append({
+                        'offset': chunk_result['offset'],
+                        'row_count': chunk_result['row_count'],
+                        'checksum': chunk_result['checksum'],
+                        'duplicates': chunk_result['duplicates'],
+                        'low_reviews': chunk_result['low_reviews'],
+                        'high_reviews': chunk_result['high_reviews']
+                    })
+            
+            unflushed_checkpoints.extend(checkpoints)
+            if dimensions is None or final or dimensions.should_flush():
+                flushed = dimensions is None or self._flush_dimensions(dimensions, stats)
+                if dimensions is not None and dimensions.failures != dimension_failures:
+                    # Rows staged here may have been in a failed flush of another upload
+                    dimension_failures = dimensions.failures
+                    flushed = False
+                # Applied whether or not the flush succeeded: the sales are stored either way,
+                # and a resume writing the chunks again only adds what changed since
+                self._apply_analytics_partials(unflushed_partials, stats)
+                if flushed and self._staging is not None:
+                    staged_checkpoints.extend(unflushed_checkpoints)
+                elif flushed and unflushed_checkpoints:
+                    self._push_checkpoints(upload_id, list(unflushed_checkpoints))
+                # After a failed flush the chunks stay unrecorded so a resume writes them again
+                unflushed_checkpoints.clear()
+                unflushed_partials.trends.clear()
+                unflushed_partials.customers.clear()
+            if updated and not partial:
+                # Update progress in upload record once per batch of results
                 progress = {
                     'processed_records': stats['processed_records'],
                     'high_reviews_count': stats['high_reviews_count'],
                     'low_reviews_count': stats['low_reviews_count']
                 }
-                self._update_upload_status(upload_id, progress)
+                if total_records is None:
+                    progress['total_records'] = stats['total_records']
+                progress['rejected_records'] = stats['rejected_records']
+                progress['write_batching'] = self.batch_sizer.snapshot()
+                self._report_progress(upload_id, progress)
+        
+        def enqueue_next():
+            nonlocal cancelled
+            batch = pending.popleft()
+            future = batch.pop('future')
+            if cancelled or cancellation.requested():
+                # Dropped before it reaches the writers
+                cancelled = True
+                future.cancel()
+                return
+            try:
+                batch['documents'] = future.result()
+            except Exception as e:
+                logger.error(f"Error transforming chunk {batch['chunk_index']}: {str(e)}")
+                batch['documents'] = None
+            if dimensions is not None and batch['documents'] is not None:
+                dimensions.stage(batch['documents'])
+            # Blocks while the writers are behind, which throttles reading
+            write_queue.put(batch)
+            collect_results()
+        
+        writers = [
+            threading.Thread(target=self._writer_loop, args=(write_queue,),
+                             name=f"bulk-writer-{i}", daemon=True)
+            for i in range(max(1, self.max_threads))
+        ]
+        for writer in writers:
+            writer.start()
+        transform_pool = self._create_transform_pool()
+        
+        offset = first_offset
+        try:
+            for chunk_index, chunk_df in enumerate(chunk_dfs):
+                if cancelled or cancellation.requested():
+                    cancelled = True
+                    logger.info(f"Upload {upload_id} cancelled, stopping after {chunk_index} chunks")
+                    break
+                if isinstance(chunk_df, ParsedChunk):
+                    # Parsed and validated by an earlier attempt
+                    row_count, checksum, rejected = chunk_df.row_count, chunk_df.checksum, chunk_df.rejected
+                    hashes = chunk_df.row_hashes
+                    chunk_df = valid_df = chunk_df.frame
+                    chunk_offset = offset
+                    offset += row_count
+                else:
+                    row_count = len(chunk_df)
+                    chunk_offset = offset
+                    offset += row_count
+                    
+                    checksum = chunk_checksum(chunk_df)
+                    chunk_df = chunk_df.reset_index(drop=True)
+                    
+                    # Coerce types in bulk and divert rows that fail the schema
+                    valid_df = chunk_df
+                    if validator is not None:
+                        valid_df, rejected_df = validator.validate(chunk_df)
+                        rejects.write(rejected_df, chunk_offset + 1)
+                    rejected = row_count - len(valid_df)
+                    
+                    hashes = None
+                    if self.dedupe_rows:
+                        # Hashes are taken over the file's text so they match earlier uploads
+                        hashes = row_hashes(chunk_df.loc[valid_df.index])
+                    if spool is not None:
+                        spool.write(valid_df, chunk_offset, row_count, checksum, rejected, hashes)
+                
+                if total_records is None:
+                    stats['total_records'] += row_count
+                stats['rejected_records'] += rejected
+                if keep_analytics_rows:
+                    analytics_parts.append(self._analytics_slice(valid_df))
+                
+                checkpoint = committed.get(chunk_offset)
+                if checkpoint and checkpoint['row_count'] == row_count and checkpoint['checksum'] == checksum:
+                    # Committed by an earlier attempt
+                    duplicates = checkpoint.get('duplicates', 0)
+                    stats['processed_records'] += row_count - duplicates - rejected
+                    stats['duplicate_records'] += duplicates
+                    stats['resumed_records'] += row_count
+                    stats['low_reviews_count'] += checkpoint.get('low_reviews', 0)
+                    stats['high_reviews_count'] += checkpoint.get('high_reviews', 0)
+                    continue
+                if checkpoint:
+                    logger.warning(f"Checksum mismatch for chunk at offset {chunk_offset}, processing it again")
+                
+                # Delta ingestion: drop rows an earlier upload already ingested
+                seen_rows = None
+                if self.dedupe_rows:
+                    valid_df, hashes, seen_rows = self._drop_seen_rows(valid_df, hashes)
+                else:
+                    hashes = None
+                duplicates = row_count - rejected - len(valid_df)
+                stats['duplicate_records'] += duplicates
+                
+                if transform_pool is None:
+                    future = Future()
+                    try:
+                        future.set_result(self.transform(valid_df, upload_tag))
+                    except Exception as e:
+                        future.set_exception(e)
+                else:
+                    future = transform_pool.submit(self.transform, valid_df, upload_tag)
+                pending.append({
+                    'chunk_index': chunk_index,
+                    'offset': chunk_offset,
+                    'row_count': row_count,
+                    'checksum': checksum,
+                    'duplicates': duplicates,
+                    'rejected': rejected,
+                    'row_hashes': hashes,
+                    'seen_rows': seen_rows,
+                    'upload_id': upload_tag,
+                    'future': future
+                })
+                del chunk_df, valid_df
+                
+                while len(pending) >= max_pending:
+                    enqueue_next()
+                
+                rss_mb = get_rss_mb()
+                stats['peak_memory_mb'] = max(stats['peak_memory_mb'], rss_mb)
+                if memory_limit and rss_mb > memory_limit:
+                    # Back-pressure: stop parsing until the writers catch up
+                    logger.warning(f"RSS {rss_mb:.0f}MB above limit of {memory_limit}MB, draining in-flight chunks")
+                    stats['memory_throttle_events'] += 1
+                    while pending:
+                        enqueue_next()
+                    write_queue.join()
+                    collect_results()
+                    gc.collect()
+            
+            # Once cancelled, chunks still being transformed are dropped
+            while pending:
+                enqueue_next()
+            
+            if spool is not None and not cancelled:
+                spooled = spool.commit()
+                if spooled:
+                    self._write_upload_status(upload_id, {'parsed_spool': spooled})
+        finally:
+            if spool is not None:
+                # No-op once committed
+                spool.abort()
+            for _ in writers:
+                write_queue.put(None)
+            for writer in writers:
+                writer.join()
+            if transform_pool is not None:
+                transform_pool.shutdown()
         
-        # Process all analytics data together to ensure complete analytical collections
-        logger.info("Processing full analytics data for all chunks...")
+        collect_results(final=True)
+        if self._staging is not None:
+            self._merge_staging(stats)
+            self._commit_staged_chunks(upload_id, staged_checkpoints, upload_tag)
+        stats['rejected_file_path'] = rejects.path
+        if rejects.path is None and stats['rejected_records']:
+            # Replayed chunks had their rejected rows written by the attempt that parsed them
+            stats['rejected_file_path'] = rejected_rows_path(upload_id, first_offset if partial else None)
+        if dimensions is not None:
+            stats.update(dimensions.summary())
+        if analytics_parts:
+            self.analytics_df = pd.concat(analytics_parts, ignore_index=True)
+        else:
+            self.analytics_df = pd.DataFrame(columns=self.analytics_columns)
+        if cancelled:
+            if not partial:
+                self._flush_progress(upload_id)
+            raise UploadCancelled(upload_id, stats)
+        return stats
+    
+    def _flush_dimensions(self, dimensions, stats):
+        """
+        Upsert the dimension rows queued in the registry
+        
+        Returns:
+            bool: Whether every queued row was written
+        """
+        flushed = True
+        # Held while writing, so a registry shared by several uploads has one flush in flight
+        with dimensions.flush_lock:
+            for collection_name, rows in dimensions.take_pending():
+                try:
+                    merge_write_counts(stats['database_writes'],
+                                       self._upsert_or_stage(rows, collection_name, self._dimension_sequence))
+                    # Later flushes hold later versions of the rows
+                    self._dimension_sequence += len(rows)
+                except Exception as e:
+                    logger.error(f"Error writing {len(rows)} {collection_name}: {str(e)}")
+                    dimensions.forget(collection_name, rows)
+                    flushed = False
+        return flushed
+    
+    def _drop_seen_rows(self, chunk_df, hashes=None):
+        """
+        Remove rows that were already ingested, or repeat earlier in the chunk
+        
+        Args:
+            chunk_df: Rows to filter
+            hashes: row_hashes of the rows, computed from them if not given
+        
+        Returns:
+            tuple: (remaining rows, their row hashes, (row hashes, order ids)
+            of the rows an earlier upload ingested)
+        """
+        if hashes is None:
+            hashes = row_hashes(chunk_df)
+        first_in_chunk = ~pd.Series(hashes).duplicated().to_numpy()
+        candidates = hashes[first_in_chunk].tolist()
+        seen = [
+            doc['_id'] for doc in
+            self.low_db[ROW_HASH_COLLECTION].find({'_id': {'$in': candidates}}, {'_id': 1})
+        ]
+        ingested = first_in_chunk & np.isin(hashes, seen)
+        keep = first_in_chunk & ~ingested
+        seen_rows = (hashes[ingested], order_ids(chunk_df[ingested]).tolist() if ingested.any() else [])
+        return chunk_df[keep], hashes[keep], seen_rows
+    
+    def _record_row_hashes(self, hashes, upload_id=None):
+        """Remember the hashes of committed rows so later uploads can skip them"""
+        if len(hashes) == 0:
+            return
         try:
-            # Create a copy of the original dataframe to process complete analytical data
-            # This ensures the analytical collections have complete data
-            full_analytics_df = df.copy()
-            process_analytics_in_background(full_analytics_df)
-            logger.info("Successfully processed complete analytical data")
+            self.low_db[ROW_HASH_COLLECTION].insert_many(
+                [with_owners({'_id': row_hash, UPLOAD_TAG: upload_id}) for row_hash in hashes.tolist()],
+                ordered=False
+            )
+        except BulkWriteError:
+            # Rows committed concurrently by another upload, which this one contains too
+            if upload_id is not None:
+                self.low_db[ROW_HASH_COLLECTION].update_many(
+                    {'_id': {'$in': hashes.tolist()}}, {'$addToSet': {UPLOAD_OWNERS: upload_id}}
+                )
         except Exception as e:
-            logger.error(f"Error processing complete analytical data: {str(e)}")
+            logger.error(f"Error recording row hashes: {str(e)}")
+    
+    def _record_row_owners(self, seen_rows, upload_id):
+        """
+        Add an upload to the owners of the rows it skipped because an earlier upload ingested them
+        
+        Rolling the earlier upload back then keeps them (see core/upload_rollback.py).
+        
+        Args:
+            seen_rows: (row hashes, order ids) from _drop_seen_rows
+            upload_id: Upload containing the rows
+        """
+        hashes, ids = seen_rows
+        if upload_id is None or not len(hashes):
+            return
+        keys = {
+            'orders': ('order_id', ids),
+            'sales': ('id', ['SALE-' + order_id for order_id in ids]),
+            'low_reviews': ('id', ['REV-' + order_id for order_id in ids]),
+            'high_reviews': ('id', ['REV-' + order_id for order_id in ids]),
+            ROW_HASH_COLLECTION: ('_id', hashes.tolist()),
+        }
+        update = {'$addToSet': {UPLOAD_OWNERS: upload_id}}
+        for collection_name, (key, values) in keys.items():
+            for alias in TAGGED_COLLECTIONS[collection_name]:
+                db = self.low_db if alias == 'low_review_score_db' else self.high_db
+                db[collection_name].update_many({key: {'$in': values}}, update)
+    
+    def _create_transform_pool(self):
+        """Create the process pool for the transform stage, or None to transform inline"""
+        if self.transform_processes <= 0:
+            return None
+        if multiprocessing.current_process().daemon:
+            # Daemonic processes (e.g. Celery prefork workers) cannot have children
+            logger.info("Running inside a daemonic process, transforming chunks inline")
+            return None
+        return ProcessPoolExecutor(max_workers=self.transform_processes)
+    
+    def _writer_loop(self, write_queue):
+        """Writer thread body: drain transformed batches into MongoDB until a None sentinel"""
+        while True:
+            batch = write_queue.get()
+            try:
+                if batch is None:
+                    return
+                row_count = batch['row_count'] - batch['duplicates'] - batch['rejected']
+                chunk_result = self._write_chunk(batch['documents'], batch['chunk_index'], row_count,
+                                                 batch['upload_id'], batch['seen_rows'], batch['offset'])
+                if chunk_result['failed'] == 0 and batch['row_hashes'] is not None:
+                    # Only rows that are committed count as seen for later uploads
+                    if self._staging is not None:
+                        self._stage_row_hashes(batch['row_hashes'])
+                    else:
+                        self._record_row_hashes(batch['row_hashes'], batch['upload_id'])
+                chunk_result['offset'] = batch['offset']
+                chunk_result['row_count'] = batch['row_count']
+                chunk_result['checksum'] = batch['checksum']
+                chunk_result['duplicates'] = batch['duplicates']
+                self.results_queue.put(chunk_result)
+            finally:
+                write_queue.task_done()
+    
+    def _analytics_slice(self, chunk_df):
+        """Return the columns post-upload analytics need, with parsed dates"""
+        columns = [column for column in self.analytics_columns if column in chunk_df.columns]
+        analytics_df = chunk_df[columns].copy()
+        if 'order_date' in analytics_df.columns:
+            analytics_df['order_date'] = pd.to_datetime(analytics_df['order_date'])
+        return analytics_df
+    
+    def _apply_analytics_partials(self, partials, stats):
+        """Increment the stored sales trend and customer behavior totals by merged chunk partials"""
+        if partials.is_empty():
+            return
+        self.analytics_period_types.update(partials.period_types())
+        self.analytics_customers.update(f"behavior-{customer_id}" for customer_id in partials.customers)
+        with self._analytics_lock:
+            for db in (self.low_db, self.high_db):
+                if (id(db.client), db.name) not in self._analytics_indexed:
+                    ensure_analytics_indexes(db)
+                    self._analytics_indexed.add((id(db.client), db.name))
+            if self.analytics_months is None:
+                self.analytics_months = stored_months_spanned(self.low_db)
+        for collection_name, operations in (('sales_trends', partials.trend_operations()),
+                                            ('customer_behavior', partials.customer_operations())):
+            with self._analytics_lock:
+                counts, errors = self._replicated_write(
+                    collection_name,
+                    lambda collection, batch: collection.bulk_write(batch, ordered=False),
+                    operations
+                )
+            merge_write_counts(stats['database_writes'], counts)
+            if errors:
+                # Ingest carries on; the totals can be rebuilt from the stored sales
+                logger.error(f"Error incrementing {collection_name}: {str(errors[0])}")
+    
+    def _run_analytics(self, analytics_df, upload_id):
+        """
+        Bring sales trends and customer behavior up to date with the upload
+        
+        With the 'incremental' strategy the totals were already incremented
+        chunk by chunk; growth rates, shares, purchase frequencies and
+        segments depend on all stored totals, so they are refreshed once per
+        upload: segments only for the customers the upload changed, unless it
+        also lengthened the span of the stored sales, which changes every
+        customer's purchase frequency. With 'rebuild' both collections are recomputed from every
+        stored sale and swapped in through shadow collections.
+        """
+        if self.analytics_strategy == 'none':
+            return
+        if self.analytics_strategy == 'rebuild':
+            loaded = rebuild_analytics(
+                {'low_review_score_db': self.low_db, 'high_review_score_db': self.high_db},
+                collections=['sales_trends', 'customer_behavior']
+            )
+            logger.info(f"Rebuilt {loaded['sales_trends']} sales trends and {loaded['customer_behavior']} customer behaviors")
+            return
+        trend_updates = trend_ratio_updates(self.low_db, self.analytics_period_types)
+        months_diff = stored_months_spanned(self.low_db)
+        behavior_ids = self.analytics_customers
+        if self.analytics_months not in (None, months_diff):
+            behavior_ids = None
+        customer_updates = customer_segment_updates(self.low_db, behavior_ids, months_diff)
+        self._bulk_upsert(trend_updates, 'sales_trends')
+        self._bulk_upsert(customer_updates, 'customer_behavior')
+        logger.info(f"Refreshed {len(trend_updates)} sales trends and {len(customer_updates)} customer behaviors")
+    
+    def _finalize(self, stats, upload_id, start_time):
+        """Run post-upload analytics and mark the upload as completed"""
+        if not self.defer_analytics:
+            logger.info("Refreshing analytics for the upload...")
+            try:
+                self._run_analytics(self.analytics_df, upload_id)
+                logger.info("Successfully processed complete analytical data")
+            except Exception as e:
+                logger.error(f"Error processing complete analytical data: {str(e)}")
         
         # Mark upload as completed
         end_time = datetime.now()
         stats['processing_time'] = (end_time - start_time).total_seconds()
+        stats['peak_memory_mb'] = max(stats['peak_memory_mb'], get_rss_mb())
+        stats['write_batching'] = self.batch_sizer.snapshot()
         self._update_upload_status(
             upload_id, 
-            {'status': 'completed', 'processing_time': stats['processing_time']}
+            {
+                'status': 'completed',
+                'processing_time': stats['processing_time'],
+                'duplicate_records': stats['duplicate_records'],
+                'rejected_records': stats['rejected_records'],
+                'rejected_file_path': stats['rejected_file_path'],
+                'write_batching': stats['write_batching']
+            }
         )
         
         logger.info(f"Completed processing {stats['processed_records']} records in {stats['processing_time']:.2f} seconds")
         return stats
         
-    def _process_chunk(self, chunk_df, chunk_index, upload_id):
+    def _write_chunk(self, documents, chunk_index, row_count, upload_id=None, seen_rows=None, offset=0):
         """
-        Process a single chunk of data
+        Write the transformed documents of a single chunk
         
         Args:
-            chunk_df: DataFrame chunk to process
+            documents: Output of the transform, or None if the transform failed
             chunk_index: Index of the chunk
-            upload_id: Upload record ID
+            row_count: Number of CSV rows in the chunk
+            upload_id: Upload the documents are tagged with
+            seen_rows: Rows of the chunk an earlier upload ingested, from
+                _drop_seen_rows; the upload is recorded as containing them
+            offset: Row offset of the chunk in the upload, which orders the
+                versions of a key staged by several chunks
             
         Returns:
-            dict: Chunk processing statistics
+            dict: Chunk processing statistics, with the AnalyticsPartials of the
+            sales it wrote under 'analytics' (also set when the chunk failed
+            after writing some of them)
         """
-        logger.info(f"Processing chunk {chunk_index} with {len(chunk_df)} records")
+        logger.info(f"Writing chunk {chunk_index} with {row_count} records")
         result = {
             'processed': 0,
             'failed': 0,
             'high_reviews': 0,
-            'low_reviews': 0
+            'low_reviews': 0,
+            'database_writes': {},
+            'analytics': AnalyticsPartials()
         }
         
+        if documents is None:
+            result['failed'] = row_count
+            return result
+        
         try:
-            # Extract data for each collection
-            customers_data = self._extract_customers(chunk_df)
-            products_data = self._extract_products(chunk_df)
-            orders_data = self._extract_orders(chunk_df)
-            sales_data = self._extract_sales(chunk_df)
-            low_reviews_data, high_reviews_data = self._extract_reviews(chunk_df)
-            
             # Perform bulk inserts for each collection
-            self._bulk_upsert(customers_data, 'customers')
-            self._bulk_upsert(products_data, 'products')
-            self._bulk_upsert(orders_data, 'orders')
-            self._bulk_upsert(sales_data, 'sales')
+            for collection_name in ('customers', 'products', 'orders'):
+                merge_write_counts(
+                    result['database_writes'],
+                    self._upsert_or_stage(documents[collection_name], collection_name, offset)
+                )
+            merge_write_counts(result['database_writes'], self._write_sales(documents['sales'], result, offset))
             
             # Handle reviews with sharding
+            low_reviews_data = documents['low_reviews']
+            high_reviews_data = documents['high_reviews']
             if low_reviews_data:
-                self._bulk_insert(low_reviews_data, 'low_reviews', db=self.low_db)
+                merge_write_counts(
+                    result['database_writes'],
+                    self._bulk_insert(low_reviews_data, 'low_reviews', db=self.low_db)
+                )
                 result['low_reviews'] = len(low_reviews_data)
                 
             if high_reviews_data:
-                self._bulk_insert(high_reviews_data, 'high_reviews', db=self.high_db)
+                merge_write_counts(
+                    result['database_writes'],
+                    self._bulk_insert(high_reviews_data, 'high_reviews', db=self.high_db)
+                )
                 result['high_reviews'] = len(high_reviews_data)
             
-            # Process analytical data for this chunk
-            if chunk_index == 0:  # Only process analytics for the first chunk to avoid duplication
-                # Create a copy of the dataframe to avoid modifying the original
-                analytics_df = chunk_df.copy()
-                process_analytics_in_background(analytics_df)
-                logger.info(f"Processed analytical data for chunk {chunk_index}")
+            if seen_rows is not None:
+                self._record_row_owners(seen_rows, upload_id)
             
-            result['processed'] = len(chunk_df)
+            result['processed'] = row_count
             
         except Exception as e:
             logger.error(f"Error processing chunk {chunk_index}: {str(e)}")
-            result['failed'] = len(chunk_df)
+            result['failed'] = row_count
             
         return result
     
-    def _extract_customers(self, chunk_df):
-        """Extract and transform customer data from DataFrame"""
-        customers = {}
-        for _, row in chunk_df.iterrows():
-            customer_id = int(row['customer_id'])
-            customers[customer_id] = {
-                'customer_id': customer_id,
-                'gender': str(row['gender']),
-                'age': int(row['age']),
-                'city': str(row['city'])
-            }
-        return list(customers.values())
-    
-    def _extract_products(self, chunk_df):
-        """Extract and transform product data from DataFrame"""
-        products = {}
-        for _, row in chunk_df.iterrows():
-            product_id = int(row['product_id'])
-            products[product_id] = {
-                'product_id': product_id,
-                'product_name': str(row['product_name']),
-                'category_id': int(row['category_id']),
-                'category_name': str(row['category_name']),
-                'price': float(row['price'])
-            }
-        return list(products.values())
-    
-    def _extract_orders(self, chunk_df):
-        """Extract and transform order data from DataFrame"""
-        orders = []
-        for _, row in chunk_df.iterrows():
-            order_date = pd.to_datetime(row['order_date'])
-            order_id = f"ORD-{row['customer_id']}-{row['product_id']}-{order_date.strftime('%Y%m%d%H%M%S')}"
+    def _write_sales(self, sales, result, offset=0):
+        """
+        Upsert a chunk's sales, leaving the analytics deltas of what was written in result['analytics']
+        
+        Deltas are taken against the stored sales being replaced, including
+        ones this upload wrote in an earlier chunk or attempt, so an order
+        sent again is only counted once. If the write fails partway, the
+        deltas cover the sales that did reach the database, and writing the
+        chunk again adds only the rest. Staged sales are only written by the
+        merge, which takes their deltas then (see _merge_staging).
+        
+        Returns:
+            dict: Per-database success and failure counts
+        """
+        staged = self._staging is not None and self._staging.handles('sales')
+        if self.analytics_strategy != 'incremental' or not sales or staged:
+            return self._upsert_or_stage(sales, 'sales', offset)
+        # The last version of a sale written twice in a chunk is the one stored
+        new_sales = pd.DataFrame(sales, columns=self._SALES_COLUMNS).drop_duplicates('id', keep='last')
+        sale_ids = new_sales['id'].tolist()
+        with self._sales_lock:
+            stored_sales = self._stored_sales(sale_ids)
+            try:
+                counts = self._upsert_or_stage(sales, 'sales', offset)
+            except Exception:
+                result['analytics'] = self._sales_partials(self._stored_sales(sale_ids), stored_sales)
+                raise
+        result['analytics'] = self._sales_partials(new_sales, stored_sales)
+        return counts
+    
+    def _stored_sales(self, sale_ids):
+        """Return the stored versions of some sales as a frame of _SALES_COLUMNS"""
+        return pd.DataFrame(
+            list(self.low_db.sales.find({'id': {'$in': sale_ids}},
+                                        {'_id': 0, **{column: 1 for column in self._SALES_COLUMNS}})),
+            columns=self._SALES_COLUMNS
+        )
+    
+    @staticmethod
+    def _sales_partials(written, replaced):
+        """
+        Return the analytics deltas of replacing some stored sales with others
+        
+        Args:
+            written: Frame of the sales now stored
+            replaced: Frame of the stored sales they replace
+            
+        Returns:
+            AnalyticsPartials: Deltas of the sales trend and customer behavior totals
+        """
+        partials = AnalyticsPartials.from_frame(written.rename(columns={'sale_date': 'order_date'}))
+        partials.merge(AnalyticsPartials.from_frame(replaced.rename(columns={'sale_date': 'order_date'})).negated())
+        return partials.drop_unchanged()
+    
+    def _db_alias(self, db):
+        """Return the connection alias of one of the review-score databases"""
+        return 'low_review_score_db' if db is self.low_db else 'high_review_score_db'
+    
+    def _batches(self, collection_name, items):
+        """Yield consecutive slices of items sized by the adaptive batch sizer"""
+        start = 0
+        while start < len(items):
+            size = self.batch_sizer.batch_size(collection_name)
+            yield items[start:start + size]
+            start += size
+    
+    def _replicated_write(self, collection_name, write, items, batch_key=None):
+        """
+        Apply the same writes to both review-score databases concurrently
+        
+        Items are sent in batches sized by the adaptive batch sizer, and the
+        latency of each batch (both databases, joined) feeds the next size.
+        
+        Args:
+            collection_name: Name of the collection in each database
+            write: Callable (collection, batch) performing the write
+            items: Operations or documents to write
+            batch_key: Key the adaptive batch size is tracked under
+                (defaults to collection_name)
             
-            orders.append({
-                'order_id': order_id,
-                'order_date': order_date,
-                'customer_id': int(row['customer_id']),
-                'product_id': int(row['product_id']),
-                'quantity': int(row['quantity']),
-                'payment_method': row.get('payment_method', 'Cash'),
-                'review_score': float(row['review_score']) if pd.notna(row.get('review_score')) else None
-            })
-        return orders
-    
-    def _extract_sales(self, chunk_df):
-        """Extract and transform sales data from DataFrame"""
-        sales = []
-        for _, row in chunk_df.iterrows():
-            order_date = pd.to_datetime(row['order_date'])
-            order_id = f"ORD-{row['customer_id']}-{row['product_id']}-{order_date.strftime('%Y%m%d%H%M%S')}"
+        Returns:
+            tuple: ({db_alias: {'succeeded': n, 'failed': n}}, [errors]) where
+            errors holds exceptions other than partial bulk write failures
+        """
+        batch_key = batch_key or collection_name
+        executor = get_replica_executor()
+        counts = {}
+        errors = []
+        for batch in self._batches(batch_key, items):
+            started = time.perf_counter()
+            futures = {
+                alias: executor.submit(_counted_write, write, db[collection_name], batch)
+                for alias, db in (('low_review_score_db', self.low_db), ('high_review_score_db', self.high_db))
+            }
             
-            sales.append({
-                'id': f"SALE-{order_id}",
-                'customer_id': str(row['customer_id']),
-                'product_id': str(row['product_id']),
-                'quantity': int(row['quantity']),
-                'sale_date': order_date,
-                'revenue': float(row['quantity'] * row['price']),
-                'profit': float(row['quantity'] * row['price'] * 0.3),
-                'city': row['city']
-            })
-        return sales
-    
-    def _extract_reviews(self, chunk_df):
-        """Extract and separate reviews by score"""
-        low_reviews = []
-        high_reviews = []
-        
-        for _, row in chunk_df.iterrows():
-            if pd.notna(row.get('review_score')):
-                order_date = pd.to_datetime(row['order_date'])
-                order_id = f"ORD-{row['customer_id']}-{row['product_id']}-{order_date.strftime('%Y%m%d%H%M%S')}"
-                
-                review_data = {
-                    'id': f"REV-{order_id}",
-                    'customer_id': str(row['customer_id']),
-                    'product_id': str(row['product_id']),
-                    'review_score': float(row['review_score']),
-                    'sentiment': self._get_sentiment(float(row['review_score'])),
-                    'review_text': row.get('review_text', ''),
-                    'review_date': order_date
+            batch_counts = {}
+            for alias, future in futures.items():
+                try:
+                    batch_counts[alias] = future.result()
+                except Exception as e:
+                    batch_counts[alias] = {'succeeded': 0, 'failed': len(batch)}
+                    errors.append(e)
+            self.batch_sizer.record(batch_key, len(batch), time.perf_counter() - started)
+            merge_write_counts(counts, batch_counts)
+        return counts, errors
+    
+    def _single_write(self, db, collection_name, write, items):
+        """
+        Write items to one database in adaptively sized batches
+        
+        Returns:
+            tuple: ({db_alias: {'succeeded': n, 'failed': n}}, [errors])
+        """
+        counts = {'succeeded': 0, 'failed': 0}
+        errors = []
+        for batch in self._batches(collection_name, items):
+            started = time.perf_counter()
+            try:
+                batch_counts = _counted_write(write, db[collection_name], batch)
+                counts['succeeded'] += batch_counts['succeeded']
+                counts['failed'] += batch_counts['failed']
+            except Exception as e:
+                counts['failed'] += len(batch)
+                errors.append(e)
+            self.batch_sizer.record(collection_name, len(batch), time.perf_counter() - started)
+        return {self._db_alias(db): counts}, errors
+    
+    def _upsert_or_stage(self, documents, collection_name, first_sequence=0):
+        """
+        Upsert documents, or insert them into the upload's staging collection in staged-merge mode
+        
+        Staged documents are numbered from ``first_sequence`` in list order,
+        so the merge keeps the last version of a key.
+        """
+        if self._staging is None or not self._staging.handles(collection_name):
+            return self._bulk_upsert(documents, collection_name)
+        if not documents:
+            return {}
+        counts, errors = self._replicated_write(
+            self._staging.names[collection_name],
+            # Copied because both databases insert the same documents and insert_many adds _id
+            lambda collection, batch: collection.insert_many(
+                [dict(doc) for doc in batch], ordered=False, bypass_document_validation=True
+            ),
+            self._staging.sequenced(documents, first_sequence),
+            batch_key=f"{collection_name}_staging"
+        )
+        if errors:
+            logger.error(f"Error staging {collection_name}: {str(errors[0])}")
+            raise errors[0]
+        return counts
+    
+    def _merge_staging(self, stats):
+        """
+        Upsert every staging collection of the upload into its target with a server-side $merge
+        
+        A merge that fails (e.g. the target has duplicate keys, so the
+        unique key index $merge needs cannot be built) falls back to
+        client-side upserts of the staged documents. With incremental
+        analytics the deltas of the staged sales are taken against the
+        stored sales before they are merged, and applied once they are.
+        """
+        executor = get_replica_executor()
+        merged = {}
+        for collection_name, staging_name in self._staging.names.items():
+            counted = collection_name == 'sales' and self.analytics_strategy == 'incremental'
+            # Held like a direct sales write, so no other writer replaces the sales in between
+            with self._sales_lock if counted else nullcontext():
+                partials = self._staged_sales_partials() if counted else None
+                futures = {
+                    db: executor.submit(self._staging.merge, db, collection_name)
+                    for db in (self.low_db, self.high_db)
                 }
-                
-                # Route review to appropriate list based on score
-                if float(row['review_score']) < 4:
-                    low_reviews.append(review_data)
-                else:
-                    high_reviews.append(review_data)
-                    
-        return low_reviews, high_reviews
+                for db, future in futures.items():
+                    try:
+                        merged[collection_name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Error merging {staging_name} in {self._db_alias(db)}, "
+                                     f"upserting from the client instead: {str(e)}")
+                        merged[collection_name] = self._upsert_from_staging(db, collection_name, stats)
+                    if db is self.low_db and partials is not None:
+                        # The totals follow the sales of the database they are read from
+                        self._apply_analytics_partials(partials, stats)
+        stats['staged_merge'] = merged
     
-    def _get_sentiment(self, score):
-        """Convert review score to sentiment label"""
-        if score >= 4:
-            return 'Positive'
-        elif score <= 2:
-            return 'Negative'
-        return 'Neutral'    
+    def _staged_sales_partials(self):
+        """Return the analytics deltas of merging the staged sales over the stored ones"""
+        partials = AnalyticsPartials()
+        versions = self._staging.last_versions(self.low_db, 'sales', self._SALES_COLUMNS)
+        for batch in _in_batches(versions, STAGED_MERGE['READ_BATCH_SIZE']):
+            partials.merge(self._sales_partials(pd.DataFrame(batch, columns=self._SALES_COLUMNS),
+                                                self._stored_sales([sale['id'] for sale in batch])))
+        return partials.drop_unchanged()
+    
+    def _stage_row_hashes(self, hashes):
+        """Keep the row hashes of a staged chunk until the merge has written its rows"""
+        if len(hashes) == 0:
+            return
+        try:
+            self.low_db[self._staging.row_hashes].insert_many(
+                [{'_id': row_hash} for row_hash in hashes.tolist()], ordered=False
+            )
+        except BulkWriteError:
+            # The same row in several chunks of the upload
+            pass
+    
+    def _commit_staged_chunks(self, upload_id, checkpoints, upload_tag):
+        """Record the row hashes and checkpoints of the staged chunks once the merge has written them"""
+        staging = self.low_db[self._staging.row_hashes]
+        for batch in _in_batches(staging.find({}, {'_id': 1}), STAGED_MERGE['READ_BATCH_SIZE']):
+            self._record_row_hashes(np.array([doc['_id'] for doc in batch]), upload_tag)
+        staging.drop()
+        if checkpoints:
+            self._push_checkpoints(upload_id, checkpoints)
+    
+    def _upsert_from_staging(self, db, collection_name, stats):
+        """Upsert the staged documents of one collection into one database from the client"""
+        staging = db[self._staging.names[collection_name]]
+        key = MERGE_KEYS[collection_name]
+        # Unordered writes may apply in any order, so only the last version of each key is sent
+        last_versions = {
+            doc[key]: doc for doc in staging.find({}, {'_id': 0, STAGED_SEQUENCE: 0}).sort(STAGED_SEQUENCE, 1)
+        }
+        operations = [
+            UpdateOne({key: key_value}, owned_upsert(collection_name, doc), upsert=True)
+            for key_value, doc in last_versions.items()
+        ]
+        counts, errors = self._single_write(
+            db, collection_name, lambda collection, batch: collection.bulk_write(batch, ordered=False), operations
+        )
+        merge_write_counts(stats['database_writes'], counts)
+        if errors:
+            # No chunk is committed yet, so a resumed upload stages them all again
+            raise errors[0]
+        staging.drop()
+        return len(operations)
     
     def _bulk_upsert(self, documents, collection_name):
         """
@@ -279,45 +1335,46 @@ class BulkDataProcessor:
         Args:
             documents: List of documents to upsert
             collection_name: Name of collection to insert into
+            
+        Returns:
+            dict: Per-database success and failure counts
         """
         if not documents:
-            return
+            return {}
         
-        # Prepare bulk operations for low db
-        try:
-            bulk_operations = []
-            for doc in documents:
-                # Determine unique key based on collection
-                if collection_name == 'customers':
-                    filter_query = {'customer_id': doc['customer_id']}
-                elif collection_name == 'products':
-                    filter_query = {'product_id': doc['product_id']}
-                elif collection_name == 'orders':
-                    filter_query = {'order_id': doc['order_id']}
-                elif collection_name == 'sales':
-                    filter_query = {'id': doc['id']}
-                else:
-                    filter_query = {'id': doc.get('id')}
-                
-                # Create PyMongo-compatible update operation
-                bulk_operations.append(
-                    UpdateOne(
-                        filter_query,
-                        {'$set': doc},
-                        upsert=True
-                    )
+        bulk_operations = []
+        for doc in documents:
+            # Determine unique key based on collection
+            if collection_name == 'customers':
+                filter_query = {'customer_id': doc['customer_id']}
+            elif collection_name == 'products':
+                filter_query = {'product_id': doc['product_id']}
+            elif collection_name == 'orders':
+                filter_query = {'order_id': doc['order_id']}
+            elif collection_name == 'sales':
+                filter_query = {'id': doc['id']}
+            else:
+                filter_query = {'id': doc.get('id')}
+            
+            # Create PyMongo-compatible update operation
+            bulk_operations.append(
+                UpdateOne(
+                    filter_query,
+                    owned_upsert(collection_name, doc),
+                    upsert=True
                 )
-                
-            # Execute bulk operations on both databases
-            if bulk_operations:
-                self.low_db[collection_name].bulk_write(bulk_operations, ordered=False)
-                self.high_db[collection_name].bulk_write(bulk_operations, ordered=False)
-                
-        except BulkWriteError as bwe:
-            logger.warning(f"Bulk write error for {collection_name}: {bwe.details}")
-        except Exception as e:
-            logger.error(f"Error in bulk upsert for {collection_name}: {str(e)}")
-            raise
+            )
+        
+        # Execute bulk operations on both databases at once
+        counts, errors = self._replicated_write(
+            collection_name,
+            lambda collection, batch: collection.bulk_write(batch, ordered=False),
+            bulk_operations
+        )
+        if errors:
+            logger.error(f"Error in bulk upsert for {collection_name}: {str(errors[0])}")
+            raise errors[0]
+        return counts
             
     def _bulk_insert(self, documents, collection_name, db=None):
         """
@@ -327,251 +1384,238 @@ class BulkDataProcessor:
             documents: List of documents to insert
             collection_name: Name of collection to insert into
             db: Database to insert into (defaults to both)
+            
+        Returns:
+            dict: Per-database success and failure counts
         """
         if not documents:
-            return
-            
-        try:
-            # If db not specified, use both
-            if db is None:
-                self.low_db[collection_name].insert_many(documents, ordered=False)
-                self.high_db[collection_name].insert_many(documents, ordered=False)
-            else:
-                db[collection_name].insert_many(documents, ordered=False)
-        except Exception as e:
-            if "BulkWriteError" in str(e):
-                logger.warning(f"Bulk write error for {collection_name}: {str(e)}")
-            else:
-                logger.error(f"Error in bulk insert for {collection_name}: {str(e)}")
-                # Don't raise to allow processing to continue
+            return {}
+        
+        if self.write_strategy == 'idempotent':
+            # Upserted on their id, so writing a chunk again never duplicates a document
+            documents = [UpdateOne({'id': doc['id']}, owned_upsert(collection_name, doc), upsert=True)
+                         for doc in documents]
+            write = lambda collection, batch: collection.bulk_write(batch, ordered=False)
+        elif db is None:
+            # insert_many adds _id to each document, so each database gets its own copies
+            documents = [with_owners(doc) for doc in documents]
+            write = lambda collection, batch: collection.insert_many([dict(doc) for doc in batch], ordered=False)
+        else:
+            documents = [with_owners(doc) for doc in documents]
+            write = lambda collection, batch: collection.insert_many(batch, ordered=False)
+        
+        # If db not specified, use both
+        if db is None:
+            counts, errors = self._replicated_write(collection_name, write, documents)
+        else:
+            counts, errors = self._single_write(db, collection_name, write, documents)
+        
+        # Don't raise to allow processing to continue
+        for error in errors:
+            logger.error(f"Error in bulk insert for {collection_name}: {str(error)}")
+        return counts
+    
+    def _report_progress(self, upload_id, progress):
+        """
+        Publish chunk progress, writing it to the upload record at a bounded rate
+        
+        Every update reaches in-process status streams immediately; updates
+        arriving within ``UPLOAD_PROGRESS['FLUSH_INTERVAL']`` of the last
+        database write are merged and written with the next one.
+        
+        Args:
+            upload_id: ID of the upload record
+            progress: Progress fields to set
+        """
+        upload_progress.publish(upload_id, progress)
+        self._pending_progress.update(progress)
+        if time.monotonic() - self._progress_flushed_at >= UPLOAD_PROGRESS['FLUSH_INTERVAL']:
+            self._flush_progress(upload_id)
+    
+    def _flush_progress(self, upload_id):
+        """Write any coalesced progress to the upload record"""
+        if self._pending_progress:
+            update_data, self._pending_progress = self._pending_progress, {}
+            self._write_upload_status(upload_id, update_data)
+        self._progress_flushed_at = time.monotonic()
     
     def _update_upload_status(self, upload_id, update_data):
         """
-        Update the upload record status in both databases
+        Publish and immediately write an upload record update
+        
+        Used for state changes; any coalesced progress not yet written is
+        included in the same write.
+        
+        Args:
+            upload_id: ID of the upload record 
+            update_data: Data to update
+        """
+        upload_progress.publish(upload_id, update_data)
+        self._pending_progress.update(update_data)
+        self._flush_progress(upload_id)
+    
+    def _write_upload_status(self, upload_id, update_data):
+        """
+        Set fields on the upload record in both databases
         
         Args:
             upload_id: ID of the upload record 
             update_data: Data to update
         """
         try:
-            # Convert string ID to ObjectId if needed
-            from bson import ObjectId
-            if isinstance(upload_id, str):
-                object_id = ObjectId(upload_id)
-            else:
-                object_id = upload_id
-                
+            object_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+            update = {'$set': update_data}
+            
             # Update both databases
-            self.low_db.raw_data_uploads.update_one(
-                {'_id': object_id}, 
-                {'$set': update_data}
-            )
-            self.high_db.raw_data_uploads.update_one(
-                {'_id': object_id}, 
-                {'$set': update_data}
-            )
+            self.low_db.raw_data_uploads.update_one({'_id': object_id}, update)
+            self.high_db.raw_data_uploads.update_one({'_id': object_id}, update)
             
             logger.info(f"Updated upload status: {update_data}")
         except Exception as e:
             logger.error(f"Error updating upload status: {str(e)}")
-
-
-# Helper function to process analytics in background
-def process_analytics_in_background(sales_data):
-    """
-    Process analytics data in background after initial data upload is complete.
-    Generates data for all analytical collections:
-    - sales_trends
-    - product_performance
-    - category_performance
-    - demographics
-    - geographical_insights
-    - customer_behavior
-    - predictions
     
-    Args:
-        sales_data: DataFrame containing sales data for analytics
-    """
-    try:
-        # Make sure sales_data has datetime values for order_date/sale_date
-        if 'order_date' in sales_data.columns:
-            sales_data['order_date'] = pd.to_datetime(sales_data['order_date'])
-        if 'sale_date' in sales_data.columns:
-            sales_data['sale_date'] = pd.to_datetime(sales_data['sale_date'])
-        
-        # Get database connections
-        low_db = get_db('low_review_score_db')
-        high_db = get_db('high_review_score_db')
-        
-        # Import necessary models
-        from analytics.models import (SalesTrend, ProductPerformance, CategoryPerformance,
-                                     Demographics, GeographicalInsights, CustomerBehavior, 
-                                     Prediction)
-        import uuid
-        from collections import defaultdict
-            
-        # --- SALES TRENDS ---
-        logger.info("Generating sales trends data...")
+    def _push_checkpoints(self, upload_id, checkpoints):
+        """
+        Append committed-chunk checkpoints to the upload record in both databases
         
+        Args:
+            upload_id: ID of the upload record
+            checkpoints: List of checkpoint dicts (offset, row_count, checksum, ...)
+        """
         try:
-            # Create monthly trends
-            # Make sure we set the date as index
-            date_col = 'sale_date' if 'sale_date' in sales_data.columns else 'order_date'
-            df_copy = sales_data.copy()
-            df_copy[date_col] = pd.to_datetime(df_copy[date_col])
-            df_indexed = df_copy.set_index(date_col)
-              # Monthly trends - use ME instead of M for month end
-            # Use a simpler aggregation approach that doesn't rely on original DataFrame indices
-            monthly_sales = df_indexed.resample('ME').agg({
-                'quantity': 'sum'
-            }).reset_index()
-            
-            # Calculate the total sales per month separately
-            df_copy['total'] = df_copy['quantity'] * df_copy['price']
-            monthly_totals = df_copy.set_index(date_col)['total'].resample('ME').sum().reset_index()
-            monthly_sales['total_sales'] = monthly_totals['total']
-              # Calculate growth rates
-            monthly_sales['sales_growth_rate'] = monthly_sales['total_sales'].pct_change() * 100
-            monthly_sales.fillna({'sales_growth_rate': 0}, inplace=True)
-            
-            # Calculate percentage of total
-            total_sales = monthly_sales['total_sales'].sum()
-            monthly_sales['sales_percentage'] = (monthly_sales['total_sales'] / total_sales) * 100 if total_sales > 0 else 0
-            
-            # Insert monthly trends
-            sales_trends = []
-            for idx, row in monthly_sales.iterrows():
-                period_value = row[date_col].strftime('%Y-%m')
-                trend_id = f"trend-monthly-{period_value}"
-                
-                trend = {
-                    'id': trend_id,
-                    'period_type': 'monthly',
-                    'period_value': period_value,
-                    'total_sales': float(row['total_sales']),
-                    'sales_growth_rate': float(row['sales_growth_rate']),
-                    'sales_percentage': float(row['sales_percentage'])
-                }
-                sales_trends.append(trend)
-                
-                # Insert into both DBs
-                low_db.sales_trends.update_one({'id': trend_id}, {'$set': trend}, upsert=True)
-                high_db.sales_trends.update_one({'id': trend_id}, {'$set': trend}, upsert=True)
-            
-            logger.info(f"Generated {len(monthly_sales)} monthly sales trend records")
-              # Weekly trends - use the same approach as monthly
-            weekly_sales = df_indexed.resample('W').agg({
-                'quantity': 'sum'
-            }).reset_index()
-              # Calculate the total sales per week separately
-            weekly_totals = df_copy.set_index(date_col)['total'].resample('W').sum().reset_index()
-            weekly_sales['total_sales'] = weekly_totals['total']
-            weekly_sales['sales_growth_rate'] = weekly_sales['total_sales'].pct_change() * 100
-            weekly_sales.fillna({'sales_growth_rate': 0}, inplace=True)
-            
-            total_sales = weekly_sales['total_sales'].sum()
-            weekly_sales['sales_percentage'] = (weekly_sales['total_sales'] / total_sales) * 100 if total_sales > 0 else 0
-            
-            for idx, row in weekly_sales.iterrows():
-                week_num = row[date_col].isocalendar()[1]
-                period_value = f"{row[date_col].year}-W{week_num:02d}"
-                trend_id = f"trend-weekly-{period_value}"
-                
-                trend = {
-                    'id': trend_id,
-                    'period_type': 'weekly',
-                    'period_value': period_value,
-                    'total_sales': float(row['total_sales']),
-                    'sales_growth_rate': float(row['sales_growth_rate']),
-                    'sales_percentage': float(row['sales_percentage'])
-                }
-                sales_trends.append(trend)
-                
-                # Insert into both DBs
-                low_db.sales_trends.update_one({'id': trend_id}, {'$set': trend}, upsert=True)
-                high_db.sales_trends.update_one({'id': trend_id}, {'$set': trend}, upsert=True)
-            
-            logger.info(f"Generated a total of {len(sales_trends)} sales trend records")
+            object_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+            update = {'$push': {'checkpoints': {'$each': checkpoints}}}
+            self.low_db.raw_data_uploads.update_one({'_id': object_id}, update)
+            self.high_db.raw_data_uploads.update_one({'_id': object_id}, update)
         except Exception as e:
-            logger.error(f"Error processing sales trends: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-        
-        # --- CUSTOMER BEHAVIOR ---
-        logger.info("Processing customer behavior data...")
+            logger.error(f"Error recording upload checkpoints: {str(e)}")
+    
+    def _load_checkpoints(self, upload_id):
+        """
+        Load the committed chunks of an earlier attempt at an upload
         
-        try:
-            # Ensure we have the date column as datetime
-            date_col = 'sale_date' if 'sale_date' in sales_data.columns else 'order_date'
-            df_copy = sales_data.copy()
-            df_copy[date_col] = pd.to_datetime(df_copy[date_col])
-            
-            # Group by customer to calculate purchases and spending
-            customer_data = df_copy.groupby('customer_id').agg({
-                date_col: 'count',  # Count purchases
-                'price': lambda x: (df_copy.loc[x.index, 'quantity'] * x).sum() if not x.empty else 0
-            }).reset_index()
-            
-            customer_data.rename(columns={date_col: 'total_purchases', 'price': 'total_spent'}, inplace=True)
-            
-            # Calculate purchase frequency
-            if len(df_copy) > 0:
-                min_date = df_copy[date_col].min()
-                max_date = df_copy[date_col].max()
-                
-                # Calculate months difference
-                if hasattr(min_date, 'year') and hasattr(max_date, 'year'):
-                    months_diff = (max_date.year - min_date.year) * 12 + (max_date.month - min_date.month)
-                    months_diff = max(1, months_diff)  # Ensure at least 1 month
-                else:
-                    months_diff = 1
-            else:
-                months_diff = 1
-            
-            # Calculate purchase frequency and segment customers
-            customer_data['purchase_frequency'] = customer_data['total_purchases'] / months_diff
-            
-            # Define customer segments
-            def get_customer_segment(row):
-                if row['total_spent'] > 1000 or row['purchase_frequency'] >= 2:
-                    return "VIP"
-                elif row['total_spent'] > 500 or row['purchase_frequency'] >= 1:
-                    return "Regular"
-                else:
-                    return "Occasional"
-            
-            customer_data['customer_segment'] = customer_data.apply(get_customer_segment, axis=1)
-            
-            # Create and insert documents
-            customer_behaviors = []
-            for idx, row in customer_data.iterrows():
-                behavior_id = f"behavior-{row['customer_id']}"
-                
-                behavior = {
-                    'id': behavior_id,
-                    'customer_id': str(row['customer_id']),
-                    'total_purchases': int(row['total_purchases']),
-                    'total_spent': float(row['total_spent']),
-                    'purchase_frequency': float(row['purchase_frequency']),
-                    'customer_segment': row['customer_segment']
-                }
-                customer_behaviors.append(behavior)
-                
-                # Insert into both DBs
-                low_db.customer_behavior.update_one({'id': behavior_id}, {'$set': behavior}, upsert=True)
-                high_db.customer_behavior.update_one({'id': behavior_id}, {'$set': behavior}, upsert=True)
-            
-            logger.info(f"Generated {len(customer_behaviors)} customer behavior records")
-        except Exception as e:
-            logger.error(f"Error processing customer behavior: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-        
-        # --- GENERATE OTHER ANALYTICAL DATA IF NEEDED ---
-        # Other analytical collections could be added here
-        
-        logger.info("Successfully processed analytics in background")
-    except Exception as e:
-        logger.error(f"Error processing analytics in background: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+        Returns:
+            tuple: (checkpoints keyed by row offset, chunk size used by that attempt)
+        """
+        object_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+        upload = self.low_db.raw_data_uploads.find_one(
+            {'_id': object_id}, {'checkpoints': 1, 'chunk_size': 1}
+        ) or {}
+        committed = {checkpoint['offset']: checkpoint for checkpoint in upload.get('checkpoints', [])}
+        return committed, upload.get('chunk_size')
+
+
+def _in_batches(items, size):
+    """Yield lists of up to ``size`` consecutive items of an iterable"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def transform_chunk(chunk_df, upload_id=None):
+    """
+    Build the documents for every ingest collection from a chunk in one pass.
+
+    All conversions are done on whole columns: dates are parsed once, the
+    ``ORD-`` order id is built once per row and reused for sales and reviews,
+    and reviews are split into low/high sets with a boolean mask.
+
+    Args:
+        chunk_df: DataFrame chunk with the retail CSV columns
+        upload_id: Upload every document is tagged with (see core/upload_rollback.py)
+
+    Returns:
+        dict: Lists of documents keyed by collection name ('customers',
+        'products', 'orders', 'sales', 'low_reviews', 'high_reviews')
+    """
+    order_dates = pd.to_datetime(chunk_df['order_date'])
+    customer_ids = chunk_df['customer_id'].astype('int64')
+    product_ids = chunk_df['product_id'].astype('int64')
+    quantities = chunk_df['quantity'].astype('int64')
+    revenue = (chunk_df['quantity'] * chunk_df['price']).astype('float64')
+
+    customer_keys = chunk_df['customer_id'].astype(str)
+    product_keys = chunk_df['product_id'].astype(str)
+    row_order_ids = order_ids(chunk_df, order_dates)
+
+    if 'review_score' in chunk_df.columns:
+        review_scores = pd.to_numeric(chunk_df['review_score'], errors='coerce')
+    else:
+        review_scores = pd.Series(np.nan, index=chunk_df.index)
+    has_review = review_scores.notna()
+
+    if 'payment_method' in chunk_df.columns:
+        payment_methods = chunk_df['payment_method']
+    else:
+        payment_methods = pd.Series('Cash', index=chunk_df.index)
+
+    # Dimension tables: the last occurrence of each key wins, as with repeated upserts
+    customers = pd.DataFrame({
+        'customer_id': customer_ids,
+        'gender': chunk_df['gender'].astype(str),
+        'age': chunk_df['age'].astype('int64'),
+        'city': chunk_df['city'].astype(str),
+    }).drop_duplicates('customer_id', keep='last')
+
+    products = pd.DataFrame({
+        'product_id': product_ids,
+        'product_name': chunk_df['product_name'].astype(str),
+        'category_id': chunk_df['category_id'].astype('int64'),
+        'category_name': chunk_df['category_name'].astype(str),
+        'price': chunk_df['price'].astype('float64'),
+    }).drop_duplicates('product_id', keep='last')
+
+    orders = pd.DataFrame({
+        'order_id': row_order_ids,
+        'order_date': order_dates,
+        'customer_id': customer_ids,
+        'product_id': product_ids,
+        'quantity': quantities,
+        'payment_method': payment_methods,
+        'review_score': review_scores.astype(object).where(has_review, None),
+    })
+
+    sales = pd.DataFrame({
+        'id': 'SALE-' + row_order_ids,
+        'customer_id': customer_keys,
+        'product_id': product_keys,
+        'quantity': quantities,
+        'sale_date': order_dates,
+        'revenue': revenue,
+        'profit': revenue * 0.3,
+        'city': chunk_df['city'],
+    })
+
+    review_text = chunk_df['review_text'] if 'review_text' in chunk_df.columns else ''
+    reviews = pd.DataFrame({
+        'id': 'REV-' + row_order_ids,
+        'customer_id': customer_keys,
+        'product_id': product_keys,
+        'review_score': review_scores,
+        'sentiment': np.select(
+            [review_scores >= 4, review_scores <= 2],
+            ['Positive', 'Negative'],
+            default='Neutral'
+        ),
+        'review_text': review_text,
+        'review_date': order_dates,
+    })[has_review]
+    is_low = reviews['review_score'] < 4
+
+    if upload_id is not None:
+        for frame in (customers, products, orders, sales, reviews):
+            frame[UPLOAD_TAG] = upload_id
+
+    return {
+        'customers': customers.to_dict('records'),
+        'products': products.to_dict('records'),
+        'orders': orders.to_dict('records'),
+        'sales': sales.to_dict('records'),
+        'low_reviews': reviews[is_low].to_dict('records'),
+        'high_reviews': reviews[~is_low].to_dict('records'),
+    }
@@ -8,9 +8,149 @@ functionality in the DashAnalytics application.
 # Bulk processing settings
 BULK_PROCESSING = {
     'CHUNK_SIZE': 1000,          # Number of records to process in a single batch
-    'MAX_THREADS': 4,            # Maximum number of worker threads for parallel processing
+    'MAX_THREADS': 4,            # Number of writer threads draining batches into MongoDB
+    'TRANSFORM_PROCESSES': 2,    # Worker processes turning raw chunks into documents (0 = inline)
+    'WRITE_QUEUE_DEPTH': 8,      # Maximum transformed batches waiting for a writer thread
+    'REPLICA_WRITE_THREADS': 8,  # Shared threads fanning replicated writes out to both databases
+    'ROW_DEDUP': True,           # Skip rows already ingested by an earlier upload (delta re-ingestion)
     'LARGE_FILE_THRESHOLD': 5,   # Size in MB to trigger background processing
-    'MEMORY_LIMIT': 512,         # Maximum memory usage in MB before switching to disk-based processing
+    'MEMORY_LIMIT': 512,         # Resident memory in MB above which streaming ingest stops reading until in-flight chunks drain
+}
+
+# Adaptive bulk_write batch sizing (see core/adaptive_batching.py)
+ADAPTIVE_BATCHING = {
+    'TARGET_LATENCY_MS': 250,    # Latency each bulk_write call should stay close to
+    'MIN_BATCH_SIZE': 50,        # Smallest number of operations per bulk_write
+    'MAX_BATCH_SIZE': 5000,      # Largest number of operations per bulk_write
+    'INITIAL_BATCH_SIZE': 500,   # Starting batch size for a collection
+    'SMOOTHING': 0.3,            # Weight of the newest sample in latency/throughput averages
+}
+
+# Column schema of the retail CSV, compiled by core/schema_validation.py.
+# Columns are required unless 'required' is False; rows breaking a rule are
+# written to a rejected-rows file instead of failing their chunk.
+RETAIL_CSV_SCHEMA = {
+    'customer_id': {'type': 'int', 'min': 1},
+    'order_date': {'type': 'datetime'},
+    'product_id': {'type': 'int', 'min': 1},
+    'category_id': {'type': 'int'},
+    'category_name': {'type': 'str'},
+    'product_name': {'type': 'str'},
+    'quantity': {'type': 'int', 'min': 1},
+    'price': {'type': 'float', 'min': 0},
+    'payment_method': {'type': 'str', 'required': False},
+    'city': {'type': 'str'},
+    'review_score': {'type': 'float', 'required': False, 'min': 1, 'max': 5},
+    'gender': {'type': 'str', 'required': False},
+    'age': {'type': 'int', 'min': 0, 'max': 120},
+}
+
+SCHEMA_VALIDATION = {
+    'ENABLED': True,             # Validate and coerce rows against RETAIL_CSV_SCHEMA before transforming
+    'REJECTS_DIR': None,         # Directory for rejected-row files (defaults to a temp subdirectory)
+}
+
+# Per-upload customer/product registry (see core/dimension_cache.py)
+DIMENSION_CACHE = {
+    'ENABLED': True,             # Upsert each new or changed dimension row once per upload
+    'FLUSH_ROWS': 5000,          # Queued dimension rows at which they are written
+}
+
+# Parse-while-receiving uploads (see core/streaming_upload.py)
+STREAMING_UPLOAD = {
+    'PIPE_DEPTH': 64,            # Received body chunks (64KB each) buffered ahead of the parser
+    'READ_BUFFER': 1024 * 1024,  # Read buffer in bytes between the pipe and the CSV parser
+}
+
+# Ingest engine strategies (see core/ingest_strategies.py)
+INGEST_ENGINE = {
+    'TRANSFORM': 'columnar',     # 'columnar' or 'rows'
+    'WRITE': 'upsert',           # 'upsert', 'idempotent' or 'staged_merge' (needs MongoDB 4.2+)
+    'ANALYTICS': 'incremental',  # 'incremental', 'rebuild' or 'none'
+}
+
+# Server-side merge of staged documents for the 'staged_merge' write strategy (see core/staged_merge.py)
+STAGED_MERGE = {
+    'COLLECTIONS': ['customers', 'products', 'orders', 'sales'],  # Collections written through staging
+    'READ_BATCH_SIZE': 10000,    # Staged sales or row hashes read back per batch after the merge
+}
+
+# Chunk-parallel ingest of large spooled uploads across Celery workers (see core/distributed_ingest.py)
+DISTRIBUTED_INGEST = {
+    'ENABLED': False,            # Split large background uploads into row-range tasks run as a chord
+    'MIN_FILE_MB': 50,           # Smallest spooled file in MB that is split
+    'ROWS_PER_TASK': 50000,      # Target rows per range task (rounded down to whole chunks)
+}
+
+# Bulk-load mode for very large uploads (see core/bulk_load.py)
+BULK_LOAD = {
+    'ENABLED': False,            # Drop non-unique secondary indexes while loading large uploads, then rebuild them
+    'MIN_FILE_MB': 200,          # Smallest spooled file in MB loaded in bulk-load mode
+    'COLLECTIONS': ['orders', 'sales', 'low_reviews', 'high_reviews'],  # Collections whose indexes are deferred
+}
+
+# Full analytics rebuilds loaded into shadow collections and swapped in by rename (see core/shadow_collections.py)
+ANALYTICS_REBUILD = {
+    'INSERT_BATCH_SIZE': 10000,  # Documents per unordered insert_many into a shadow collection
+    'COLLECTIONS': ['sales_trends', 'customer_behavior', 'product_performance', 'category_performance'],
+}
+
+# Parsed, validated uploads kept as Arrow IPC for resumes and reprocessing (see core/parsed_spool.py)
+PARSED_SPOOL = {
+    'ENABLED': True,             # Write each upload's validated chunks to a memory-mappable spool linked from its record
+    'DIR': None,                 # Directory for spool files (defaults to a temp subdirectory)
+    'RETENTION_DAYS': 7,         # Days a spool is kept before db_maintenance.py --clean-temp removes it
+}
+
+# Removal of everything one upload wrote (see core/upload_rollback.py)
+UPLOAD_ROLLBACK = {
+    'KEY_BATCH_SIZE': 10000,     # Customer/product keys per orphan check and delete
+}
+
+# Cooperative cancellation of running uploads (see core/upload_cancellation.py)
+UPLOAD_CANCELLATION = {
+    'POLL_INTERVAL': 2.0,        # Seconds between checks of the upload record for a cancel request from another process
+}
+
+# Archives and watched directories of files ingested as one upload (see core/batch_ingest.py)
+BATCH_INGEST = {
+    'MAX_PARALLEL_FILES': 4,     # Files of one batch ingested at the same time (each is also admitted by the scheduler)
+    'MAX_ARCHIVE_MB': 4096,      # Largest total uncompressed size of the files in an archive
+    'SETTLE_SECONDS': 30,        # Seconds a file in a watched directory must be unmodified before it is picked up
+    'WATCH_INTERVAL': 60,        # Seconds between scans of a watched directory
+}
+
+# Newline-delimited JSON order events written in micro-batches (see core/event_ingest.py)
+EVENT_INGEST = {
+    'MAX_BATCH_EVENTS': 5000,    # Buffered events at which a micro-batch is written
+    'MAX_BATCH_SECONDS': 5.0,    # Longest an event waits in the buffer before its batch is written
+    'MAX_BUFFERED_EVENTS': 100000,  # Events buffered per process before requests are refused
+    'ANALYTICS_REFRESH_INTERVAL': 300,  # Seconds between refreshes of growth rates, shares and segments
+    'WAIT_TIMEOUT': 30,          # Seconds a request asking to wait for its events to be written may block
+    'MAX_ERRORS_REPORTED': 20,   # Rejected events described in a response
+}
+
+# Admission control and fair scheduling of concurrent ingests (see core/ingest_scheduler.py)
+INGEST_SCHEDULER = {
+    'ENABLED': True,             # Queue ingests until write capacity is free
+    'WRITE_SLOTS': 16,           # Concurrent database work the cluster can take, in writer threads
+    'READ_RESERVED_SLOTS': 4,    # Of those, never handed to ingests so dashboard reads stay responsive
+    'MIN_SLOTS': 1,              # Fewest writer threads an ingest is admitted with
+    'POLL_INTERVAL': 2.0,        # Seconds between admission attempts of a queued ingest
+    'HEARTBEAT_INTERVAL': 10.0,  # Seconds between heartbeats (and ETA updates) of a queued or running ingest
+    'STALE_AFTER': 120,          # Seconds without a heartbeat after which an ingest's slots are reclaimed
+    'SYNC_WAIT': 30,             # Seconds a request-thread upload waits for admission before being refused
+    'DEFAULT_ROWS_PER_SLOT_SECOND': 500,  # Throughput assumed for ETAs until ingests have been measured
+    'DEFAULT_BYTES_PER_ROW': 120,         # Row size assumed when estimating rows from a file size
+}
+
+# Upload progress reporting
+UPLOAD_PROGRESS = {
+    'FLUSH_INTERVAL': 2.0,       # Minimum seconds between progress writes to the upload record
+    'STREAM_POLL_INTERVAL': 2.0, # Seconds between database reads for uploads running in another process
+    'STREAM_HEARTBEAT': 15,      # Seconds between keep-alive comments on an idle status stream
+    'STREAM_TIMEOUT': 3600,      # Maximum lifetime of a status stream in seconds
+    'RETENTION': 600,            # Seconds finished uploads stay in the in-process progress channel
 }
 
 # MongoDB optimization settings
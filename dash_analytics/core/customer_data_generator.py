@@ -159,6 +159,41 @@ def generate_sample_sales(num_sales=1000):
     return num_sales
 
 
+def generate_retail_dataframe(num_rows=10000, seed=42):
+    """
+    Generate an in-memory DataFrame shaped like the retail CSV upload.
+
+    Used by the ingest benchmarks; nothing is written to the database.
+    """
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    categories = np.array(['Electronics', 'Clothing', 'Home', 'Books', 'Beauty'])
+    category_ids = rng.integers(1, len(categories) + 1, num_rows)
+    product_ids = rng.integers(100, 1000, num_rows)
+    review_scores = rng.integers(1, 6, num_rows).astype(float)
+    review_scores[rng.random(num_rows) < 0.2] = np.nan  # Some orders have no review
+    order_dates = (pd.Timestamp('2024-01-01')
+                   + pd.to_timedelta(rng.integers(0, 730, num_rows), unit='D'))
+
+    return pd.DataFrame({
+        'customer_id': rng.integers(10000, 60000, num_rows),
+        'order_date': order_dates.strftime('%Y-%m-%d'),
+        'product_id': product_ids,
+        'category_id': category_ids * 10,
+        'category_name': categories[category_ids - 1],
+        'product_name': np.char.add('Product ', product_ids.astype(str)),
+        'quantity': rng.integers(1, 6, num_rows),
+        'price': np.round(rng.uniform(10, 1000, num_rows), 2),
+        'payment_method': rng.choice(['Credit Card', 'Cash', 'PayPal', 'Bank Transfer'], num_rows),
+        'city': np.char.add('City', rng.integers(1, 50, num_rows).astype(str)),
+        'review_score': review_scores,
+        'gender': rng.choice(['F', 'M'], num_rows),
+        'age': rng.integers(18, 80, num_rows),
+    })
+
+
 if __name__ == "__main__":
     # This can be run as a standalone script
     generate_sample_sales(1000)
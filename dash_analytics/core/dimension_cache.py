@@ -0,0 +1,137 @@
+"""
+Per-Upload Dimension Registry
+
+Customers and products repeat across the chunks of an upload, and every
+chunk used to upsert all of the ones it contained into both databases. The
+registry remembers a content hash per dimension key for the duration of an
+upload, seeded from what is already stored, and only queues rows that are
+new or changed. Queued rows are written in a few large batches. The files
+of a multi-file upload share one registry (see core/batch_ingest.py).
+"""
+
+import hashlib
+import logging
+import threading
+from core.csv_processing_config import DIMENSION_CACHE
+from core.upload_rollback import UPLOAD_TAG
+
+logger = logging.getLogger(__name__)
+
+# Dimension collection -> key field
+DIMENSION_KEYS = {
+    'customers': 'customer_id',
+    'products': 'product_id',
+}
+
+
+def _normalize(value):
+    """Return a value with numpy scalars converted so stored and new values hash alike"""
+    return value.item() if hasattr(value, 'item') else value
+
+
+def content_hash(document):
+    """
+    Return a hash of a dimension row's fields, independent of field order
+
+    The upload tag is left out, so a row another upload already stored
+    unchanged is not written again just to retag it.
+    """
+    items = sorted((field, repr(_normalize(value))) for field, value in document.items()
+                   if field not in ('_id', UPLOAD_TAG))
+    return hashlib.sha1(repr(items).encode('utf-8')).hexdigest()
+
+
+class DimensionRegistry:
+    """
+    Tracks the dimension rows of one upload and queues only the changed ones
+    """
+    def __init__(self, db, flush_rows=None):
+        """
+        Args:
+            db: Database holding the authoritative copy of the dimensions
+            flush_rows: Queued rows at which a flush is due
+                (defaults to DIMENSION_CACHE['FLUSH_ROWS'])
+        """
+        self.db = db
+        self.flush_rows = flush_rows or DIMENSION_CACHE['FLUSH_ROWS']
+        self._hashes = {collection_name: {} for collection_name in DIMENSION_KEYS}
+        self._pending = {collection_name: {} for collection_name in DIMENSION_KEYS}
+        self._lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.seen = 0
+        self.queued = 0
+        self.failures = 0  # Flushes that could not write every row
+
+    def stage(self, documents):
+        """
+        Take the dimension rows out of a transformed chunk, queueing the changed ones
+
+        Args:
+            documents: Output of transform_chunk; its dimension lists are emptied
+        """
+        for collection_name, key_field in DIMENSION_KEYS.items():
+            rows = documents.get(collection_name) or []
+            documents[collection_name] = []
+            if not rows:
+                continue
+            with self._lock:
+                known = self._hashes[collection_name]
+                unknown_keys = [row[key_field] for row in rows if row[key_field] not in known]
+                if unknown_keys:
+                    self._load_stored(collection_name, key_field, unknown_keys, rows[0].keys())
+                pending = self._pending[collection_name]
+                for row in rows:
+                    self.seen += 1
+                    row_hash = content_hash(row)
+                    if known.get(row[key_field]) == row_hash:
+                        continue
+                    known[row[key_field]] = row_hash
+                    if row[key_field] not in pending:
+                        self.queued += 1
+                    pending[row[key_field]] = row
+
+    def _load_stored(self, collection_name, key_field, keys, fields):
+        """Seed hashes for keys not seen yet in this upload from the stored rows"""
+        projection = {field: 1 for field in fields}
+        projection['_id'] = 0
+        try:
+            for stored in self.db[collection_name].find({key_field: {'$in': keys}}, projection):
+                self._hashes[collection_name][stored[key_field]] = content_hash(stored)
+        except Exception as e:
+            # Without stored hashes every row counts as changed, which is safe
+            logger.error(f"Error loading stored {collection_name}: {str(e)}")
+
+    def pending_rows(self):
+        """Return the number of rows queued for writing"""
+        with self._lock:
+            return sum(len(pending) for pending in self._pending.values())
+
+    def should_flush(self):
+        """Whether queued rows should be written now (nothing queued counts as flushed)"""
+        pending_rows = self.pending_rows()
+        return pending_rows == 0 or pending_rows >= self.flush_rows
+
+    def take_pending(self):
+        """
+        Remove and return the queued rows
+
+        Returns:
+            list: (collection name, list of rows) pairs
+        """
+        with self._lock:
+            taken = [(collection_name, list(pending.values()))
+                     for collection_name, pending in self._pending.items() if pending]
+            self._pending = {collection_name: {} for collection_name in DIMENSION_KEYS}
+        return taken
+
+    def forget(self, collection_name, rows):
+        """Drop the hashes of rows whose write failed so they are queued again when seen"""
+        key_field = DIMENSION_KEYS[collection_name]
+        with self._lock:
+            self.failures += 1
+            for row in rows:
+                self._hashes[collection_name].pop(row[key_field], None)
+
+    def summary(self):
+        """Return how many dimension rows were seen and how many were queued for writing"""
+        return {'dimension_rows_seen': self.seen, 'dimension_rows_written': self.queued}
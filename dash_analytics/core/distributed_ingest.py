@@ -0,0 +1,147 @@
+"""
+Chunk-Parallel Ingest of Large Uploads
+
+A spooled upload is split into row ranges that separate Celery tasks ingest
+concurrently, so one upload can keep a whole worker fleet busy. Ranges are
+whole multiples of the chunk size, which keeps chunk offsets, checkpoints
+and resume identical to a single-task ingest. A chord callback merges the
+range statistics and finalizes the upload once.
+
+Plain CSV files are split on record boundaries found by one scan over the
+bytes; each task seeks straight to its range. Columnar files are split by
+row count. Compressed CSV cannot be entered mid-stream and is ingested by a
+single task.
+"""
+
+import io
+import logging
+import pandas as pd
+from core.bulk_processor import merge_write_counts
+from core.csv_processing_config import DISTRIBUTED_INGEST
+from core.upload_formats import COLUMNAR_FORMATS, columnar_row_count, detect_compression, iter_columnar_range
+
+logger = logging.getLogger(__name__)
+
+# Statistics that are not summed when the ranges of an upload are merged
+_MAX_STATS = ('peak_memory_mb',)
+_SKIPPED_STATS = ('rejected_file_path', 'processing_time', 'error')
+
+
+def plan_ranges(file_path, file_format, chunk_size, rows_per_task=None):
+    """
+    Split a spooled upload into row ranges for separate ingest tasks
+
+    Args:
+        file_path: Path of the spooled file, readable by every worker
+        file_format: Format from core.upload_formats.detect_file_format
+        chunk_size: Rows per chunk of the bulk processor
+        rows_per_task: Target rows per range (defaults to DISTRIBUTED_INGEST['ROWS_PER_TASK'])
+
+    Returns:
+        list: Range dicts with 'offset' and 'row_count' (plus byte positions
+        for CSV), or None if the file cannot be split
+    """
+    rows_per_task = rows_per_task or DISTRIBUTED_INGEST['ROWS_PER_TASK']
+    # Whole chunks per range, so chunk offsets match a single-task ingest
+    rows_per_range = max(1, rows_per_task // chunk_size) * chunk_size
+
+    if file_format in COLUMNAR_FORMATS:
+        total_rows = columnar_row_count(file_path, file_format)
+        return [
+            {'offset': offset, 'row_count': min(rows_per_range, total_rows - offset)}
+            for offset in range(0, total_rows, rows_per_range)
+        ]
+    if detect_compression(file_path):
+        return None
+    return _plan_csv_ranges(file_path, rows_per_range)
+
+
+def _plan_csv_ranges(file_path, rows_per_range):
+    """Find the byte positions of every ``rows_per_range`` CSV records"""
+    ranges = []
+    header_end = None
+    range_start = None
+    range_rows = 0
+    offset = 0
+    in_quotes = False
+    with open(file_path, 'rb') as csv_file:
+        for line in iter(csv_file.readline, b''):
+            # A quoted field may span lines; a record ends on a line that
+            # leaves no quote open
+            if line.count(b'"') % 2:
+                in_quotes = not in_quotes
+            if in_quotes:
+                continue
+            if header_end is None:
+                header_end = range_start = csv_file.tell()
+                continue
+            if not line.strip():
+                # The CSV parser skips blank lines, so they are not rows
+                continue
+            range_rows += 1
+            if range_rows == rows_per_range:
+                range_end = csv_file.tell()
+                ranges.append({'offset': offset, 'row_count': range_rows, 'header_end': header_end,
+                               'byte_start': range_start, 'byte_end': range_end})
+                offset += range_rows
+                range_start = range_end
+                range_rows = 0
+        if range_rows:
+            ranges.append({'offset': offset, 'row_count': range_rows, 'header_end': header_end,
+                           'byte_start': range_start, 'byte_end': csv_file.tell()})
+    return ranges
+
+
+def iter_range_chunks(file_path, file_format, task_range, chunk_size):
+    """
+    Yield the rows of one planned range as DataFrame chunks
+
+    Args:
+        file_path: Path of the spooled file
+        file_format: Format the range was planned for
+        task_range: Range dict from plan_ranges
+        chunk_size: Rows per chunk
+
+    Yields:
+        pandas.DataFrame: Consecutive chunks of the range
+    """
+    if file_format in COLUMNAR_FORMATS:
+        yield from iter_columnar_range(file_path, file_format, task_range['offset'],
+                                       task_range['row_count'], chunk_size)
+        return
+
+    with open(file_path, 'rb') as csv_file:
+        header = csv_file.read(task_range['header_end'])
+        csv_file.seek(task_range['byte_start'])
+        data = csv_file.read(task_range['byte_end'] - task_range['byte_start'])
+    reader = pd.read_csv(io.BytesIO(header + data), chunksize=chunk_size)
+    with reader:
+        yield from reader
+
+
+
+def merge_range_stats(results):
+    """
+    Combine the processing statistics of the ranges of one upload
+
+    Counts are summed, peak memory is the maximum over the ranges and write
+    counts are merged per database. The months spanned before the upload are
+    the smallest any range saw, since the span only grows while ranges load.
+    """
+    merged = {'database_writes': {}, 'analytics_period_types': set(), 'analytics_customers': set(),
+              'analytics_months': None}
+    for result in results:
+        for key, value in result.items():
+            if key == 'database_writes':
+                merge_write_counts(merged['database_writes'], value)
+            elif key in ('analytics_period_types', 'analytics_customers'):
+                merged[key].update(value)
+            elif key == 'analytics_months':
+                if value is not None:
+                    merged[key] = value if merged[key] is None else min(merged[key], value)
+            elif key in _MAX_STATS:
+                merged[key] = max(merged.get(key, 0), value)
+            elif key not in _SKIPPED_STATS and isinstance(value, (int, float)):
+                merged[key] = merged.get(key, 0) + value
+    merged['processing_time'] = 0
+    return merged
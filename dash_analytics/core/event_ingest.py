@@ -0,0 +1,250 @@
+"""
+Streaming Order Event Ingestion
+
+Order events arrive as newline-delimited JSON, one object per line with the
+retail CSV columns as keys. Each request's events are validated against the
+retail schema as they arrive, and the valid ones are appended to a
+per-process buffer. A background thread writes the buffer as a micro-batch
+once it holds ``EVENT_INGEST['MAX_BATCH_EVENTS']`` events or its oldest
+event has waited ``EVENT_INGEST['MAX_BATCH_SECONDS']``, through
+BulkDataProcessor.write_micro_batch: the same upserts, sharded review
+inserts, row dedup and incremental analytics as an upload, without an
+upload record or a post-upload analytics pass.
+
+Batches are written with the 'idempotent' write strategy, so a batch that
+fails is simply written again with the next one, and a client resending
+events does not duplicate reviews. Events only live in memory until their
+batch is written; clients that need to know they are stored can wait for
+it (see EventBatcher.wait_written).
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+from core.bulk_processor import BulkDataProcessor, merge_write_counts
+from core.csv_processing_config import EVENT_INGEST, RETAIL_CSV_SCHEMA
+from core.schema_validation import get_retail_schema
+
+logger = logging.getLogger(__name__)
+
+
+class EventBufferFull(Exception):
+    """Raised when accepting events would exceed EVENT_INGEST['MAX_BUFFERED_EVENTS']"""
+
+
+def parse_event_lines(lines, first_line=1):
+    """
+    Parse newline-delimited JSON events and validate them against the retail schema
+
+    Args:
+        lines: Iterable of lines (bytes or str); blank lines are skipped
+        first_line: Number of the first line, for error reports
+
+    Returns:
+        tuple: (valid events as a coerced DataFrame, list of
+        {'line': n, 'reason': str} for every rejected event)
+    """
+    events, line_numbers, errors = [], [], []
+    for line_number, line in enumerate(lines, first_line):
+        if not line.strip():
+            continue
+        try:
+            event = json.loads(line)
+        except ValueError as e:
+            errors.append({'line': line_number, 'reason': f"invalid JSON: {str(e)}"})
+            continue
+        if not isinstance(event, dict):
+            errors.append({'line': line_number, 'reason': 'not a JSON object'})
+            continue
+        events.append(event)
+        line_numbers.append(line_number)
+
+    if not events:
+        return pd.DataFrame(columns=list(RETAIL_CSV_SCHEMA)), errors
+    # Events missing a key are rejected one by one rather than failing the request
+    frame = pd.DataFrame.from_records(events)
+    frame = frame.reindex(columns=list(dict.fromkeys([*RETAIL_CSV_SCHEMA, *frame.columns])))
+    valid, rejected = get_retail_schema().validate(frame)
+    errors.extend(
+        {'line': line_numbers[position], 'reason': reason}
+        for position, reason in zip(rejected.index, rejected['rejected_reason'])
+    )
+    errors.sort(key=lambda error: error['line'])
+    return valid, errors
+
+
+class EventBatcher:
+    """
+    Buffers validated events and writes them in micro-batches from a background thread
+    """
+    def __init__(self, processor=None, max_events=None, max_seconds=None, max_buffered=None,
+                 refresh_interval=None):
+        """
+        Args:
+            processor: BulkDataProcessor the batches are written with (created on first write)
+            max_events: Buffered events at which a batch is written
+            max_seconds: Longest an event waits before its batch is written
+            max_buffered: Events buffered before submissions are refused
+            refresh_interval: Seconds between refreshes of the derived analytics
+                (all default to EVENT_INGEST)
+        """
+        self._processor = processor
+        self.max_events = max_events or EVENT_INGEST['MAX_BATCH_EVENTS']
+        self.max_seconds = max_seconds or EVENT_INGEST['MAX_BATCH_SECONDS']
+        self.max_buffered = max_buffered or EVENT_INGEST['MAX_BUFFERED_EVENTS']
+        self.refresh_interval = refresh_interval or EVENT_INGEST['ANALYTICS_REFRESH_INTERVAL']
+        self._frames = deque()
+        self._buffered = 0
+        self._oldest = None
+        self._submitted = 0
+        self._written_through = 0
+        self._batches = 0
+        self._refreshed_at = time.monotonic()
+        self._retry_at = 0.0
+        self._flush_requested = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {
+            'events_written': 0,
+            'duplicate_events': 0,
+            'batches_written': 0,
+            'batches_failed': 0,
+            'database_writes': {}
+        }
+
+    def submit(self, events_df):
+        """
+        Add validated events to the buffer
+
+        Returns:
+            int: Sequence number to pass to wait_written
+
+        Raises:
+            EventBufferFull: If the buffer has no room for the events
+        """
+        with self._cond:
+            if self._buffered + len(events_df) > self.max_buffered:
+                raise EventBufferFull(
+                    f"{len(events_df)} events do not fit in the buffer ({self._buffered} of {self.max_buffered} waiting to be written)"
+                )
+            if len(events_df):
+                if self._oldest is None:
+                    self._oldest = time.monotonic()
+                self._frames.append(events_df)
+                self._buffered += len(events_df)
+                self._submitted += len(events_df)
+                self._ensure_thread()
+                self._cond.notify_all()
+            return self._submitted
+
+    def wait_written(self, sequence, timeout=None):
+        """Block until every event up to a sequence number is written; returns whether it was"""
+        deadline = time.monotonic() + (timeout if timeout is not None else EVENT_INGEST['WAIT_TIMEOUT'])
+        with self._cond:
+            while self._written_through < sequence:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def flush(self, timeout=None):
+        """Write everything buffered now instead of waiting for the batch to fill"""
+        with self._cond:
+            self._flush_requested = True
+            self._retry_at = 0.0
+            sequence = self._submitted
+            self._cond.notify_all()
+        return self.wait_written(sequence, timeout)
+
+    def buffered(self):
+        """Return the number of events waiting to be written"""
+        with self._cond:
+            return self._buffered
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='event-batcher', daemon=True)
+            self._thread.start()
+
+    def _due_in(self):
+        """Seconds until a batch is due (0 if it is due now, None if the buffer is empty)"""
+        if not self._buffered:
+            return None
+        now = time.monotonic()
+        if now < self._retry_at:
+            return self._retry_at - now
+        if self._flush_requested or self._buffered >= self.max_events:
+            return 0
+        return max(0.0, self._oldest + self.max_seconds - now)
+
+    def _run(self):
+        """Background thread body: write the buffer whenever a batch is due"""
+        while True:
+            with self._cond:
+                due_in = self._due_in()
+                while due_in is None or due_in > 0:
+                    self._cond.wait(due_in)
+                    due_in = self._due_in()
+                frames = list(self._frames)
+                self._frames.clear()
+                self._flush_requested = False
+            self._write(pd.concat(frames, ignore_index=True))
+
+    def _write(self, events_df):
+        """Write buffered events in batches of at most max_events, requeueing what fails"""
+        for start in range(0, len(events_df), self.max_events):
+            batch = events_df.iloc[start:start + self.max_events]
+            refresh = time.monotonic() - self._refreshed_at >= self.refresh_interval
+            try:
+                batch_stats = self._get_processor().write_micro_batch(batch, self._batches, refresh_analytics=refresh)
+                if batch_stats['failed_records']:
+                    raise RuntimeError(f"{batch_stats['failed_records']} events could not be written")
+            except Exception as e:
+                logger.error(f"Error writing event batch {self._batches}, retrying: {str(e)}")
+                with self._cond:
+                    # Back to the front of the buffer, written again after a pause
+                    self._frames.appendleft(events_df.iloc[start:])
+                    self._oldest = time.monotonic()
+                    self._retry_at = time.monotonic() + self.max_seconds
+                    self.stats['batches_failed'] += 1
+                return
+            self._batches += 1
+            if refresh:
+                self._refreshed_at = time.monotonic()
+            with self._cond:
+                self._buffered -= len(batch)
+                self._written_through += len(batch)
+                if not self._buffered:
+                    self._oldest = None
+                self.stats['events_written'] += batch_stats['processed_records']
+                self.stats['duplicate_events'] += batch_stats['duplicate_records']
+                self.stats['batches_written'] += 1
+                merge_write_counts(self.stats['database_writes'], batch_stats['database_writes'])
+                self._cond.notify_all()
+
+    def _get_processor(self):
+        if self._processor is None:
+            self._processor = BulkDataProcessor(
+                chunk_size=self.max_events, transform_processes=0,
+                write_strategy='idempotent', analytics_strategy='incremental'
+            )
+        return self._processor
+
+
+_event_batcher = None
+_event_batcher_lock = threading.Lock()
+
+
+def get_event_batcher():
+    """Return the event batcher of this process"""
+    global _event_batcher
+    with _event_batcher_lock:
+        if _event_batcher is None:
+            _event_batcher = EventBatcher()
+    return _event_batcher
@@ -1,15 +1,14 @@
 """
 Fixed Bulk Processor Implementation 
-- Correctly updates all MongoDB collections during CSV uploads
-- Avoids errors in bulk operations
+- The ingest engine with the 'idempotent' write strategy, so re-uploads never duplicate reviews
+- Regenerates product, category, demographic, geographic and prediction analytics after each upload
 - Uses proper error handling
 """
 
 from core.bulk_processor import BulkDataProcessor as OriginalBulkProcessor
-from mongoengine import get_db
+from core.csv_processing_config import BULK_PROCESSING
 import logging
 import pandas as pd
-import pymongo
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -18,118 +17,17 @@ class FixedBulkProcessor(OriginalBulkProcessor):
     """
     An enhanced version of BulkDataProcessor that fixes issues with collections not being updated
     """
+    # process_analytical_data also needs product, demographic and city columns
+    analytics_columns = OriginalBulkProcessor.analytics_columns + [
+        'product_id', 'product_name', 'category_name', 'age', 'gender', 'city'
+    ]
+    keeps_analytics_frame = True
     
-    def __init__(self, chunk_size=200, max_threads=4):
-        """Initialize with the original parameters"""
-        super().__init__(chunk_size=chunk_size, max_threads=max_threads)
+    def __init__(self, chunk_size=BULK_PROCESSING['CHUNK_SIZE'], max_threads=BULK_PROCESSING['MAX_THREADS'], **kwargs):
+        """Initialize with the original parameters; reviews are upserted so re-uploads never duplicate them"""
+        kwargs.setdefault('write_strategy', 'idempotent')
+        super().__init__(chunk_size=chunk_size, max_threads=max_threads, **kwargs)
     
-    def _bulk_upsert(self, documents, collection_name):
-        """
-        Fixed implementation of bulk upsert operations that works reliably
-        """
-        if not documents:
-            return
-        
-        try:
-            bulk_low_operations = []
-            bulk_high_operations = []
-            
-            for doc in documents:
-                # Determine unique key based on collection
-                if collection_name == 'customers':
-                    filter_query = {'customer_id': doc['customer_id']}
-                elif collection_name == 'products':
-                    filter_query = {'product_id': doc['product_id']}
-                elif collection_name == 'orders':
-                    filter_query = {'order_id': doc['order_id']}
-                elif collection_name == 'sales':
-                    filter_query = {'id': doc['id']}
-                else:
-                    filter_query = {'id': doc.get('id')}
-                
-                # Create bulk operations
-                bulk_low_operations.append(
-                    pymongo.UpdateOne(filter_query, {'$set': doc}, upsert=True)
-                )
-                bulk_high_operations.append(
-                    pymongo.UpdateOne(filter_query, {'$set': doc}, upsert=True)
-                )
-            
-            # Execute bulk operations
-            if bulk_low_operations:
-                self.low_db[collection_name].bulk_write(bulk_low_operations, ordered=False)
-            if bulk_high_operations:
-                self.high_db[collection_name].bulk_write(bulk_high_operations, ordered=False)
-            
-        except Exception:
-            pass
-            
-    def _bulk_insert(self, documents, collection_name, db=None):
-        """
-        Optimized bulk insert implementation using bulk operations
-        """
-        if not documents:
-            return
-        
-        try:
-            # Prepare bulk operations
-            bulk_low_operations = []
-            bulk_high_operations = []
-            
-            for doc in documents:
-                # Create insert operations
-                if db is None:
-                    # Use upsert to handle potential duplicates
-                    filter_query = {'id': doc.get('id')}
-                    bulk_low_operations.append(
-                        pymongo.UpdateOne(filter_query, {'$set': doc}, upsert=True)
-                    )
-                    bulk_high_operations.append(
-                        pymongo.UpdateOne(filter_query, {'$set': doc}, upsert=True)
-                    )
-                else:
-                    # For single db operations
-                    db_operations = []
-                    filter_query = {'id': doc.get('id')}
-                    db_operations.append(
-                        pymongo.UpdateOne(filter_query, {'$set': doc}, upsert=True)
-                    )
-                    db[collection_name].bulk_write(db_operations, ordered=False)
-            
-            # Execute bulk operations
-            if db is None:
-                if bulk_low_operations:
-                    self.low_db[collection_name].bulk_write(bulk_low_operations, ordered=False)
-                if bulk_high_operations:
-                    self.high_db[collection_name].bulk_write(bulk_high_operations, ordered=False)
-            
-        except Exception as e:
-            logger.error(f"Error during bulk operations: {str(e)}")
-
-    def _update_upload_status(self, upload_id, update_data):
-        """
-        Update the upload record status in both databases
-        """
-        try:
-            # Convert string ID to ObjectId if needed
-            from bson import ObjectId
-            if isinstance(upload_id, str):
-                object_id = ObjectId(upload_id)
-            else:
-                object_id = upload_id
-            
-            # Update both databases
-            self.low_db.raw_data_uploads.update_one(
-                {'_id': object_id}, 
-                {'$set': update_data}
-            )
-            self.high_db.raw_data_uploads.update_one(
-                {'_id': object_id}, 
-                {'$set': update_data}
-            )
-        except Exception:
-            # Continue silently
-            pass
     def process_analytical_data(self, df, upload_id):
         """
         Process analytical data from the DataFrame
@@ -151,157 +49,8 @@ class FixedBulkProcessor(OriginalBulkProcessor):
             import uuid
             from collections import defaultdict
             
-            # --- SALES TRENDS ---
-            sales_trends = []
-            
-            try:
-                df['order_date'] = pd.to_datetime(df['order_date'])
-                df_indexed = df.set_index('order_date')
-                
-                # Daily trends
-                daily_sales = df_indexed.resample('D').agg({
-                    'quantity': 'sum',
-                    'price': lambda x: (df_indexed.loc[x.index, 'quantity'] * x).sum() if not x.empty else 0
-                }).reset_index()
-                
-                daily_sales['total_sales'] = daily_sales['price']
-                daily_sales['sales_growth_rate'] = daily_sales['total_sales'].pct_change() * 100
-                daily_sales.fillna({'sales_growth_rate': 0}, inplace=True)
-                
-                total_daily_sales = daily_sales['total_sales'].sum()
-                daily_sales['sales_percentage'] = (daily_sales['total_sales'] / total_daily_sales) * 100 if total_daily_sales > 0 else 0
-                
-                # Create daily sales trends records
-                for idx, row in daily_sales.iterrows():
-                    period_value = row['order_date'].strftime('%Y-%m-%d')
-                    trend_id = f"trend-daily-{period_value}"
-                    
-                    trend = {
-                        'id': trend_id,
-                        'period_type': 'daily',
-                        'period_value': period_value,
-                        'total_sales': float(row['total_sales']),
-                        'sales_growth_rate': float(row['sales_growth_rate']),
-                        'sales_percentage': float(row['sales_percentage'])
-                    }
-                    sales_trends.append(trend)
-                
-                # Monthly trends
-                monthly_sales = df_indexed.resample('ME').agg({
-                    'quantity': 'sum',
-                    'price': lambda x: (df_indexed.loc[x.index, 'quantity'] * x).sum()
-                }).reset_index()
-                
-                monthly_sales['total_sales'] = monthly_sales['price']
-                # Calculate growth rates (with previous period)
-                monthly_sales['sales_growth_rate'] = monthly_sales['total_sales'].pct_change() * 100
-                monthly_sales.fillna({'sales_growth_rate': 0}, inplace=True)
-                
-                # Calculate percentage of total
-                total_sales = monthly_sales['total_sales'].sum()
-                monthly_sales['sales_percentage'] = (monthly_sales['total_sales'] / total_sales) * 100 if total_sales > 0 else 0
-                
-                # Create sales trends records
-                for idx, row in monthly_sales.iterrows():
-                    period_value = row['order_date'].strftime('%Y-%m')
-                    trend_id = f"trend-monthly-{period_value}"
-                    
-                    trend = {
-                        'id': trend_id,
-                        'period_type': 'monthly',
-                        'period_value': period_value,
-                        'total_sales': float(row['total_sales']),
-                        'sales_growth_rate': float(row['sales_growth_rate']),
-                        'sales_percentage': float(row['sales_percentage'])
-                    }
-                    sales_trends.append(trend)
-                
-                # Quarterly trends
-                quarterly_sales = df_indexed.resample('Q').agg({
-                    'quantity': 'sum',
-                    'price': lambda x: (df_indexed.loc[x.index, 'quantity'] * x).sum()
-                }).reset_index()
-                
-                quarterly_sales['total_sales'] = quarterly_sales['price']
-                quarterly_sales['sales_growth_rate'] = quarterly_sales['total_sales'].pct_change() * 100
-                quarterly_sales.fillna({'sales_growth_rate': 0}, inplace=True)
-                
-                total_quarterly_sales = quarterly_sales['total_sales'].sum()
-                quarterly_sales['sales_percentage'] = (quarterly_sales['total_sales'] / total_quarterly_sales) * 100 if total_quarterly_sales > 0 else 0
-                
-                for idx, row in quarterly_sales.iterrows():
-                    quarter = (row['order_date'].month - 1) // 3 + 1
-                    period_value = f"{row['order_date'].year}-Q{quarter}"
-                    trend_id = f"trend-quarterly-{period_value}"
-                    
-                    trend = {
-                        'id': trend_id,
-                        'period_type': 'quarterly',
-                        'period_value': period_value,
-                        'total_sales': float(row['total_sales']),
-                        'sales_growth_rate': float(row['sales_growth_rate']),
-                        'sales_percentage': float(row['sales_percentage'])
-                    }
-                    sales_trends.append(trend)
-                
-                # Weekly trends
-                weekly_sales = df_indexed.resample('W').agg({
-                    'quantity': 'sum',
-                    'price': lambda x: (df_indexed.loc[x.index, 'quantity'] * x).sum()
-                }).reset_index()
-                
-                weekly_sales['total_sales'] = weekly_sales['price']
-                weekly_sales['sales_growth_rate'] = weekly_sales['total_sales'].pct_change() * 100
-                weekly_sales.fillna({'sales_growth_rate': 0}, inplace=True)
-                
-                total_sales = weekly_sales['total_sales'].sum()
-                weekly_sales['sales_percentage'] = (weekly_sales['total_sales'] / total_sales) * 100 if total_sales > 0 else 0
-                
-                for idx, row in weekly_sales.iterrows():
-                    week_num = row['order_date'].isocalendar()[1]
-                    period_value = f"{row['order_date'].year}-W{week_num:02d}"
-                    trend_id = f"trend-weekly-{period_value}"
-                    
-                    trend = {
-                        'id': trend_id,
-                        'period_type': 'weekly',
-                        'period_value': period_value,
-                        'total_sales': float(row['total_sales']),
-                        'sales_growth_rate': float(row['sales_growth_rate']),
-                        'sales_percentage': float(row['sales_percentage'])
-                    }
-                    sales_trends.append(trend)
-                
-                # Yearly trends
-                yearly_sales = df_indexed.resample('Y').agg({
-                    'quantity': 'sum',
-                    'price': lambda x: (df_indexed.loc[x.index, 'quantity'] * x).sum()
-                }).reset_index()
-                
-                yearly_sales['total_sales'] = yearly_sales['price']
-                yearly_sales['sales_growth_rate'] = yearly_sales['total_sales'].pct_change() * 100
-                yearly_sales.fillna({'sales_growth_rate': 0}, inplace=True)
-                
-                total_yearly_sales = yearly_sales['total_sales'].sum()
-                yearly_sales['sales_percentage'] = (yearly_sales['total_sales'] / total_yearly_sales) * 100 if total_yearly_sales > 0 else 0
-                
-                for idx, row in yearly_sales.iterrows():
-                    period_value = str(row['order_date'].year)
-                    trend_id = f"trend-yearly-{period_value}"
-                    
-                    trend = {
-                        'id': trend_id,
-                        'period_type': 'yearly',
-                        'period_value': period_value,
-                        'total_sales': float(row['total_sales']),
-                        'sales_growth_rate': float(row['sales_growth_rate']),
-                        'sales_percentage': float(row['sales_percentage'])
-                    }
-                    sales_trends.append(trend)
-                  # Insert sales trends
-                self._bulk_upsert(sales_trends, 'sales_trends')
-            except Exception as e:
-                logger.error(f"Error processing sales trends: {str(e)}")
+            # Sales trends and customer behavior are maintained incrementally by the base processor
+            df['order_date'] = pd.to_datetime(df['order_date'])
             
             # --- PRODUCT PERFORMANCE ---
             logger.info("Generating product performance data...")
@@ -468,57 +217,6 @@ class FixedBulkProcessor(OriginalBulkProcessor):
             except Exception as e:
                 logger.error(f"Error processing geographical insights: {str(e)}")
             
-            # --- CUSTOMER BEHAVIOR ---
-            
-            try:
-                # Group by customer
-                customer_data = df.groupby('customer_id').agg({
-                    'order_date': 'count',  # Count purchases
-                    'price': lambda x: (df.loc[x.index, 'quantity'] * x).sum()
-                }).reset_index()
-                
-                customer_data.rename(columns={'order_date': 'total_purchases', 'price': 'total_spent'}, inplace=True)
-                
-                # Calculate purchase frequency (purchases per month)
-                min_date = df['order_date'].min()
-                max_date = df['order_date'].max()
-                
-                # Calculate number of months in the data
-                months_diff = (max_date.year - min_date.year) * 12 + (max_date.month - min_date.month)
-                months_diff = max(1, months_diff)  # Ensure at least 1 month
-                
-                customer_data['purchase_frequency'] = customer_data['total_purchases'] / months_diff
-                
-                # Define customer segments
-                def get_customer_segment(row):
-                    if row['total_spent'] > 1000 or row['purchase_frequency'] >= 2:
-                        return "VIP"
-                    elif row['total_spent'] > 500 or row['purchase_frequency'] >= 1:
-                        return "Regular"
-                    else:
-                        return "Occasional"
-                
-                customer_data['customer_segment'] = customer_data.apply(get_customer_segment, axis=1)
-                
-                customer_behaviors = []
-                
-                for idx, row in customer_data.iterrows():
-                    behavior_id = f"behavior-{row['customer_id']}"
-                    
-                    behavior = {
-                        'id': behavior_id,
-                        'customer_id': str(row['customer_id']),
-                        'total_purchases': int(row['total_purchases']),
-                        'total_spent': float(row['total_spent']),
-                        'purchase_frequency': float(row['purchase_frequency']),
-                        'customer_segment': row['customer_segment']
-                    }
-                    customer_behaviors.append(behavior)
-                  # Insert customer behaviors
-                self._bulk_upsert(customer_behaviors, 'customer_behavior')
-            except Exception as e:
-                logger.error(f"Error processing customer behavior: {str(e)}")
-            
             # --- PREDICTIONS ---
             
             try:
@@ -542,8 +240,11 @@ class FixedBulkProcessor(OriginalBulkProcessor):
                     predictions.append(top_product_prediction)
                 
                 # If we have monthly sales data, make a growth prediction
-                if 'monthly_sales' in locals() and len(monthly_sales) > 2:
-                    avg_growth = monthly_sales['sales_growth_rate'].tail(3).mean()
+                recent_months = list(self.low_db.sales_trends.find(
+                    {'id': {'$regex': '^trend-monthly-'}}, {'_id': 0, 'sales_growth_rate': 1}
+                ).sort('period_value', -1).limit(3))
+                if len(recent_months) > 2:
+                    avg_growth = sum(trend.get('sales_growth_rate', 0) for trend in recent_months) / len(recent_months)
                     growth_prediction = {
                         'id': f"pred-sales-trend-{next_quarter}",
                         'prediction_type': 'future_sales_trend',
@@ -563,17 +264,16 @@ class FixedBulkProcessor(OriginalBulkProcessor):
         except Exception as e:
             logger.error(f"Error in process_analytical_data: {str(e)}")
             return False
-    def process_dataframe(self, df, upload_id):
+    def _run_analytics(self, analytics_df, upload_id):
         """
-        Process a pandas DataFrame in bulk with threading and also generate analytical data
+        Refresh the incremental analytics and regenerate the remaining analytical collections
         """
-        # First, call the parent class method to handle the basic data processing
-        result = super().process_dataframe(df, upload_id)
+        super()._run_analytics(analytics_df, upload_id)
+        if self.analytics_strategy == 'none':
+            return
         
         # Now process the analytical data
         try:
-            self.process_analytical_data(df, upload_id)
+            self.process_analytical_data(analytics_df, upload_id)
         except Exception as e:
             logger.error(f"Error during analytical data processing: {str(e)}")
-        
-        return result
@@ -0,0 +1,343 @@
+"""
+Incremental Sales Trend and Customer Behavior Analytics
+
+Each chunk of an upload is reduced to partial aggregates: sales, quantity and
+order counts per trend period, and purchases and spend per customer. Partials
+merge by addition, so any number of chunks can be combined in any order, and
+the merged deltas are applied to the stored documents with ``$inc``. Totals
+therefore accumulate across uploads instead of being overwritten by the
+latest upload alone. A chunk's partials are the totals of the sales it
+writes minus those of the stored sales they replace, so an order sent
+again is only counted once.
+
+Increments are upserted on the documents' ``id`` from several threads,
+processes and hosts at once (e.g. the ranges of a distributed ingest), so
+``ensure_analytics_indexes`` gives both collections a unique index on it;
+without one, two upserts of a new period or customer could each insert a
+document and split its totals between them.
+
+Ratios that depend on the totals (growth rate, share of sales, purchase
+frequency and segment) cannot be incremented; ``trend_ratio_updates`` and
+``customer_segment_updates`` recompute them from the stored totals once the
+deltas are in.
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Collections whose documents are upserted on their 'id' field by the increments
+ANALYTICS_COLLECTIONS = ('sales_trends', 'customer_behavior')
+
+
+def _weekly(dates):
+    iso = dates.dt.isocalendar()
+    return iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)
+
+
+def _quarterly(dates):
+    return dates.dt.year.astype(str) + '-Q' + dates.dt.quarter.astype(str)
+
+
+# Trend period type -> function mapping order dates to period values
+TREND_PERIODS = {
+    'daily': lambda dates: dates.dt.strftime('%Y-%m-%d'),
+    'weekly': _weekly,
+    'monthly': lambda dates: dates.dt.strftime('%Y-%m'),
+    'quarterly': _quarterly,
+    'yearly': lambda dates: dates.dt.year.astype(str),
+}
+
+# Customer segment thresholds, as (segment, minimum spend, minimum monthly purchases)
+CUSTOMER_SEGMENTS = [
+    ('VIP', 1000, 2),
+    ('Regular', 500, 1),
+]
+
+
+class AnalyticsPartials:
+    """
+    Additive sales trend and customer aggregates for a set of rows
+    """
+    def __init__(self):
+        # (period_type, period_value) -> [total_sales, total_quantity, total_orders]
+        self.trends = {}
+        # customer_id -> [total_purchases, total_spent]
+        self.customers = {}
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Aggregate a chunk of validated rows
+
+        Args:
+            df: DataFrame with customer_id, order_date, quantity and either
+                price or revenue
+        """
+        partials = cls()
+        if df.empty:
+            return partials
+        dates = pd.to_datetime(df['order_date'])
+        revenue = df['revenue'] if 'revenue' in df.columns else df['quantity'] * df['price']
+        revenue = revenue.astype('float64')
+        quantity = df['quantity'].astype('int64')
+
+        for period_type, to_period in TREND_PERIODS.items():
+            grouped = pd.DataFrame({
+                'period': to_period(dates), 'sales': revenue, 'quantity': quantity
+            }).groupby('period').agg(
+                total_sales=('sales', 'sum'), total_quantity=('quantity', 'sum'), total_orders=('sales', 'size')
+            )
+            for period, total_sales, total_quantity, total_orders in grouped.itertuples():
+                partials.trends[(period_type, period)] = [float(total_sales), int(total_quantity), int(total_orders)]
+
+        grouped = pd.DataFrame({'customer_id': df['customer_id'], 'spent': revenue}).groupby('customer_id').agg(
+            total_purchases=('spent', 'size'), total_spent=('spent', 'sum')
+        )
+        for customer_id, total_purchases, total_spent in grouped.itertuples():
+            partials.customers[customer_id] = [int(total_purchases), float(total_spent)]
+        return partials
+
+    def merge(self, other):
+        """Add another set of partials into this one and return it"""
+        for totals, other_totals in ((self.trends, other.trends), (self.customers, other.customers)):
+            for key, values in other_totals.items():
+                current = totals.get(key)
+                totals[key] = list(values) if current is None else [a + b for a, b in zip(current, values)]
+        return self
+
+    def negated(self):
+        """Return partials that undo these ones when applied"""
+        negated = AnalyticsPartials()
+        negated.trends = {key: [-value for value in values] for key, values in self.trends.items()}
+        negated.customers = {key: [-value for value in values] for key, values in self.customers.items()}
+        return negated
+
+    def drop_unchanged(self):
+        """Remove totals whose deltas are all zero and return the partials"""
+        for totals in (self.trends, self.customers):
+            for key in [key for key, values in totals.items() if not any(values)]:
+                del totals[key]
+        return self
+
+    def is_empty(self):
+        return not self.trends and not self.customers
+
+    def period_types(self):
+        return {period_type for period_type, _ in self.trends}
+
+    def trend_operations(self):
+        """Return ``$inc`` upserts applying the trend deltas"""
+        operations = []
+        for (period_type, period_value), (total_sales, total_quantity, total_orders) in self.trends.items():
+            trend_id = f"trend-{period_type}-{period_value}"
+            operations.append(UpdateOne(
+                {'id': trend_id},
+                {
+                    '$inc': {'total_sales': total_sales, 'total_quantity': total_quantity, 'total_orders': total_orders},
+                    '$setOnInsert': {
+                        'id': trend_id,
+                        'period_type': period_type,
+                        'period_value': period_value,
+                        'sales_growth_rate': 0.0,
+                        'sales_percentage': 0.0
+                    }
+                },
+                upsert=True
+            ))
+        return operations
+
+    def trend_documents(self):
+        """Return complete sales trend documents, with growth and share computed over these partials"""
+        trends = pd.DataFrame(
+            [(period_type, period_value, *totals) for (period_type, period_value), totals in self.trends.items()],
+            columns=['period_type', 'period_value', 'total_sales', 'total_quantity', 'total_orders']
+        )
+        documents = []
+        for period_type, group in trends.groupby('period_type'):
+            group = trend_ratios(group)
+            group['id'] = 'trend-' + period_type + '-' + group['period_value']
+            documents.extend(group.to_dict('records'))
+        return documents
+
+    def customer_documents(self):
+        """Return complete customer behavior documents, with frequency and segment computed over these partials"""
+        customers = pd.DataFrame(
+            [(customer_id, *totals) for customer_id, totals in self.customers.items()],
+            columns=['customer_id', 'total_purchases', 'total_spent']
+        )
+        months = [period_value for period_type, period_value in self.trends if period_type == 'monthly']
+        customers['purchase_frequency'], customers['customer_segment'] = customer_segments(
+            customers, months_spanned(months)
+        )
+        customers['customer_id'] = customers['customer_id'].astype(str)
+        customers['id'] = 'behavior-' + customers['customer_id']
+        return customers.to_dict('records')
+
+    def customer_operations(self):
+        """Return ``$inc`` upserts applying the customer behavior deltas"""
+        operations = []
+        for customer_id, (total_purchases, total_spent) in self.customers.items():
+            behavior_id = f"behavior-{customer_id}"
+            operations.append(UpdateOne(
+                {'id': behavior_id},
+                {
+                    '$inc': {'total_purchases': total_purchases, 'total_spent': total_spent},
+                    '$setOnInsert': {
+                        'id': behavior_id,
+                        'customer_id': str(customer_id),
+                        'purchase_frequency': 0.0,
+                        'customer_segment': 'Occasional'
+                    }
+                },
+                upsert=True
+            ))
+        return operations
+
+
+def ensure_analytics_indexes(db):
+    """
+    Create the unique index on 'id' that the increments of each analytics collection rely on, if missing
+
+    Collections that already hold duplicate IDs cannot be indexed until
+    their analytics are rebuilt; they are logged and left as they are.
+
+    Returns:
+        bool: Whether every analytics collection has the index
+    """
+    indexed = True
+    for collection_name in ANALYTICS_COLLECTIONS:
+        collection = db[collection_name]
+        if any(info.get('unique') and [field for field, _ in info['key']] == ['id']
+               for info in collection.index_information().values()):
+            continue
+        try:
+            collection.create_index('id', unique=True, name='id_unique_idx')
+        except Exception as e:
+            logger.error(f"Cannot create the unique index on {collection_name}.id; concurrent increments may "
+                         f"split totals until analytics are rebuilt: {str(e)}")
+            indexed = False
+    return indexed
+
+
+def trend_ratios(trends):
+    """
+    Add growth rate and share of sales to the trends of one period type
+
+    Args:
+        trends: DataFrame with period_value and total_sales
+
+    Returns:
+        pandas.DataFrame: The trends sorted by period, with sales_growth_rate
+        and sales_percentage columns
+    """
+    trends = trends.sort_values('period_value').copy()
+    trends['sales_growth_rate'] = trends['total_sales'].pct_change().mul(100).replace([np.inf, -np.inf], 0).fillna(0)
+    total_sales = trends['total_sales'].sum()
+    trends['sales_percentage'] = trends['total_sales'] / total_sales * 100 if total_sales > 0 else 0.0
+    return trends
+
+
+def months_spanned(months):
+    """Return the months between the first and last of some 'YYYY-MM' periods, at least 1"""
+    if not months:
+        return 1
+    months = sorted(months)
+    first_year, first_month = map(int, months[0].split('-'))
+    last_year, last_month = map(int, months[-1].split('-'))
+    return max(1, (last_year - first_year) * 12 + (last_month - first_month))
+
+
+def stored_months_spanned(db):
+    """Return the months spanned by the stored monthly sales trends"""
+    return months_spanned([trend['period_value'] for trend in db.sales_trends.find(
+        {'id': {'$regex': '^trend-monthly-'}}, {'_id': 0, 'period_value': 1}
+    )])
+
+
+def customer_segments(customers, months_diff):
+    """
+    Return purchase frequency and segment for customers
+
+    Args:
+        customers: DataFrame with total_purchases and total_spent
+        months_diff: Months spanned by all recorded sales
+
+    Returns:
+        tuple: (purchase frequency Series, segment array)
+    """
+    frequency = customers['total_purchases'] / months_diff
+    segment = np.select(
+        [(customers['total_spent'] > spend) | (frequency >= purchases) for _, spend, purchases in CUSTOMER_SEGMENTS],
+        [name for name, _, _ in CUSTOMER_SEGMENTS],
+        default='Occasional'
+    )
+    return frequency, segment
+
+
+def trend_ratio_updates(db, period_types):
+    """
+    Recompute growth rate and share of sales for every stored trend of the given period types
+
+    Args:
+        db: Database holding the authoritative sales_trends
+        period_types: Period types whose totals changed
+
+    Returns:
+        list: Partial trend documents (id plus the recomputed fields)
+    """
+    updates = []
+    for period_type in sorted(period_types):
+        trends = pd.DataFrame(list(db.sales_trends.find(
+            {'period_type': period_type, 'id': {'$regex': f'^trend-{period_type}-'}},
+            {'_id': 0, 'id': 1, 'period_value': 1, 'total_sales': 1}
+        )))
+        if trends.empty:
+            continue
+        trends = trend_ratios(trends)
+        for trend_id, growth_rate, percentage in zip(trends['id'], trends['sales_growth_rate'], trends['sales_percentage']):
+            updates.append({
+                'id': trend_id,
+                'sales_growth_rate': float(growth_rate),
+                'sales_percentage': float(percentage)
+            })
+    return updates
+
+
+def customer_segment_updates(db, behavior_ids=None, months_diff=None):
+    """
+    Recompute purchase frequency and segment for every stored customer
+
+    Frequency is purchases per month over the span of all recorded sales,
+    taken from the stored monthly trends.
+
+    Args:
+        db: Database holding the authoritative customer_behavior
+        behavior_ids: Only recompute these customer_behavior documents
+        months_diff: Months spanned by the stored sales, if already known
+
+    Returns:
+        list: Partial customer_behavior documents for customers whose values changed
+    """
+    if months_diff is None:
+        months_diff = stored_months_spanned(db)
+
+    query = {'id': {'$regex': '^behavior-'}}
+    if behavior_ids is not None:
+        query = {'id': {'$in': list(behavior_ids)}}
+    customers = pd.DataFrame(list(db.customer_behavior.find(
+        query,
+        {'_id': 0, 'id': 1, 'total_purchases': 1, 'total_spent': 1, 'purchase_frequency': 1, 'customer_segment': 1}
+    )))
+    if customers.empty:
+        return []
+    frequency, segment = customer_segments(customers, months_diff)
+    changed = ~(np.isclose(frequency, customers['purchase_frequency'].fillna(-1))
+                & (segment == customers['customer_segment']))
+    return [
+        {'id': behavior_id, 'purchase_frequency': float(value), 'customer_segment': name}
+        for behavior_id, value, name in zip(customers['id'][changed], frequency[changed], segment[changed])
+    ]
@@ -0,0 +1,307 @@
+"""
+Admission Control and Fair Scheduling of Ingests
+
+Every ingest runs its own pool of writer threads against the shared MongoDB
+connection pools, so a burst of concurrent uploads can saturate the cluster
+and stall dashboard reads. Ingests therefore ask for write slots (writer
+threads) before they start. At most ``WRITE_SLOTS - READ_RESERVED_SLOTS``
+slots are handed out across all processes, which keeps the reserved share of
+the cluster free for the analytics read path.
+
+Waiting ingests are admitted one at a time, the next being the oldest
+ingest of the owner who currently holds the fewest slots, and each owner is
+granted at most an equal share of the capacity while others are waiting.
+Queue position and estimated start and completion times are published on
+the upload record as ``scheduling``, for the status endpoint.
+
+State lives in the ``ingest_scheduler`` collection so web processes and
+Celery workers share one budget. Tickets carry heartbeats; the slots of an
+ingest whose process died are reclaimed once its heartbeat goes stale.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from bson import ObjectId
+from mongoengine import get_db
+from core.csv_processing_config import INGEST_SCHEDULER
+from core.upload_cancellation import UploadCancelled, cancellation_requested
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_COLLECTION = 'ingest_scheduler'
+
+# Document holding the slots in use and the measured throughput
+_CAPACITY_ID = 'capacity'
+
+
+class AdmissionTimeout(Exception):
+    """Raised when an ingest is not admitted within its wait limit"""
+    def __init__(self, estimate):
+        super().__init__(f"Ingest capacity is busy; estimated start in {estimate['estimated_start_seconds']:.0f}s")
+        self.estimate = estimate
+
+
+def write_capacity():
+    """Return the write slots that may be handed to ingests"""
+    return max(INGEST_SCHEDULER['MIN_SLOTS'],
+               INGEST_SCHEDULER['WRITE_SLOTS'] - INGEST_SCHEDULER['READ_RESERVED_SLOTS'])
+
+
+def estimate_rows(file_size):
+    """Return an estimate of the rows in a file of ``file_size`` bytes"""
+    return max(1, int(file_size or 0) // INGEST_SCHEDULER['DEFAULT_BYTES_PER_ROW'])
+
+
+class IngestScheduler:
+    """
+    Hands out write slots to ingests from a budget shared through MongoDB
+    """
+    def __init__(self, dbs):
+        """
+        Args:
+            dbs: Dict of database alias to database; the scheduler state is
+                kept in low_review_score_db and ``scheduling`` is published on
+                the upload record in every database
+        """
+        self.dbs = dbs
+        self.collection = dbs['low_review_score_db'][SCHEDULER_COLLECTION]
+        self.collection.update_one(
+            {'_id': _CAPACITY_ID},
+            {'$setOnInsert': {'used': 0, 'rows_per_slot_second': INGEST_SCHEDULER['DEFAULT_ROWS_PER_SLOT_SECOND']}},
+            upsert=True
+        )
+
+    def enqueue(self, ticket, upload_id, owner, requested_slots, estimated_rows):
+        """Queue an ingest for admission (a ticket that already exists keeps its place)"""
+        now = time.time()
+        self.collection.update_one(
+            {'_id': ticket},
+            {
+                '$setOnInsert': {
+                    'kind': 'ticket',
+                    'upload_id': str(upload_id) if upload_id is not None else None,
+                    'owner': owner or 'anonymous',
+                    'state': 'queued',
+                    'requested': max(INGEST_SCHEDULER['MIN_SLOTS'], requested_slots),
+                    'slots': 0,
+                    'estimated_rows': estimated_rows,
+                    'enqueued_at': now
+                },
+                '$set': {'heartbeat': now}
+            },
+            upsert=True
+        )
+
+    def _tickets(self):
+        return list(self.collection.find({'kind': 'ticket'}))
+
+    @staticmethod
+    def _queue_order(tickets):
+        """Return the queued tickets in admission order"""
+        held = {}
+        for ticket in tickets:
+            if ticket['state'] == 'running':
+                held[ticket['owner']] = held.get(ticket['owner'], 0) + ticket['slots']
+        queued = [ticket for ticket in tickets if ticket['state'] == 'queued']
+        return sorted(queued, key=lambda ticket: (held.get(ticket['owner'], 0), ticket['enqueued_at']))
+
+    def try_admit(self, ticket_id):
+        """
+        Admit a queued ingest if it is next in line and slots are free
+
+        Returns:
+            int: Slots granted (those already held if it is running), 0 if it must keep waiting
+        """
+        self.reclaim_stale()
+        tickets = self._tickets()
+        ticket = next((ticket for ticket in tickets if ticket['_id'] == ticket_id), None)
+        if ticket is None:
+            return 0
+        if ticket['state'] == 'running':
+            return ticket['slots']
+        queue = self._queue_order(tickets)
+        if queue[0]['_id'] != ticket_id:
+            return 0
+
+        capacity = write_capacity()
+        owners = {ticket['owner'] for ticket in tickets}
+        held = sum(other['slots'] for other in tickets if other['state'] == 'running' and other['owner'] == ticket['owner'])
+        share = max(INGEST_SCHEDULER['MIN_SLOTS'], capacity // len(owners))
+        used = (self.collection.find_one({'_id': _CAPACITY_ID}) or {}).get('used', 0)
+        slots = min(ticket['requested'], share - held, capacity - used)
+        if slots < INGEST_SCHEDULER['MIN_SLOTS']:
+            return 0
+        # Atomic against other processes admitting at the same time
+        if not self.collection.find_one_and_update(
+            {'_id': _CAPACITY_ID, 'used': {'$lte': capacity - slots}}, {'$inc': {'used': slots}}
+        ):
+            return 0
+        self.collection.update_one(
+            {'_id': ticket_id},
+            {'$set': {'state': 'running', 'slots': slots, 'started_at': time.time(), 'heartbeat': time.time()}}
+        )
+        logger.info(f"Admitted ingest {ticket_id} of {ticket['owner']} with {slots} write slots")
+        return slots
+
+    def release(self, ticket_id):
+        """Remove a ticket, returning its slots and recording the throughput it achieved"""
+        ticket = self.collection.find_one_and_delete({'_id': ticket_id, 'kind': 'ticket'})
+        if not ticket or ticket['state'] != 'running':
+            return
+        self.collection.update_one({'_id': _CAPACITY_ID}, {'$inc': {'used': -ticket['slots']}})
+        elapsed = time.time() - ticket['started_at']
+        if elapsed > 1 and ticket['estimated_rows']:
+            measured = ticket['estimated_rows'] / (elapsed * ticket['slots'])
+            capacity_doc = self.collection.find_one({'_id': _CAPACITY_ID}) or {}
+            previous = capacity_doc.get('rows_per_slot_second', measured)
+            self.collection.update_one(
+                {'_id': _CAPACITY_ID}, {'$set': {'rows_per_slot_second': 0.7 * previous + 0.3 * measured}}
+            )
+
+    def heartbeat(self, ticket_id):
+        self.collection.update_one({'_id': ticket_id}, {'$set': {'heartbeat': time.time()}})
+
+    def reclaim_stale(self):
+        """Drop tickets whose process stopped sending heartbeats, returning their slots"""
+        cutoff = time.time() - INGEST_SCHEDULER['STALE_AFTER']
+        for ticket in self.collection.find({'kind': 'ticket', 'heartbeat': {'$lt': cutoff}}, {'_id': 1}):
+            # Only the process that deletes the ticket returns its slots
+            stale = self.collection.find_one_and_delete({'_id': ticket['_id'], 'heartbeat': {'$lt': cutoff}})
+            if stale and stale['state'] == 'running':
+                self.collection.update_one({'_id': _CAPACITY_ID}, {'$inc': {'used': -stale['slots']}})
+                logger.warning(f"Reclaimed {stale['slots']} write slots of stale ingest {stale['_id']}")
+
+    def estimate(self, ticket_id):
+        """
+        Return the queue position and estimated start and completion of an ingest
+
+        Estimates assume the measured rows per slot-second and that running
+        ingests free their slots as their estimated rows are written.
+        """
+        now = time.time()
+        tickets = self._tickets()
+        rate = (self.collection.find_one({'_id': _CAPACITY_ID}) or {}).get(
+            'rows_per_slot_second', INGEST_SCHEDULER['DEFAULT_ROWS_PER_SLOT_SECOND'])
+        capacity = write_capacity()
+
+        def remaining_rows(ticket):
+            written = (now - ticket['started_at']) * rate * ticket['slots']
+            return max(0.0, ticket['estimated_rows'] - written)
+
+        ticket = next((ticket for ticket in tickets if ticket['_id'] == ticket_id), None)
+        if ticket is None:
+            return {'state': 'unknown'}
+        if ticket['state'] == 'running':
+            return {
+                'state': 'running',
+                'queue_position': 0,
+                'write_slots': ticket['slots'],
+                'estimated_start_seconds': 0.0,
+                'estimated_completion_seconds': remaining_rows(ticket) / (rate * ticket['slots']),
+            }
+        queue = self._queue_order(tickets)
+        position = next(index for index, queued in enumerate(queue) if queued['_id'] == ticket_id)
+        rows_ahead = (sum(remaining_rows(other) for other in tickets if other['state'] == 'running')
+                      + sum(queued['estimated_rows'] for queued in queue[:position]))
+        start = rows_ahead / (rate * capacity)
+        return {
+            'state': 'queued',
+            'queue_position': position + 1,
+            'write_slots': 0,
+            'estimated_start_seconds': start,
+            'estimated_completion_seconds': start + ticket['estimated_rows'] / (rate * min(ticket['requested'], capacity)),
+        }
+
+    def publish(self, upload_id, estimate):
+        """Record an ingest's scheduling estimate on its upload record"""
+        if upload_id is None:
+            return
+        object_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+        update = {'$set': {'scheduling': dict(estimate, updated_at=time.time())}}
+        for db in self.dbs.values():
+            db.raw_data_uploads.update_one({'_id': object_id}, update)
+
+    def wait_for_admission(self, ticket_id, upload_id=None, timeout=None):
+        """
+        Block until a queued ingest is admitted
+
+        Returns:
+            int: Slots granted
+
+        Raises:
+            AdmissionTimeout: If ``timeout`` seconds pass first; the ticket is removed
+            UploadCancelled: If the upload is cancelled while it waits
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        published_at = 0.0
+        while True:
+            slots = self.try_admit(ticket_id)
+            if slots:
+                self.publish(upload_id, self.estimate(ticket_id))
+                return slots
+            self.heartbeat(ticket_id)
+            if upload_id is not None and cancellation_requested(self.dbs['low_review_score_db'], upload_id):
+                raise UploadCancelled(upload_id)
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                estimate = self.estimate(ticket_id)
+                self.release(ticket_id)
+                raise AdmissionTimeout(estimate)
+            if now - published_at >= INGEST_SCHEDULER['HEARTBEAT_INTERVAL']:
+                self.publish(upload_id, self.estimate(ticket_id))
+                published_at = now
+            time.sleep(INGEST_SCHEDULER['POLL_INTERVAL'])
+
+    def _keep_alive(self, ticket_id, upload_id, stop):
+        """Heartbeat a running ingest and refresh its completion estimate until stopped"""
+        while not stop.wait(INGEST_SCHEDULER['HEARTBEAT_INTERVAL']):
+            try:
+                self.heartbeat(ticket_id)
+                self.publish(upload_id, self.estimate(ticket_id))
+            except Exception as e:
+                logger.error(f"Error sending heartbeat of ingest {ticket_id}: {str(e)}")
+
+
+@contextmanager
+def admitted(upload_id, owner, requested_slots, estimated_rows, ticket=None, timeout=None, dbs=None):
+    """
+    Wait for write slots, hold them for the body of the block and release them
+
+    Args:
+        upload_id: ID of the upload record the estimates are published on (None for none)
+        owner: User or client the ingest belongs to, for fair sharing
+        requested_slots: Writer threads the ingest would like
+        estimated_rows: Rows the ingest is expected to write
+        ticket: Scheduler key of the ingest (defaults to the upload id)
+        timeout: Seconds to wait for admission, or None to wait indefinitely
+        dbs: Dict of database alias to database (defaults to both review-score databases)
+
+    Yields:
+        int: Writer threads the ingest may use
+    """
+    if not INGEST_SCHEDULER['ENABLED']:
+        yield requested_slots
+        return
+    dbs = dbs or {alias: get_db(alias) for alias in ('low_review_score_db', 'high_review_score_db')}
+    scheduler = IngestScheduler(dbs)
+    ticket = ticket or str(upload_id)
+    scheduler.enqueue(ticket, upload_id, owner, requested_slots, estimated_rows)
+    try:
+        slots = scheduler.wait_for_admission(ticket, upload_id, timeout)
+    except BaseException:
+        # e.g. the worker is shutting down; a timed-out ticket is already gone
+        scheduler.release(ticket)
+        raise
+
+    stop = threading.Event()
+    keep_alive = threading.Thread(target=scheduler._keep_alive, args=(ticket, upload_id, stop),
+                                  name=f"ingest-heartbeat-{ticket}", daemon=True)
+    keep_alive.start()
+    try:
+        yield slots
+    finally:
+        stop.set()
+        keep_alive.join()
+        scheduler.release(ticket)
@@ -0,0 +1,137 @@
+"""
+Pluggable Ingest Strategies
+
+BulkDataProcessor is the single ingest engine. Three of its steps can be
+swapped by name, per processor or through INGEST_ENGINE in
+csv_processing_config.py:
+
+- transform: how a chunk becomes documents ('columnar' whole-column
+  transform, or 'rows', the original row-by-row loop)
+- write: how documents reach MongoDB ('upsert' dimension and fact rows and
+  insert reviews, 'idempotent' to upsert reviews too so a re-run never
+  duplicates them, or 'staged_merge' through staging collections and a
+  server-side $merge, see core/staged_merge.py)
+- analytics: how sales trends and customer behavior follow the upload
+  ('incremental' $inc of per-chunk partials, 'rebuild' from all stored sales
+  into shadow collections once the upload is written, or 'none')
+
+The ``benchmark_ingest`` management command runs every combination on
+generated data.
+"""
+
+import itertools
+import pandas as pd
+from core.csv_processing_config import INGEST_ENGINE
+from core.upload_rollback import UPLOAD_TAG
+
+TRANSFORM_STRATEGIES = ('columnar', 'rows')
+WRITE_STRATEGIES = ('upsert', 'idempotent', 'staged_merge')
+ANALYTICS_STRATEGIES = ('incremental', 'rebuild', 'none')
+
+
+def resolve_strategies(transform=None, write=None, analytics=None):
+    """
+    Validate strategy names, filling unset ones from INGEST_ENGINE
+
+    Returns:
+        tuple: (transform, write, analytics) strategy names
+
+    Raises:
+        ValueError: If a name is not a known strategy
+    """
+    chosen = (
+        transform or INGEST_ENGINE['TRANSFORM'],
+        write or INGEST_ENGINE['WRITE'],
+        analytics or INGEST_ENGINE['ANALYTICS'],
+    )
+    for kind, name, known in zip(('transform', 'write', 'analytics'), chosen,
+                                 (TRANSFORM_STRATEGIES, WRITE_STRATEGIES, ANALYTICS_STRATEGIES)):
+        if name not in known:
+            raise ValueError(f"Unknown {kind} strategy '{name}', expected one of {', '.join(known)}")
+    return chosen
+
+
+def strategy_combinations(transforms=None, writes=None, analytics=None):
+    """Return every (transform, write, analytics) combination of the given strategies (all by default)"""
+    return list(itertools.product(transforms or TRANSFORM_STRATEGIES, writes or WRITE_STRATEGIES,
+                                  analytics or ANALYTICS_STRATEGIES))
+
+
+def row_transform(chunk_df, upload_id=None):
+    """
+    Build the ingest documents of a chunk row by row, as the processor originally did
+
+    Produces the same documents as core.bulk_processor.transform_chunk; kept
+    as a strategy so the two can be compared on real workloads.
+    """
+    customers, products = {}, {}
+    orders, sales, low_reviews, high_reviews = [], [], [], []
+    for _, row in chunk_df.iterrows():
+        customer_id = int(row['customer_id'])
+        customers[customer_id] = {
+            'customer_id': customer_id,
+            'gender': str(row['gender']),
+            'age': int(row['age']),
+            'city': str(row['city'])
+        }
+        product_id = int(row['product_id'])
+        products[product_id] = {
+            'product_id': product_id,
+            'product_name': str(row['product_name']),
+            'category_id': int(row['category_id']),
+            'category_name': str(row['category_name']),
+            'price': float(row['price'])
+        }
+    for _, row in chunk_df.iterrows():
+        order_date = pd.to_datetime(row['order_date'])
+        order_id = f"ORD-{row['customer_id']}-{row['product_id']}-{order_date.strftime('%Y%m%d%H%M%S')}"
+        orders.append({
+            'order_id': order_id,
+            'order_date': order_date,
+            'customer_id': int(row['customer_id']),
+            'product_id': int(row['product_id']),
+            'quantity': int(row['quantity']),
+            'payment_method': row.get('payment_method', 'Cash'),
+            'review_score': float(row['review_score']) if pd.notna(row.get('review_score')) else None
+        })
+    for _, row in chunk_df.iterrows():
+        order_date = pd.to_datetime(row['order_date'])
+        order_id = f"ORD-{row['customer_id']}-{row['product_id']}-{order_date.strftime('%Y%m%d%H%M%S')}"
+        sales.append({
+            'id': f"SALE-{order_id}",
+            'customer_id': str(row['customer_id']),
+            'product_id': str(row['product_id']),
+            'quantity': int(row['quantity']),
+            'sale_date': order_date,
+            'revenue': float(row['quantity'] * row['price']),
+            'profit': float(row['quantity'] * row['price'] * 0.3),
+            'city': row['city']
+        })
+    for _, row in chunk_df.iterrows():
+        if pd.notna(row.get('review_score')):
+            order_date = pd.to_datetime(row['order_date'])
+            order_id = f"ORD-{row['customer_id']}-{row['product_id']}-{order_date.strftime('%Y%m%d%H%M%S')}"
+            score = float(row['review_score'])
+            review_data = {
+                'id': f"REV-{order_id}",
+                'customer_id': str(row['customer_id']),
+                'product_id': str(row['product_id']),
+                'review_score': score,
+                'sentiment': 'Positive' if score >= 4 else 'Negative' if score <= 2 else 'Neutral',
+                'review_text': row.get('review_text', ''),
+                'review_date': order_date
+            }
+            (low_reviews if score < 4 else high_reviews).append(review_data)
+    documents = {
+        'customers': list(customers.values()),
+        'products': list(products.values()),
+        'orders': orders,
+        'sales': sales,
+        'low_reviews': low_reviews,
+        'high_reviews': high_reviews,
+    }
+    if upload_id is not None:
+        for collection_documents in documents.values():
+            for document in collection_documents:
+                document[UPLOAD_TAG] = upload_id
+    return documents
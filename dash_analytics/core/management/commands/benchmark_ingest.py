@@ -0,0 +1,139 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import MongoClient, monitoring
+
+from core.bulk_processor import BulkDataProcessor
+from core.customer_data_generator import generate_retail_dataframe
+from core.ingest_strategies import (ANALYTICS_STRATEGIES, TRANSFORM_STRATEGIES, WRITE_STRATEGIES,
+                                    strategy_combinations)
+
+# Rows generated per slice while writing a dataset, to bound memory for the large sizes
+GENERATE_ROWS = 100000
+
+# Connection housekeeping that is not ingest work
+HANDSHAKE_COMMANDS = {'hello', 'ismaster', 'isMaster', 'ping', 'endSessions', 'saslStart', 'saslContinue'}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the database commands (round trips) sent by a client"""
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.command_name not in HANDSHAKE_COMMANDS:
+            with self._lock:
+                self.count += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def write_dataset(path, rows):
+    """Write a generated retail CSV of ``rows`` rows, a slice at a time"""
+    for start in range(0, rows, GENERATE_ROWS):
+        generate_retail_dataframe(min(GENERATE_ROWS, rows - start), seed=start).to_csv(
+            path, mode='a', header=start == 0, index=False
+        )
+
+
+class Command(BaseCommand):
+    help = ('Run every ingest strategy combination on generated datasets and report rows/sec, '
+            'peak memory and MongoDB operations per row (writes to scratch databases only)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000',
+                            help='Comma-separated dataset sizes in rows (e.g. 10000,100000,1000000,10000000)')
+        parser.add_argument('--transform', action='append', choices=TRANSFORM_STRATEGIES,
+                            help='Transform strategy to run (repeatable; defaults to all)')
+        parser.add_argument('--write', action='append', choices=WRITE_STRATEGIES,
+                            help='Write strategy to run (repeatable; defaults to all)')
+        parser.add_argument('--analytics', action='append', choices=ANALYTICS_STRATEGIES,
+                            help='Analytics strategy to run (repeatable; defaults to all)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows per chunk')
+        parser.add_argument('--mongo-uri', default=settings.MONGODB_ATLAS_URI,
+                            help='MongoDB deployment holding the scratch databases')
+        parser.add_argument('--database-prefix', default='benchmark_ingest',
+                            help='Prefix of the scratch databases, which are dropped before every run')
+        parser.add_argument('--output', help='Also write the results as JSON to this path')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError(f"Invalid --sizes '{options['sizes']}'")
+        combinations = strategy_combinations(options['transform'], options['write'], options['analytics'])
+
+        counter = CommandCounter()
+        client = MongoClient(options['mongo_uri'], event_listeners=[counter])
+        db_names = [f"{options['database_prefix']}_low", f"{options['database_prefix']}_high"]
+        results = []
+        try:
+            with tempfile.TemporaryDirectory() as workdir:
+                for rows in sizes:
+                    path = os.path.join(workdir, f'retail_{rows}.csv')
+                    self.stdout.write(f'Generating {rows:,} rows...')
+                    write_dataset(path, rows)
+                    self.stdout.write(f"{'transform':>10} {'write':>13} {'analytics':>12} {'rows/sec':>10} "
+                                      f"{'peak MB':>9} {'cmds/row':>9} {'writes/row':>10}")
+                    for strategies in combinations:
+                        result = self._run(client, counter, db_names, path, rows, strategies, options['chunk_size'])
+                        results.append(result)
+                        self.stdout.write(f"{result['transform']:>10} {result['write']:>13} {result['analytics']:>12} "
+                                          f"{result['rows_per_sec']:>10,.0f} {result['peak_memory_mb']:>9.0f} "
+                                          f"{result['commands_per_row']:>9.3f} {result['writes_per_row']:>10.2f}")
+                    os.remove(path)
+        finally:
+            for db_name in db_names:
+                client.drop_database(db_name)
+            client.close()
+
+        for rows in sizes:
+            fastest = max((result for result in results if result['rows'] == rows), key=lambda r: r['rows_per_sec'])
+            self.stdout.write(self.style.SUCCESS(
+                f"{rows:,} rows: fastest is {fastest['transform']}/{fastest['write']}/{fastest['analytics']} "
+                f"at {fastest['rows_per_sec']:,.0f} rows/sec"
+            ))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+    def _run(self, client, counter, db_names, path, rows, strategies, chunk_size):
+        """Ingest a dataset into freshly dropped scratch databases with one strategy combination"""
+        transform, write, analytics = strategies
+        for db_name in db_names:
+            client.drop_database(db_name)
+        low_db, high_db = (client[db_name] for db_name in db_names)
+
+        processor = BulkDataProcessor(chunk_size=chunk_size, dedupe_rows=False, transform_strategy=transform,
+                                      write_strategy=write, analytics_strategy=analytics)
+        processor.low_db, processor.high_db = low_db, high_db
+        upload_id = low_db.raw_data_uploads.insert_one({'file_name': os.path.basename(path)}).inserted_id
+        high_db.raw_data_uploads.insert_one({'_id': upload_id, 'file_name': os.path.basename(path)})
+
+        counter.count = 0
+        start = time.perf_counter()
+        stats = processor.process_csv_stream(path, upload_id)
+        elapsed = time.perf_counter() - start
+        writes = sum(counts['succeeded'] + counts['failed'] for counts in stats['database_writes'].values())
+        return {
+            'rows': rows,
+            'transform': transform,
+            'write': write,
+            'analytics': analytics,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': rows / elapsed if elapsed else 0,
+            'peak_memory_mb': stats['peak_memory_mb'],
+            'commands_per_row': counter.count / rows,
+            'writes_per_row': writes / rows,
+            'failed_records': stats['failed_records'],
+        }
@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.batch_ingest import archive_type, create_batch_upload, ingest_archive, ingest_directory
+from core.csv_processing_config import BATCH_INGEST
+from core.utils import initialize_databases
+
+
+class Command(BaseCommand):
+    help = ('Ingest the files of a zip/tar archive, or the files dropped into a directory, '
+            'concurrently as one upload with a child upload per file')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archive, or directory whose settled files are ingested')
+        parser.add_argument('--watch', action='store_true',
+                            help='Keep scanning the directory and ingest each new set of files as a batch')
+        parser.add_argument('--interval', type=float, default=BATCH_INGEST['WATCH_INTERVAL'],
+                            help='Seconds between scans of a watched directory')
+        parser.add_argument('--settle', type=float, default=BATCH_INGEST['SETTLE_SECONDS'],
+                            help='Seconds a file must be unmodified before it is picked up')
+        parser.add_argument('--parallel', type=int, default=BATCH_INGEST['MAX_PARALLEL_FILES'],
+                            help='Files ingested at the same time')
+        parser.add_argument('--owner', default='batch-ingest',
+                            help='Name the uploads are scheduled and recorded for')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        initialize_databases()
+        if os.path.isdir(path):
+            while True:
+                stats = ingest_directory(path, options['owner'], options['parallel'], options['settle'])
+                if stats:
+                    self._report(stats['upload_id'], stats)
+                elif not options['watch']:
+                    self.stdout.write('No settled files to ingest')
+                if not options['watch']:
+                    return
+                time.sleep(options['interval'])
+
+        if options['watch']:
+            raise CommandError('--watch needs a directory')
+        if not os.path.isfile(path) or not archive_type(path):
+            raise CommandError(f"'{path}' is not a directory or a zip/tar archive")
+        upload_id = create_batch_upload(os.path.basename(path), options['owner'], file_size=os.path.getsize(path))
+        try:
+            stats = ingest_archive(upload_id, path, options['owner'], options['parallel'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self._report(upload_id, stats)
+
+    def _report(self, upload_id, stats):
+        for file_info in stats['files']:
+            line = f"  {file_info['file_name']}: {file_info['status']} (upload {file_info['upload_id']})"
+            if file_info['error']:
+                line += f" - {file_info['error']}"
+            self.stdout.write(line)
+        summary = (f"Batch upload {upload_id}: {stats['completed_files']} of {len(stats['files'])} files, "
+                   f"{stats['processed_records']} records in {stats['processing_time']:.2f}s")
+        if stats['failed_files']:
+            self.stdout.write(self.style.ERROR(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
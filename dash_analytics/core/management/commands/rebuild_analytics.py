@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_db
+
+from core.analytics_rebuild import rebuild_analytics
+from core.csv_processing_config import ANALYTICS_REBUILD
+
+DATABASES = ['low_review_score_db', 'high_review_score_db']
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the analytics collections from all stored sales and swap them in atomically'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', action='append', dest='collections',
+                            choices=ANALYTICS_REBUILD['COLLECTIONS'],
+                            help='Collection to rebuild (repeatable; defaults to all analytics collections)')
+        parser.add_argument('--source', default=DATABASES[0], choices=DATABASES,
+                            help='Database whose sales and products are read')
+
+    def handle(self, *args, **options):
+        dbs = {alias: get_db(alias) for alias in DATABASES}
+        start = time.perf_counter()
+        try:
+            loaded = rebuild_analytics(dbs, options['source'], options['collections'])
+        except Exception as e:
+            raise CommandError(f'Rebuild failed, live collections were left unchanged: {e}')
+        for collection_name, count in loaded.items():
+            self.stdout.write(f'  {collection_name}: {count} documents')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt analytics in {time.perf_counter() - start:.2f}s'))
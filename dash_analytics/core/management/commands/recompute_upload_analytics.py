@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk_processor import BulkDataProcessor
+
+
+class Command(BaseCommand):
+    help = "Refresh the analytics of an upload from its parsed spool, without reading or parsing the original file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('upload_id', help='ID of the upload record')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        processor = BulkDataProcessor()
+        try:
+            analytics_df = processor.recompute_analytics(options['upload_id'])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed analytics for {len(analytics_df)} rows in {time.perf_counter() - start:.2f}s"
+        ))
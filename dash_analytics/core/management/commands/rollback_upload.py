@@ -0,0 +1,42 @@
+import time
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.connection import get_db
+
+from core.upload_rollback import rollback_upload
+
+DATABASES = ['low_review_score_db', 'high_review_score_db']
+
+
+class Command(BaseCommand):
+    help = 'Remove everything an upload wrote from both databases and take its sales out of the analytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('upload_id', help='ID of the upload record')
+        parser.add_argument('--force', action='store_true',
+                            help='Roll back even if the upload is still marked as running or was already rolled back')
+
+    def handle(self, *args, **options):
+        try:
+            upload_id = ObjectId(options['upload_id'])
+        except InvalidId:
+            raise CommandError(f"Invalid upload id '{options['upload_id']}'")
+        dbs = {alias: get_db(alias) for alias in DATABASES}
+        upload = dbs[DATABASES[0]].raw_data_uploads.find_one({'_id': upload_id}, {'status': 1})
+        if upload is None:
+            raise CommandError(f'Upload {upload_id} not found')
+        if upload.get('status') in ('pending', 'processing', 'rolled_back') and not options['force']:
+            raise CommandError(f"Upload {upload_id} is {upload['status']}; use --force to roll it back anyway")
+
+        start = time.perf_counter()
+        deleted = rollback_upload(dbs, upload_id)
+        for alias, counts in deleted.items():
+            summary = ', '.join(f'{collection_name} {count}' for collection_name, count in counts.items())
+            self.stdout.write(f'  {alias}: {summary}')
+        shared = dbs[DATABASES[0]].raw_data_uploads.find_one({'_id': upload_id}, {'rollback_shared': 1}) or {}
+        for alias, counts in (shared.get('rollback_shared') or {}).items():
+            summary = ', '.join(f'{collection_name} {count}' for collection_name, count in counts.items())
+            self.stdout.write(self.style.WARNING(f'  {alias}: kept rows other uploads contain too: {summary}'))
+        self.stdout.write(self.style.SUCCESS(f'Rolled back upload {upload_id} in {time.perf_counter() - start:.2f}s'))
@@ -74,13 +74,17 @@ class LowReview(Document):
     sentiment = fields.StringField()
     review_text = fields.StringField()
     review_date = fields.DateTimeField(default=datetime.utcnow)
+    upload_id = fields.ObjectIdField()  # Upload that first wrote the review (see core/upload_rollback.py)
+    upload_ids = fields.ListField(fields.ObjectIdField())  # Every upload that contains the review
 
     meta = {
         'collection': 'low_reviews',
         'indexes': [
             {'fields': ['product_id'], 'name': 'product_id_low_reviews_idx'},
             {'fields': ['customer_id'], 'name': 'customer_id_low_reviews_idx'},
-            {'fields': ['review_score'], 'name': 'review_score_low_reviews_idx'}
+            {'fields': ['review_score'], 'name': 'review_score_low_reviews_idx'},
+            {'fields': ['upload_id'], 'name': 'upload_id_idx'},
+            {'fields': ['upload_ids'], 'name': 'upload_ids_idx'}
         ],
         'db_alias': 'low_review_score_db'
     }
@@ -93,13 +97,17 @@ class HighReview(Document):
     sentiment = fields.StringField()
     review_text = fields.StringField()
     review_date = fields.DateTimeField(default=datetime.utcnow)
+    upload_id = fields.ObjectIdField()  # Upload that first wrote the review (see core/upload_rollback.py)
+    upload_ids = fields.ListField(fields.ObjectIdField())  # Every upload that contains the review
 
     meta = {
         'collection': 'high_reviews',
         'indexes': [
             {'fields': ['product_id'], 'name': 'product_id_high_reviews_idx'},
             {'fields': ['customer_id'], 'name': 'customer_id_high_reviews_idx'},
-            {'fields': ['review_score'], 'name': 'review_score_high_reviews_idx'}
+            {'fields': ['review_score'], 'name': 'review_score_high_reviews_idx'},
+            {'fields': ['upload_id'], 'name': 'upload_id_idx'},
+            {'fields': ['upload_ids'], 'name': 'upload_ids_idx'}
         ],
         'db_alias': 'high_review_score_db'
     }
@@ -131,10 +139,12 @@ class Customer(ReplicatedDocument):
     gender = fields.StringField(required=True)
     age = fields.IntField(required=True)
     city = fields.StringField(required=True)
+    upload_id = fields.ObjectIdField()  # Upload that last created or changed the customer
     meta = {
         'collection': 'customers',
         'indexes': [
-            {'fields': ['customer_id'], 'unique': True, 'name': 'customer_id_unique_idx'}
+            {'fields': ['customer_id'], 'unique': True, 'name': 'customer_id_unique_idx'},
+            {'fields': ['upload_id'], 'name': 'upload_id_idx'}
         ],
         'db_alias': 'low_review_score_db'
     }
@@ -198,10 +208,12 @@ class Product(ReplicatedDocument):
     category_name = fields.StringField(required=True)
     product_name = fields.StringField(required=True)
     price = fields.FloatField(required=True)
+    upload_id = fields.ObjectIdField()  # Upload that last created or changed the product
     meta = {
         'collection': 'products',
         'indexes': [
-            {'fields': ['product_id'], 'unique': True, 'name': 'product_id_unique_idx'}
+            {'fields': ['product_id'], 'unique': True, 'name': 'product_id_unique_idx'},
+            {'fields': ['upload_id'], 'name': 'upload_id_idx'}
         ],
         'db_alias': 'low_review_score_db'
     }
@@ -241,12 +253,16 @@ class Order(ReplicatedDocument):
     review_score = fields.FloatField()  # Added for temporary storage during analysis
     customer_id = fields.ReferenceField(Customer, required=True)
     product_id = fields.ReferenceField(Product, required=True)
+    upload_id = fields.ObjectIdField()  # Upload that first wrote the order
+    upload_ids = fields.ListField(fields.ObjectIdField())  # Every upload that contains the order
     meta = {
         'collection': 'orders',
         'indexes': [
             {'fields': ['order_id'], 'unique': True, 'name': 'order_id_unique_idx'},
             {'fields': ['customer_id'], 'name': 'customer_id_idx'},
-            {'fields': ['product_id'], 'name': 'product_id_idx'}
+            {'fields': ['product_id'], 'name': 'product_id_idx'},
+            {'fields': ['upload_id'], 'name': 'upload_id_idx'},
+            {'fields': ['upload_ids'], 'name': 'upload_ids_idx'}
         ],
         'db_alias': 'low_review_score_db'
     }
@@ -289,12 +305,16 @@ class Sales(ReplicatedDocument):
     revenue = fields.FloatField(required=True)
     profit = fields.FloatField(required=True)
     city = fields.StringField(required=True)
+    upload_id = fields.ObjectIdField()  # Upload that first wrote the sale
+    upload_ids = fields.ListField(fields.ObjectIdField())  # Every upload that contains the sale
     meta = {
         'collection': 'sales',
         'indexes': [
             {'fields': ['customer_id'], 'name': 'customer_id_idx'},
             {'fields': ['product_id'], 'name': 'product_id_idx'},
-            {'fields': [('sale_date', -1)], 'name': 'sale_date_idx'}
+            {'fields': [('sale_date', -1)], 'name': 'sale_date_idx'},
+            {'fields': ['upload_id'], 'name': 'upload_id_idx'},
+            {'fields': ['upload_ids'], 'name': 'upload_ids_idx'}
         ],
         'db_alias': 'low_review_score_db'
     }
@@ -326,18 +346,48 @@ class Sales(ReplicatedDocument):
             logging.getLogger(__name__).error(f"Error in create_or_update_by_unique_fields for Sales: {str(e)}")
             raise
 
+class UploadCheckpoint(EmbeddedDocument):
+    """A chunk of an upload whose writes have been committed"""
+    offset = fields.IntField(required=True)  # Row offset of the chunk in the source file
+    row_count = fields.IntField(required=True)
+    checksum = fields.StringField(required=True)
+    duplicates = fields.IntField(default=0)  # Rows skipped as already ingested
+    low_reviews = fields.IntField(default=0)
+    high_reviews = fields.IntField(default=0)
+
 class RawDataUpload(ReplicatedDocument):
     file_name = fields.StringField(required=True)
     upload_date = fields.DateTimeField(default=datetime.utcnow)
-    status = fields.StringField(choices=['pending', 'processing', 'completed', 'failed'], default='pending')
+    status = fields.StringField(choices=['pending', 'processing', 'completed', 'failed', 'rolled_back', 'cancelled'], default='pending')
     error_message = fields.StringField()
     processed_records = fields.IntField(default=0)
     total_records = fields.IntField(default=0)
     low_reviews_count = fields.IntField(default=0)
     high_reviews_count = fields.IntField(default=0)
     processing_time = fields.FloatField(default=0.0)
+    content_hash = fields.StringField()  # SHA-256 of the uploaded file
+    file_size = fields.IntField(default=0)
+    duplicate_records = fields.IntField(default=0)
+    rejected_records = fields.IntField(default=0)  # Rows that failed schema validation
+    rejected_file_path = fields.StringField()  # CSV of rejected rows with the reason for each
+    write_batching = fields.DictField()  # Current adaptive bulk_write batch size per collection
+    source_file_path = fields.StringField()  # Spooled copy of the upload, kept until it completes
+    parsed_spool = fields.DictField()  # Arrow IPC file of the parsed, validated rows (see core/parsed_spool.py)
+    chunk_size = fields.IntField()
+    ingest_tasks = fields.IntField(default=0)  # Row-range tasks of a distributed ingest (0 = single task)
+    index_maintenance = fields.DictField()  # Secondary indexes deferred by bulk-load mode and their rebuild progress
+    uploaded_by = fields.StringField()  # User (or client address) the upload is scheduled for
+    scheduling = fields.DictField()  # Queue position, write slots and ETA from the ingest scheduler
+    rolled_back_at = fields.DateTimeField()
+    cancel_requested = fields.DictField()  # When cancellation was requested and whether to roll back (see core/upload_cancellation.py)
+    cancelled_at = fields.DateTimeField()
+    rollback = fields.DictField()  # Documents deleted per database and collection by a rollback
+    rollback_shared = fields.DictField()  # Rows a rollback kept per database and collection, as other uploads contain them
+    parent_upload = fields.ObjectIdField()  # Multi-file upload this file was ingested as part of
+    batch_files = fields.IntField(default=0)  # Files of a multi-file upload (0 = single file, see core/batch_ingest.py)
+    checkpoints = fields.ListField(fields.EmbeddedDocumentField(UploadCheckpoint))
     meta = {
         'collection': 'raw_data_uploads',
-        'indexes': ['file_name', 'upload_date'],
+        'indexes': ['file_name', 'upload_date', 'content_hash', 'parent_upload'],
         'db_alias': 'low_review_score_db'
     }
@@ -0,0 +1,250 @@
+"""
+Parsed Upload Spool
+
+The chunks of every upload are written, once parsed and validated, to an
+Arrow IPC file linked from the upload record (``parsed_spool``). Resumes and
+retries replay that file instead of the original upload, and analytics can
+be recomputed from it after the original has been deleted, with no parsing
+or validation: the file is memory-mapped and each record batch is one chunk
+of the attempt that wrote it. The batch metadata carries the chunk's row
+offset, row count, checksum and rejected-row count as they were for the
+original file, so checkpoints recorded by that attempt still match.
+
+The file is written next to its final name and renamed once every chunk has
+been added, so a spool linked from a record is always complete. Spools are
+removed after ``PARSED_SPOOL['RETENTION_DAYS']`` by
+``db_maintenance.py --clean-temp``.
+"""
+
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from core.csv_processing_config import PARSED_SPOOL
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    logging.warning("pyarrow not available, parsed uploads will not be spooled")
+
+logger = logging.getLogger(__name__)
+
+# File name suffix of a parsed spool, and of one still being written
+SPOOL_SUFFIX = '.parsed.arrow'
+PARTIAL_SUFFIX = '.partial'
+
+# Column holding the content hash of each row, present when rows were deduplicated
+ROW_HASH_COLUMN = '__row_hash'
+
+
+class ParsedChunk(NamedTuple):
+    """One chunk of an upload as replayed from its parsed spool"""
+    frame: object  # Rows that passed validation, with coerced types
+    offset: int  # Row offset of the chunk in the original file
+    row_count: int  # Rows in the chunk before validation
+    checksum: str  # chunk_checksum of the chunk as it was parsed
+    rejected: int  # Rows that failed validation
+    row_hashes: object  # row_hashes of the valid rows, or None
+
+
+def spooling_enabled():
+    """Return whether parsed uploads are written to a spool"""
+    return PYARROW_AVAILABLE and PARSED_SPOOL.get('ENABLED', False)
+
+
+def spool_directory():
+    """Return the directory holding parsed spools, creating it if needed"""
+    directory = PARSED_SPOOL.get('DIR') or os.path.join(tempfile.gettempdir(), 'dash_analytics_parsed')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def parsed_spool_path(upload_id):
+    """Return the path of the parsed spool of an upload"""
+    return os.path.join(spool_directory(), f"{upload_id}{SPOOL_SUFFIX}")
+
+
+def is_parsed_spool(source):
+    """Return whether a path names a parsed spool rather than an uploaded file"""
+    return isinstance(source, str) and source.endswith(SPOOL_SUFFIX)
+
+
+def parsed_spool_file(parsed_spool):
+    """Return the path in an upload's ``parsed_spool`` info if the file still exists, else None"""
+    path = (parsed_spool or {}).get('path')
+    return path if path and os.path.exists(path) else None
+
+
+def _empty_batch(frame, schema=None):
+    """Return a record batch with no rows for a chunk with none (e.g. a header-only file)"""
+    # String columns of an empty frame convert to arrays with no chunks, which
+    # RecordBatch.from_pandas rejects
+    schema = schema or pa.Table.from_pandas(frame, preserve_index=False).schema
+    return pa.RecordBatch.from_arrays([pa.array([], type=field.type) for field in schema], schema=schema)
+
+
+class ParsedSpoolWriter:
+    """
+    Writes the validated chunks of one upload to its parsed spool, created on first use
+
+    The first chunk fixes the schema; a later chunk that cannot be stored
+    with it abandons the spool without affecting the upload.
+    """
+    def __init__(self, upload_id):
+        self.upload_id = upload_id
+        self.path = parsed_spool_path(upload_id)
+        self.chunks = 0
+        self.rows = 0
+        self._sink = None
+        self._writer = None
+        self._schema = None
+        self._abandoned = False
+
+    def write(self, valid_df, offset, row_count, checksum, rejected, hashes=None):
+        """
+        Append one chunk
+
+        Args:
+            valid_df: Rows of the chunk that passed validation
+            offset: Row offset of the chunk in the file
+            row_count: Rows in the chunk before validation
+            checksum: chunk_checksum of the parsed chunk
+            rejected: Rows of the chunk that failed validation
+            hashes: row_hashes of the valid rows, when rows are deduplicated
+        """
+        if self._abandoned:
+            return
+        frame = valid_df.reset_index(drop=True)
+        if hashes is not None:
+            frame[ROW_HASH_COLUMN] = hashes
+        metadata = {'offset': str(offset), 'row_count': str(row_count),
+                    'checksum': checksum, 'rejected': str(rejected)}
+        try:
+            if frame.empty:
+                batch = _empty_batch(frame, self._schema)
+            else:
+                batch = pa.RecordBatch.from_pandas(frame, schema=self._schema, preserve_index=False)
+            if self._writer is None:
+                self._sink = pa.OSFile(self.path + PARTIAL_SUFFIX, 'wb')
+                self._schema = batch.schema
+                self._writer = pa.ipc.new_file(self._sink, self._schema)
+            self._writer.write_batch(batch, custom_metadata=metadata)
+        except (pa.ArrowException, ValueError, TypeError, OSError) as e:
+            logger.warning(f"Not spooling upload {self.upload_id}: chunk at offset {offset} could not be stored ({str(e)})")
+            self.abort()
+            return
+        self.chunks += 1
+        self.rows += len(frame)
+
+    def commit(self):
+        """
+        Finish the spool once every chunk of the upload has been written
+
+        Returns:
+            dict: The ``parsed_spool`` info for the upload record, or None if
+            nothing was spooled
+        """
+        if self._writer is None:
+            return None
+        self._close()
+        os.replace(self.path + PARTIAL_SUFFIX, self.path)
+        logger.info(f"Spooled {self.rows} parsed rows of upload {self.upload_id} to {self.path}")
+        return {
+            'path': self.path,
+            'rows': self.rows,
+            'chunks': self.chunks,
+            'size': os.path.getsize(self.path),
+            'created_at': datetime.utcnow()
+        }
+
+    def abort(self):
+        """Discard a spool that was not completed"""
+        self._abandoned = True
+        if self._writer is None:
+            return
+        try:
+            self._close()
+        except Exception:
+            pass
+        try:
+            os.remove(self.path + PARTIAL_SUFFIX)
+        except OSError:
+            pass
+
+    def _close(self):
+        writer, sink = self._writer, self._sink
+        self._writer = self._sink = None
+        try:
+            writer.close()
+        finally:
+            sink.close()
+
+
+def iter_parsed_spool(path, columns=None):
+    """
+    Yield the chunks of a parsed spool as ParsedChunk tuples
+
+    Args:
+        path: Path of the spool
+        columns: Only read these columns (those missing from the spool are skipped)
+    """
+    with pa.memory_map(path) as source:
+        reader = pa.ipc.open_file(source)
+        names = reader.schema.names
+        if columns is not None:
+            names = [name for name in names if name in columns or name == ROW_HASH_COLUMN]
+        for i in range(reader.num_record_batches):
+            batch, metadata = reader.get_batch_with_custom_metadata(i)
+            frame = batch.select(names).to_pandas()
+            hashes = frame.pop(ROW_HASH_COLUMN).to_numpy() if ROW_HASH_COLUMN in frame.columns else None
+            yield ParsedChunk(
+                frame,
+                int(metadata[b'offset']),
+                int(metadata[b'row_count']),
+                metadata[b'checksum'].decode(),
+                int(metadata[b'rejected']),
+                hashes
+            )
+
+
+def remove_expired_spools(dbs, retention_days=None):
+    """
+    Delete parsed spools older than the retention period and unlink them from their uploads
+
+    Spools left half-written by an interrupted attempt are removed on the
+    same schedule.
+
+    Args:
+        dbs: Dict of database alias to database holding raw_data_uploads
+        retention_days: Age in days after which a spool is removed
+            (defaults to PARSED_SPOOL['RETENTION_DAYS'])
+
+    Returns:
+        int: Number of files removed
+    """
+    if retention_days is None:
+        retention_days = PARSED_SPOOL.get('RETENTION_DAYS', 7)
+    directory = spool_directory()
+    cutoff = time.time() - retention_days * 86400
+    count = 0
+    for file_name in os.listdir(directory):
+        if not file_name.endswith((SPOOL_SUFFIX, SPOOL_SUFFIX + PARTIAL_SUFFIX)):
+            continue
+        path = os.path.join(directory, file_name)
+        try:
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            os.remove(path)
+        except OSError as e:
+            logger.error(f"Error removing parsed spool {path}: {str(e)}")
+            continue
+        for db in dbs.values():
+            db.raw_data_uploads.update_many({'parsed_spool.path': path}, {'$unset': {'parsed_spool': ''}})
+        logger.info(f"Removed expired parsed spool: {path}")
+        count += 1
+    return count
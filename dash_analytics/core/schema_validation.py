@@ -0,0 +1,212 @@
+"""
+Vectorized Schema Validation for CSV Uploads
+
+A declarative column schema (see ``RETAIL_CSV_SCHEMA`` in
+core/csv_processing_config.py) is compiled once into per-column coercion
+steps. Each chunk is then coerced column by column in bulk; rows with a value
+that cannot be coerced or breaks a rule are split off with the reason, so one
+malformed value no longer costs the rest of its chunk.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import pandas as pd
+from core.csv_processing_config import RETAIL_CSV_SCHEMA, SCHEMA_VALIDATION
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaError(ValueError):
+    """Raised when a file is missing columns the schema requires"""
+
+
+def _coerce_int(values, spec):
+    numbers = pd.to_numeric(values, errors='coerce')
+    invalid = values.notna() & (numbers.isna() | (numbers % 1 != 0))
+    return numbers.where(~invalid), invalid, 'not an integer'
+
+
+def _coerce_float(values, spec):
+    numbers = pd.to_numeric(values, errors='coerce')
+    invalid = values.notna() & numbers.isna()
+    return numbers, invalid, 'not a number'
+
+
+def _coerce_datetime(values, spec):
+    dates = pd.to_datetime(values, errors='coerce', format=spec.get('format'))
+    invalid = values.notna() & dates.isna()
+    return dates, invalid, 'not a valid date'
+
+
+def _coerce_str(values, spec):
+    text = values.astype(str).str.strip().where(values.notna())
+    return text.where(text != ''), pd.Series(False, index=values.index), None
+
+
+COERCERS = {
+    'int': _coerce_int,
+    'float': _coerce_float,
+    'datetime': _coerce_datetime,
+    'str': _coerce_str,
+}
+
+
+class CompiledSchema:
+    """
+    A column schema compiled into a list of bulk coercion and rule checks
+    """
+    def __init__(self, schema):
+        """
+        Compile a schema
+
+        Args:
+            schema: Dict of column name to spec. A spec has a 'type' ('int',
+                'float', 'datetime' or 'str') and optionally 'required'
+                (default True), 'min', 'max' and, for dates, 'format'.
+        """
+        self.columns = []
+        for column, spec in schema.items():
+            if spec['type'] not in COERCERS:
+                raise ValueError(f"Unknown type '{spec['type']}' for column {column}")
+            self.columns.append((column, spec, COERCERS[spec['type']]))
+        self.required_columns = [column for column, spec, _ in self.columns if spec.get('required', True)]
+
+    def check_columns(self, columns):
+        """Raise SchemaError if any required column is absent"""
+        missing = [column for column in self.required_columns if column not in columns]
+        if missing:
+            raise SchemaError(f"Missing required columns: {', '.join(missing)}")
+
+    def validate(self, chunk_df):
+        """
+        Coerce a chunk to the schema types and split off the rows that fail
+
+        Args:
+            chunk_df: DataFrame chunk as parsed from the file
+
+        Returns:
+            tuple: (coerced valid rows, original rejected rows with a
+            'rejected_reason' column)
+        """
+        self.check_columns(chunk_df.columns)
+        coerced = chunk_df.copy()
+        reasons = pd.Series(None, index=chunk_df.index, dtype=object)
+
+        for column, spec, coerce in self.columns:
+            if column not in chunk_df.columns:
+                continue
+            values, invalid, message = coerce(chunk_df[column], spec)
+            failures = [(invalid, f"{column}: {message}")]
+            if spec.get('required', True):
+                failures.append((values.isna() & ~invalid, f"{column}: missing value"))
+            if 'min' in spec:
+                failures.append((values < spec['min'], f"{column}: below minimum {spec['min']}"))
+            if 'max' in spec:
+                failures.append((values > spec['max'], f"{column}: above maximum {spec['max']}"))
+            for mask, reason in failures:
+                # Keep the first reason found for each row
+                reasons = reasons.mask(mask.to_numpy() & reasons.isna().to_numpy(), reason)
+            coerced[column] = values
+
+        rejected_mask = reasons.notna().to_numpy()
+        valid = coerced[~rejected_mask]
+        valid = valid.astype({
+            column: 'int64' if valid[column].notna().all() else 'Int64'
+            for column, spec, _ in self.columns
+            if spec['type'] == 'int' and column in valid.columns
+        })
+        rejected = chunk_df[rejected_mask].assign(rejected_reason=reasons[rejected_mask])
+        return valid, rejected
+
+
+_retail_schema = None
+
+
+def get_retail_schema():
+    """Return the compiled retail CSV schema, compiling it on first use"""
+    global _retail_schema
+    if _retail_schema is None:
+        _retail_schema = CompiledSchema(RETAIL_CSV_SCHEMA)
+    return _retail_schema
+
+
+def rejected_rows_path(upload_id, part=None):
+    """Return the path of the rejected-rows file for an upload, or of one part of it"""
+    directory = SCHEMA_VALIDATION.get('REJECTS_DIR') or os.path.join(tempfile.gettempdir(), 'dash_analytics_rejects')
+    os.makedirs(directory, exist_ok=True)
+    if part is not None:
+        return os.path.join(directory, f"{upload_id}_rejected.part{part}.csv")
+    return os.path.join(directory, f"{upload_id}_rejected.csv")
+
+
+def merge_rejected_parts(upload_id, parts):
+    """
+    Concatenate the rejected-row files written for parts of an upload, in order
+
+    Args:
+        upload_id: ID of the upload record
+        parts: Part keys in file order; parts without rejected rows are skipped
+
+    Returns:
+        str: Path of the merged file, or None if no rows were rejected
+    """
+    part_paths = [rejected_rows_path(upload_id, part) for part in parts]
+    part_paths = [path for path in part_paths if os.path.exists(path)]
+    if not part_paths:
+        return None
+    merged_path = rejected_rows_path(upload_id)
+    with open(merged_path, 'wb') as merged:
+        for index, part_path in enumerate(part_paths):
+            with open(part_path, 'rb') as part_file:
+                if index:
+                    # Every part starts with the same header
+                    part_file.readline()
+                shutil.copyfileobj(part_file, merged)
+            os.remove(part_path)
+    return merged_path
+
+
+class RejectedRowSpool:
+    """
+    Writes rejected rows of one upload to a CSV file, created on first use
+    """
+    def __init__(self, upload_id, part=None):
+        """
+        Args:
+            upload_id: ID of the upload record
+            part: Key of the part of the upload being processed, when parts
+                are processed separately and merged with merge_rejected_parts
+        """
+        self.upload_id = upload_id
+        self.part = part
+        self.path = None
+        self.count = 0
+        self._columns = None
+
+    def write(self, rejected_df, first_row_number):
+        """
+        Append rejected rows
+
+        Args:
+            rejected_df: Rejected rows as returned by CompiledSchema.validate
+            first_row_number: File row number (1-based, excluding the header)
+                of the first row in the chunk the rows came from
+        """
+        if rejected_df.empty:
+            return
+        positions = rejected_df.index.to_numpy()
+        rows = rejected_df.drop(columns='rejected_reason')
+        rows.insert(0, 'row_number', positions + first_row_number)
+        rows['rejected_reason'] = rejected_df['rejected_reason']
+
+        if self.path is None:
+            # Each run rewrites the file, so a resumed upload does not repeat rows
+            self.path = rejected_rows_path(self.upload_id, self.part)
+            self._columns = list(rows.columns)
+            rows.to_csv(self.path, index=False)
+        else:
+            rows.reindex(columns=self._columns).to_csv(self.path, mode='a', header=False, index=False)
+        self.count += len(rows)
+        logger.info(f"Rejected {len(rows)} rows of upload {self.upload_id}")
@@ -0,0 +1,84 @@
+"""
+Atomic Full Reloads via Shadow Collections
+
+Rebuilding a collection in place exposes half-built data to readers and
+costs one upsert per document. A full reload instead bulk-inserts the new
+contents into a shadow collection, builds the live collection's indexes on
+it once, and renames it over the live collection with ``dropTarget``. Each
+rename is atomic, so readers see either the old or the new contents.
+
+All shadow collections of a reload are built in every database before any
+is renamed; a failed build drops the shadows and leaves the live
+collections untouched. The renames themselves are atomic per collection,
+not across collections or databases.
+"""
+
+import logging
+from pymongo import IndexModel
+from core.csv_processing_config import ANALYTICS_REBUILD
+
+logger = logging.getLogger(__name__)
+
+# Index options reported by index_information() that are not passed back to create_index
+_SERVER_OPTIONS = ('key', 'v', 'ns', 'background')
+
+
+def shadow_collection_name(collection_name):
+    """Return the shadow collection a reload of a collection is built in"""
+    return f"{collection_name}__shadow"
+
+
+def index_models(collection):
+    """Return the secondary indexes of a collection as IndexModels"""
+    return [
+        IndexModel(info['key'], name=name,
+                   **{option: value for option, value in info.items() if option not in _SERVER_OPTIONS})
+        for name, info in collection.index_information().items()
+        if name != '_id_'
+    ]
+
+
+def _build_shadow(db, collection_name, documents, batch_size):
+    """Load documents into a fresh shadow collection and index it like the live one"""
+    shadow = db[shadow_collection_name(collection_name)]
+    # Left over by an interrupted reload
+    shadow.drop()
+    db.create_collection(shadow.name)
+    for start in range(0, len(documents), batch_size):
+        # insert_many adds _id to the documents it is given; copies keep the
+        # caller's documents reusable for the next database
+        shadow.insert_many([dict(document) for document in documents[start:start + batch_size]], ordered=False)
+    models = index_models(db[collection_name])
+    if models:
+        shadow.create_indexes(models)
+    return shadow
+
+
+def reload_collections(dbs, documents_by_collection, batch_size=None):
+    """
+    Replace the contents of collections in every database with new documents
+
+    Args:
+        dbs: Dict of database alias to database
+        documents_by_collection: Dict of collection name to its complete new documents
+        batch_size: Documents per insert_many (defaults to ANALYTICS_REBUILD['INSERT_BATCH_SIZE'])
+
+    Returns:
+        dict: Collection name -> number of documents loaded
+    """
+    batch_size = batch_size or ANALYTICS_REBUILD['INSERT_BATCH_SIZE']
+    shadows = []
+    try:
+        for db in dbs.values():
+            for collection_name, documents in documents_by_collection.items():
+                shadows.append((db, collection_name, _build_shadow(db, collection_name, documents, batch_size)))
+    except Exception:
+        for db in dbs.values():
+            for collection_name in documents_by_collection:
+                db.drop_collection(shadow_collection_name(collection_name))
+        raise
+
+    for db, collection_name, shadow in shadows:
+        shadow.rename(collection_name, dropTarget=True)
+    logger.info(f"Reloaded {', '.join(documents_by_collection)} in {len(dbs)} databases")
+    return {collection_name: len(documents) for collection_name, documents in documents_by_collection.items()}
@@ -0,0 +1,142 @@
+"""
+Staging-Collection Merge Writes
+
+Instead of one client-built ``UpdateOne(..., upsert=True)`` per document,
+documents are inserted unordered into a per-upload staging collection that
+has no secondary indexes. Once every chunk is staged, one ``$merge``
+aggregation per target collection upserts them on the server, and the
+staging collection is dropped. Requires MongoDB 4.2 or later.
+
+Every staged document carries its position in the upload (the chunk's row
+offset plus its position in the chunk), so the merge keeps the version of a
+key that comes last in the file whichever writer thread staged it first.
+Chunks only count as committed once the merge has written their rows: their
+checkpoints and row hashes are recorded after it, and a resumed upload
+drops whatever an earlier attempt staged and stages its chunks again.
+"""
+
+import logging
+from core.csv_processing_config import STAGED_MERGE
+from core.upload_rollback import OWNED_COLLECTIONS, UPLOAD_OWNERS, UPLOAD_TAG
+
+logger = logging.getLogger(__name__)
+
+# Field holding a staged document's position in the upload
+STAGED_SEQUENCE = '_staged_seq'
+
+# Target collection -> key documents are matched on (must be unique in the target)
+MERGE_KEYS = {
+    'customers': 'customer_id',
+    'products': 'product_id',
+    'orders': 'order_id',
+    'sales': 'id',
+}
+
+
+def staging_collection_name(upload_id, collection_name, part=None):
+    """Return the staging collection of one target collection for an upload (or part of one)"""
+    suffix = f"_{part}" if part is not None else ''
+    return f"staging_{collection_name}_{upload_id}{suffix}"
+
+
+def merge_pipeline(collection_name):
+    """
+    Return the aggregation that upserts a staging collection into its target
+
+    A key staged more than once keeps the version with the highest
+    sequence, matching what upserts in file order would leave. Fact rows
+    keep the upload tag they were first written with and gain the upload
+    among their owners, as with core.upload_rollback.owned_upsert.
+    """
+    key = MERGE_KEYS[collection_name]
+    pipeline = [
+        {'$sort': {STAGED_SEQUENCE: 1}},
+        {'$group': {'_id': f'${key}', 'document': {'$last': '$$ROOT'}}},
+        {'$replaceRoot': {'newRoot': '$document'}},
+        # Staging _ids must not overwrite the _ids of existing documents
+        {'$project': {'_id': 0, STAGED_SEQUENCE: 0}},
+    ]
+    when_matched = 'merge'
+    if collection_name in OWNED_COLLECTIONS:
+        pipeline.append({'$set': {UPLOAD_OWNERS: [f'${UPLOAD_TAG}']}})
+        when_matched = [{'$replaceWith': {'$mergeObjects': [
+            '$$ROOT',
+            '$$new',
+            {
+                UPLOAD_TAG: {'$ifNull': [f'${UPLOAD_TAG}', f'$$new.{UPLOAD_TAG}']},
+                UPLOAD_OWNERS: {'$setUnion': [{'$ifNull': [f'${UPLOAD_OWNERS}', []]}, f'$$new.{UPLOAD_OWNERS}']},
+            },
+        ]}}]
+    pipeline.append(
+        {'$merge': {'into': collection_name, 'on': key, 'whenMatched': when_matched, 'whenNotMatched': 'insert'}}
+    )
+    return pipeline
+
+
+def ensure_merge_index(collection, key):
+    """Create the unique index $merge needs on the key field, if the target has none"""
+    for info in collection.index_information().values():
+        if info.get('unique') and [field for field, _ in info['key']] == [key]:
+            return
+    collection.create_index([(key, 1)], unique=True, name=f"{key}_merge_idx")
+
+
+class StagingArea:
+    """
+    The staging collections of one upload, or of one part of an upload processed separately
+    """
+    def __init__(self, upload_id, part=None, collections=None):
+        """
+        Args:
+            upload_id: ID of the upload record
+            part: Key of the part of the upload (e.g. its first row offset)
+            collections: Target collections written through staging
+                (defaults to STAGED_MERGE['COLLECTIONS'])
+        """
+        self.names = {
+            collection_name: staging_collection_name(upload_id, collection_name, part)
+            for collection_name in (collections or STAGED_MERGE['COLLECTIONS'])
+        }
+        # Row hashes of the staged chunks, recorded once the merge has written their rows
+        self.row_hashes = staging_collection_name(upload_id, 'row_hashes', part)
+
+    def handles(self, collection_name):
+        """Whether writes to a collection go through staging"""
+        return collection_name in self.names
+
+    def sequenced(self, documents, first_sequence):
+        """Return copies of documents to stage, numbered from their position in the upload"""
+        return [{**doc, STAGED_SEQUENCE: first_sequence + position} for position, doc in enumerate(documents)]
+
+    def last_versions(self, db, collection_name, fields):
+        """Yield the fields of the version of each staged key that the merge keeps"""
+        key = MERGE_KEYS[collection_name]
+        pipeline = [
+            {'$sort': {STAGED_SEQUENCE: 1}},
+            {'$group': {'_id': f'${key}', **{field: {'$last': f'${field}'} for field in fields if field != key}}},
+        ]
+        for version in db[self.names[collection_name]].aggregate(pipeline, allowDiskUse=True):
+            version[key] = version.pop('_id')
+            yield version
+
+    def drop(self, db):
+        """Drop the staging collections in a database, e.g. what an attempt that never merged left"""
+        for staging_name in (*self.names.values(), self.row_hashes):
+            db.drop_collection(staging_name)
+
+    def merge(self, db, collection_name):
+        """
+        Upsert the staged documents of one collection into it on the server and drop the staging collection
+
+        Returns:
+            int: Number of documents that were staged
+        """
+        staging = db[self.names[collection_name]]
+        staged = staging.estimated_document_count()
+        if staged:
+            ensure_merge_index(db[collection_name], MERGE_KEYS[collection_name])
+            # $merge returns no documents; iterating runs the pipeline
+            for _ in staging.aggregate(merge_pipeline(collection_name), allowDiskUse=True):
+                pass
+        staging.drop()
+        return staged
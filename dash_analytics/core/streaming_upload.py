@@ -0,0 +1,181 @@
+"""
+Parse-While-Receiving Uploads
+
+A Django upload handler that hands each chunk of an uploaded CSV to the bulk
+processor as it arrives, instead of waiting for the whole request body. The
+request thread pushes received bytes into a bounded pipe; a worker thread
+runs the chunked CSV parser over the other end. Ingest therefore overlaps
+the transfer, and a slow ingest throttles how fast the body is read.
+"""
+
+import hashlib
+import io
+import logging
+import queue
+import threading
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from core.csv_processing_config import STREAMING_UPLOAD
+from core.upload_formats import compression_available, detect_compression, detect_file_format
+
+logger = logging.getLogger(__name__)
+
+
+class UploadInterrupted(IOError):
+    """Raised to the parser when the request body ends before the file does"""
+
+
+class ChunkPipe(io.RawIOBase):
+    """
+    Bounded, blocking byte pipe from the request thread to a parser thread
+    """
+    def __init__(self, max_chunks=None):
+        super().__init__()
+        self._chunks = queue.Queue(maxsize=max_chunks or STREAMING_UPLOAD['PIPE_DEPTH'])
+        self._current = memoryview(b'')
+        self._eof = False
+        self._interrupted = False
+        self._reader_closed = threading.Event()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._current:
+            if self._eof:
+                if self._interrupted:
+                    raise UploadInterrupted("Upload was interrupted before the file was fully received")
+                return 0
+            chunk = self._chunks.get()
+            if chunk is None:
+                self._eof = True
+                continue
+            self._current = memoryview(chunk)
+        size = min(len(buffer), len(self._current))
+        buffer[:size] = self._current[:size]
+        self._current = self._current[size:]
+        return size
+
+    def close(self):
+        # The parser is done (or failed); stop the writer from blocking on it
+        self._reader_closed.set()
+        super().close()
+
+    def write_chunk(self, chunk):
+        """Queue received bytes, blocking while the parser is behind"""
+        while not self._reader_closed.is_set():
+            try:
+                self._chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, interrupted=False):
+        """Signal the end of the file to the parser"""
+        self._interrupted = interrupted
+        self.write_chunk(None)
+
+
+class StreamingIngestUploadHandler(FileUploadHandler):
+    """
+    Upload handler that ingests the 'file' field of a request while it is received
+
+    The upload record is created as soon as the file part starts, through
+    ``start_upload(file_name)``, and the processor runs on a worker thread.
+    The file is not kept: nothing is added to ``request.FILES``. Call
+    ``wait()`` after the body has been parsed to get the processing result.
+    """
+    def __init__(self, processor, start_upload, field_name='file', request=None):
+        """
+        Args:
+            processor: BulkDataProcessor that ingests the file
+            start_upload: Callable taking the file name and returning the new upload's ID
+            field_name: Form field carrying the file
+            request: Django request (passed by Django when installed as a default handler)
+        """
+        super().__init__(request)
+        self.processor = processor
+        self.start_upload = start_upload
+        self.expected_field = field_name
+        self.upload_id = None
+        self.error = None
+        self.content_hash = None
+        self.received_bytes = 0
+        self._digest = hashlib.sha256()
+        self._pipe = None
+        self._receiving = False
+        self._worker = None
+        self._result = None
+        self._exception = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None,
+                 content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        if field_name != self.expected_field or self._worker is not None:
+            return
+
+        compression = detect_compression(file_name)
+        if detect_file_format(file_name) != 'csv':
+            self.error = 'Streaming uploads must be CSV files (optionally .gz, .bz2 or .zst compressed)'
+        elif not compression_available(compression):
+            self.error = f'{compression} compressed uploads are not supported on this server'
+        if self.error:
+            raise StopFutureHandlers()
+
+        self.upload_id = self.start_upload(file_name)
+        self._pipe = ChunkPipe()
+        self._worker = threading.Thread(
+            target=self._ingest, args=(compression,),
+            name=f"streaming-ingest-{self.upload_id}", daemon=True
+        )
+        self._worker.start()
+        self._receiving = True
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self._receiving:
+            return raw_data
+        self._digest.update(raw_data)
+        self.received_bytes += len(raw_data)
+        self._pipe.write_chunk(bytes(raw_data))
+        return None
+
+    def file_complete(self, file_size):
+        if self._receiving:
+            self._receiving = False
+            self.content_hash = self._digest.hexdigest()
+            self._pipe.finish()
+        return None
+
+    def upload_interrupted(self):
+        if self._receiving:
+            self._receiving = False
+            self._pipe.finish(interrupted=True)
+
+    def _ingest(self, compression):
+        """Worker thread body: parse the piped bytes through the bulk processor"""
+        reader = io.BufferedReader(self._pipe, buffer_size=STREAMING_UPLOAD['READ_BUFFER'])
+        try:
+            self._result = self.processor.process_file(reader, self.upload_id, 'csv', compression=compression)
+        except Exception as e:
+            logger.error(f"Error ingesting streamed upload {self.upload_id}: {str(e)}")
+            self._exception = e
+        finally:
+            reader.close()
+
+    def wait(self):
+        """
+        Wait for the ingest to finish and return its statistics
+
+        Raises:
+            Exception: Whatever made the ingest fail
+        """
+        if self._worker is None:
+            return None
+        if self._receiving:
+            # The request body ended without completing the file part
+            self._receiving = False
+            self._pipe.finish(interrupted=True)
+        self._worker.join()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
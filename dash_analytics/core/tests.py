@@ -0,0 +1,802 @@
+"""
+Tests of the ingest pipeline against in-memory MongoDB databases
+
+Run with ``python manage.py test core`` after installing requirements-dev.txt;
+they are skipped unless mongomock is installed.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import types
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from django.test import SimpleTestCase
+from pymongo.errors import DuplicateKeyError
+
+try:
+    import mongomock
+    import mongomock.collection
+except ImportError:
+    mongomock = None
+
+from core.batch_ingest import extract_archive, ingest_batch
+from core.bulk_load import DeferredIndexes
+from core.bulk_processor import BulkDataProcessor
+from core.distributed_ingest import iter_range_chunks, merge_range_stats, plan_ranges
+from core.event_ingest import EventBatcher, EventBufferFull, parse_event_lines
+from core.incremental_analytics import customer_segment_updates, ensure_analytics_indexes, months_spanned
+from core.ingest_scheduler import IngestScheduler, admitted
+from core.models import RawDataUpload
+from core.upload_cancellation import (
+    UploadCancelled, clear_cancellation, finish_cancellation, request_cancellation,
+)
+from core.upload_rollback import (
+    UPLOAD_INDEX_NAME, UPLOAD_OWNERS, UPLOAD_OWNERS_INDEX_NAME, UPLOAD_TAG, rollback_upload,
+)
+
+DATABASES = ('low_review_score_db', 'high_review_score_db')
+
+
+def retail_rows(count=200, seed=7):
+    """Return a frame of retail CSV rows with distinct orders"""
+    random = np.random.RandomState(seed)
+    order_dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.arange(count) * 36, unit='h')
+    product_ids = random.randint(1, 11, count)
+    return pd.DataFrame({
+        'customer_id': random.randint(1, 41, count),
+        'order_date': order_dates.strftime('%Y-%m-%d %H:%M:%S'),
+        'product_id': product_ids,
+        'category_id': product_ids % 3 + 1,
+        'category_name': 'Category ' + pd.Series(product_ids % 3 + 1).astype(str),
+        'product_name': 'Product ' + pd.Series(product_ids).astype(str),
+        'quantity': random.randint(1, 6, count),
+        'price': (product_ids * 7.25).round(2),
+        'payment_method': 'Card',
+        'city': 'Springfield',
+        'review_score': random.randint(1, 6, count).astype(float),
+        'gender': 'F',
+        'age': random.randint(18, 70, count),
+    })
+
+
+@unittest.skipUnless(mongomock, 'mongomock is not installed')
+class IngestTestCase(SimpleTestCase):
+    """Ingests frames into a fresh pair of in-memory databases per test"""
+
+    def setUp(self):
+        client = mongomock.MongoClient()
+        self.dbs = {alias: client[alias] for alias in DATABASES}
+        self.low_db = self.dbs['low_review_score_db']
+        for patcher in (
+            mock.patch('core.bulk_processor.get_db', self.dbs.__getitem__),
+            mock.patch.dict('core.csv_processing_config.PARSED_SPOOL', {'ENABLED': False}),
+            # Keyed by client id, which a later test's client may reuse
+            mock.patch.object(BulkDataProcessor, '_analytics_indexed', set()),
+            # mongomock 4 predates the sort option pymongo 4.11+ passes to bulk updates
+            mock.patch.object(mongomock.collection.BulkOperationBuilder, 'add_update',
+                              self._add_update(mongomock.collection.BulkOperationBuilder.add_update)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _add_update(add_update):
+        def without_sort(builder, *args, sort=None, **kwargs):
+            return add_update(builder, *args, **kwargs)
+        return without_sort
+
+    def processor(self, **options):
+        """Return a BulkDataProcessor writing to the test databases"""
+        settings = dict(chunk_size=50, max_threads=2, transform_processes=0, dedupe_rows=True,
+                        write_strategy='upsert', analytics_strategy='incremental')
+        settings.update(options)
+        return BulkDataProcessor(**settings)
+
+    def new_upload(self, **fields):
+        """Insert an upload record in both databases and return its ID"""
+        upload_id = ObjectId()
+        for db in self.dbs.values():
+            db.raw_data_uploads.insert_one({'_id': upload_id, 'file_name': 'test.csv', 'status': 'processing', **fields})
+        return upload_id
+
+    def ingest(self, frame, upload_id=None, **options):
+        """Ingest a frame as an upload (a new one unless given) and return its ID"""
+        upload_id = upload_id or self.new_upload()
+        self.processor(**options).process_dataframe(frame, upload_id)
+        return upload_id
+
+    def csv_path(self, frame):
+        """Write a frame to a temporary CSV file and return its path"""
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        frame.to_csv(path, index=False)
+        return path
+
+    def assertDimensionsWritten(self, frame):
+        """Assert every customer and product of a frame is stored once"""
+        for alias, db in self.dbs.items():
+            self.assertEqual(db.customers.count_documents({}), frame['customer_id'].nunique(), msg=f"{alias} customers")
+            self.assertEqual(db.products.count_documents({}), frame['product_id'].nunique(), msg=f"{alias} products")
+
+    def assertAnalyticsMatchSales(self):
+        """Assert the incremental totals equal the totals over the stored sales"""
+        for alias, db in self.dbs.items():
+            sales = list(db.sales.find({}, {'_id': 0, 'customer_id': 1, 'revenue': 1}))
+            revenue = sum(sale['revenue'] for sale in sales)
+            for period_type in ('monthly', 'yearly'):
+                trends = list(db.sales_trends.find({'period_type': period_type}))
+                self.assertAlmostEqual(sum(trend['total_sales'] for trend in trends), revenue, places=4,
+                                       msg=f"{alias} {period_type} sales")
+                self.assertEqual(sum(trend['total_orders'] for trend in trends), len(sales),
+                                 msg=f"{alias} {period_type} orders")
+            behavior = list(db.customer_behavior.find())
+            self.assertAlmostEqual(sum(customer['total_spent'] for customer in behavior), revenue, places=4,
+                                   msg=f"{alias} customer spend")
+            self.assertEqual(sum(customer['total_purchases'] for customer in behavior), len(sales),
+                             msg=f"{alias} customer purchases")
+
+
+class StreamingIngestTests(IngestTestCase):
+
+    def test_csv_is_parsed_one_chunk_at_a_time(self):
+        rows = retail_rows()
+        upload_id = self.new_upload()
+        with mock.patch('pandas.read_csv', wraps=pd.read_csv) as read_csv:
+            stats = self.processor().process_csv_stream(self.csv_path(rows), upload_id)
+        self.assertEqual(read_csv.call_args.kwargs['chunksize'], 50)
+        self.assertEqual(stats['processed_records'], len(rows))
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+        self.assertEqual(self.low_db.raw_data_uploads.find_one({'_id': upload_id})['total_records'], len(rows))
+
+    def test_reading_waits_for_the_writers_above_the_memory_limit(self):
+        rows = retail_rows()
+        processor = self.processor()
+        transform = processor.transform
+        sales_written = []
+
+        def recording_transform(chunk_df, upload_id=None):
+            sales_written.append(self.low_db.sales.count_documents({}))
+            return transform(chunk_df, upload_id)
+
+        processor.transform = recording_transform
+        with mock.patch.dict('core.csv_processing_config.BULK_PROCESSING', {'MEMORY_LIMIT': 100}), \
+                mock.patch('core.bulk_processor.get_rss_mb', return_value=1000):
+            stats = processor.process_csv_stream(self.csv_path(rows), self.new_upload())
+        self.assertEqual(stats['memory_throttle_events'], 4)
+        # Every chunk is written before the next one is parsed
+        self.assertEqual(sales_written, [0, 50, 100, 150])
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+
+
+class UploadResumeTests(IngestTestCase):
+    """Without row dedup, which would otherwise skip the rows of every chunk the first attempt wrote"""
+
+    def interrupted_upload(self, rows, committed_chunks):
+        """Stream rows as an upload, then keep only its first checkpoints as if it failed after them"""
+        upload_id = self.new_upload()
+        path = self.csv_path(rows)
+        self.processor(dedupe_rows=False).process_csv_stream(path, upload_id)
+        for db in self.dbs.values():
+            record = db.raw_data_uploads.find_one({'_id': upload_id})
+            checkpoints = sorted(record['checkpoints'], key=lambda checkpoint: checkpoint['offset'])
+            db.raw_data_uploads.update_one({'_id': upload_id}, {'$set': {
+                'status': 'failed', 'checkpoints': checkpoints[:committed_chunks]
+            }})
+        return upload_id, path
+
+    def resume(self, upload_id, path, rows, **options):
+        """Resume an upload of rows and return its stats and the offsets of the chunks it transformed"""
+        processor = self.processor(dedupe_rows=False, **options)
+        transform = processor.transform
+        # Every row has its own order date
+        row_offsets = {date: offset for offset, date in enumerate(pd.to_datetime(rows['order_date']))}
+        offsets = []
+
+        def recording_transform(chunk_df, upload_id=None):
+            offsets.append(row_offsets[pd.Timestamp(chunk_df['order_date'].iloc[0])])
+            return transform(chunk_df, upload_id)
+
+        processor.transform = recording_transform
+        return processor.process_csv_stream(path, upload_id, resume=True), offsets
+
+    def test_every_committed_chunk_is_checkpointed(self):
+        upload_id = self.new_upload()
+        self.processor().process_csv_stream(self.csv_path(retail_rows()), upload_id)
+        checkpoints = self.low_db.raw_data_uploads.find_one({'_id': upload_id})['checkpoints']
+        self.assertEqual(sorted((checkpoint['offset'], checkpoint['row_count']) for checkpoint in checkpoints),
+                         [(0, 50), (50, 50), (100, 50), (150, 50)])
+        self.assertEqual(len({checkpoint['checksum'] for checkpoint in checkpoints}), 4)
+
+    def test_resume_skips_committed_chunks(self):
+        rows = retail_rows()
+        upload_id, path = self.interrupted_upload(rows, committed_chunks=2)
+        # The chunk size of the first attempt is restored, so the offsets still line up
+        stats, offsets = self.resume(upload_id, path, rows, chunk_size=30)
+        self.assertEqual(offsets, [100, 150])
+        self.assertEqual(stats['resumed_records'], 100)
+        self.assertEqual(len(self.low_db.raw_data_uploads.find_one({'_id': upload_id})['checkpoints']), 4)
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+        self.assertAnalyticsMatchSales()
+
+    def test_resume_writes_committed_chunks_that_changed_again(self):
+        rows = retail_rows()
+        upload_id, path = self.interrupted_upload(rows, committed_chunks=2)
+        changed = rows.copy()
+        changed.loc[10, 'quantity'] += 1
+        changed.to_csv(path, index=False)
+        _, offsets = self.resume(upload_id, path, changed)
+        self.assertEqual(offsets, [0, 100, 150])
+        self.assertAnalyticsMatchSales()
+
+
+class DimensionCacheTests(IngestTestCase):
+    """Without row dedup, so uploads repeating rows reach the dimension registry"""
+
+    def setUp(self):
+        super().setUp()
+        self.rows = retail_rows()
+        # Each customer's attributes are the same in every row
+        self.rows['age'] = self.rows['customer_id'] + 20
+
+    def dimension_writes(self, frame):
+        """Ingest a frame and return the customer and product rows it wrote, by key"""
+        upsert_or_stage = BulkDataProcessor._upsert_or_stage
+        written = {'customers': [], 'products': []}
+
+        def recording_upsert(processor, documents, collection_name, first_sequence=0):
+            if collection_name == 'customers':
+                written['customers'].extend(doc['customer_id'] for doc in documents)
+            elif collection_name == 'products':
+                written['products'].extend(doc['product_id'] for doc in documents)
+            return upsert_or_stage(processor, documents, collection_name, first_sequence)
+
+        with mock.patch.object(BulkDataProcessor, '_upsert_or_stage', recording_upsert):
+            self.ingest(frame, dedupe_rows=False)
+        return written
+
+    def test_each_dimension_row_is_written_once_per_upload(self):
+        written = self.dimension_writes(self.rows)
+        self.assertCountEqual(written['customers'], self.rows['customer_id'].unique())
+        self.assertCountEqual(written['products'], self.rows['product_id'].unique())
+        self.assertDimensionsWritten(self.rows)
+
+    def test_only_changed_dimension_rows_are_written_again(self):
+        self.dimension_writes(self.rows)
+        changed = self.rows.copy()
+        changed.loc[changed['customer_id'] == 7, 'age'] = 99
+        written = self.dimension_writes(changed)
+        self.assertEqual(written, {'customers': [7], 'products': []})
+        self.assertEqual(self.low_db.customers.find_one({'customer_id': 7})['age'], 99)
+
+
+class IngestSchedulerTests(IngestTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict('core.csv_processing_config.INGEST_SCHEDULER', {
+            'WRITE_SLOTS': 16, 'READ_RESERVED_SLOTS': 4, 'MIN_SLOTS': 1, 'POLL_INTERVAL': 0.01,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = IngestScheduler(self.dbs)
+
+    def queue(self, ticket, owner, slots):
+        self.scheduler.enqueue(ticket, None, owner, slots, estimated_rows=1000)
+
+    def test_reserved_read_slots_are_never_handed_out(self):
+        self.queue('first', 'alice', 16)
+        self.assertEqual(self.scheduler.try_admit('first'), 12)
+        self.queue('second', 'bob', 4)
+        self.assertEqual(self.scheduler.try_admit('second'), 0)
+        self.assertEqual(self.scheduler.estimate('second')['queue_position'], 1)
+
+        self.scheduler.release('first')
+        self.assertEqual(self.scheduler.try_admit('second'), 4)
+
+    def test_capacity_is_shared_fairly_between_owners(self):
+        self.queue('alice-1', 'alice', 6)
+        self.assertEqual(self.scheduler.try_admit('alice-1'), 6)
+        self.queue('alice-2', 'alice', 12)
+        self.queue('bob-1', 'bob', 12)
+
+        # Bob holds no slots, so his later ingest goes first, with at most half the capacity
+        self.assertEqual(self.scheduler.try_admit('alice-2'), 0)
+        self.assertEqual(self.scheduler.try_admit('bob-1'), 6)
+        self.assertEqual(self.scheduler.try_admit('alice-2'), 0)
+
+        self.scheduler.release('alice-1')
+        self.assertEqual(self.scheduler.try_admit('alice-2'), 6)
+
+    def test_slots_of_an_ingest_without_heartbeats_are_reclaimed(self):
+        self.queue('stale', 'alice', 12)
+        self.scheduler.try_admit('stale')
+        self.scheduler.collection.update_one({'_id': 'stale'}, {'$set': {'heartbeat': 0}})
+        self.queue('next', 'bob', 12)
+        self.assertEqual(self.scheduler.try_admit('next'), 12)
+
+    def test_cancelled_upload_stops_waiting_for_admission(self):
+        self.queue('running', 'alice', 12)
+        self.scheduler.try_admit('running')
+        upload_id = self.new_upload()
+        request_cancellation(self.dbs, upload_id)
+        self.addCleanup(clear_cancellation, self.dbs, upload_id)
+
+        with self.assertRaises(UploadCancelled):
+            with admitted(upload_id, 'bob', 4, 1000, timeout=5, dbs=self.dbs):
+                self.fail('admitted while the capacity is in use')
+        # The waiting ticket leaves the queue
+        self.assertIsNone(self.scheduler.collection.find_one({'_id': str(upload_id)}))
+
+
+class IncrementalAnalyticsTests(IngestTestCase):
+
+    def refreshed_behavior_ids(self, frame):
+        """Ingest a frame and return the behavior IDs its segment refresh was scoped to"""
+        with mock.patch('core.bulk_processor.customer_segment_updates',
+                        wraps=customer_segment_updates) as segment_updates:
+            self.ingest(frame)
+        return segment_updates.call_args.args[1]
+
+    def test_segment_refresh_is_scoped_to_the_upload_customers(self):
+        rows = retail_rows()
+        self.ingest(rows)
+
+        later = rows.iloc[100:120].copy()
+        later['order_date'] = (pd.to_datetime(later['order_date']) + pd.Timedelta(hours=1)).dt.strftime('%Y-%m-%d %H:%M:%S')
+        self.assertEqual(self.refreshed_behavior_ids(later),
+                         {f"behavior-{customer_id}" for customer_id in later['customer_id']})
+
+    def test_segment_refresh_covers_every_customer_when_the_span_grows(self):
+        rows = retail_rows()
+        self.ingest(rows)
+
+        later = rows.iloc[:5].copy()
+        later['order_date'] = (pd.to_datetime(later['order_date']) + pd.DateOffset(years=1)).dt.strftime('%Y-%m-%d %H:%M:%S')
+        self.assertIsNone(self.refreshed_behavior_ids(later))
+        months = months_spanned([trend['period_value'] for trend in self.low_db.sales_trends.find({'period_type': 'monthly'})])
+        for customer in self.low_db.customer_behavior.find():
+            self.assertAlmostEqual(customer['purchase_frequency'], customer['total_purchases'] / months)
+
+    def test_overlapping_upload_counts_replaced_sales_once(self):
+        rows = retail_rows()
+        self.ingest(rows)
+        self.assertAnalyticsMatchSales()
+
+        # The same orders again, 50 of them with corrected review scores and quantities
+        corrected = rows.copy()
+        corrected.loc[:49, 'review_score'] = 6 - corrected.loc[:49, 'review_score']
+        corrected.loc[:24, 'quantity'] += 1
+        self.ingest(corrected)
+
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+        self.assertAnalyticsMatchSales()
+
+    def test_incremental_analytics_keep_no_upload_frame(self):
+        rows = retail_rows()
+        processor = self.processor()
+        processor.process_dataframe(rows, self.new_upload())
+        self.assertTrue(processor.analytics_df.empty)
+
+        class FrameProcessor(BulkDataProcessor):
+            keeps_analytics_frame = True
+
+        processor = FrameProcessor(chunk_size=50, transform_processes=0)
+        processor.process_dataframe(rows, self.new_upload())
+        self.assertEqual(len(processor.analytics_df), len(rows))
+
+    def assertRepeatedOrdersCountOnce(self, **options):
+        rows = retail_rows()
+        # Half of the orders sent again later in the same file, with new quantities
+        repeated = rows.iloc[:100].copy()
+        repeated['quantity'] += 1
+        self.ingest(pd.concat([rows, repeated], ignore_index=True), **options)
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+        self.assertDimensionsWritten(rows)
+        self.assertAnalyticsMatchSales()
+
+    def test_order_repeated_within_an_upload_counts_once(self):
+        self.assertRepeatedOrdersCountOnce()
+
+    def test_order_repeated_within_an_upload_counts_once_without_row_dedup(self):
+        self.assertRepeatedOrdersCountOnce(dedupe_rows=False)
+
+    def test_chunk_failing_after_its_sales_are_written_is_counted_once(self):
+        rows = retail_rows()
+        bulk_insert = BulkDataProcessor._bulk_insert
+        failures = []
+
+        def failing_review_insert(processor, documents, collection_name, db=None):
+            if collection_name == 'high_reviews' and not failures:
+                failures.append(collection_name)
+                raise RuntimeError('connection reset')
+            return bulk_insert(processor, documents, collection_name, db)
+
+        with mock.patch.object(BulkDataProcessor, '_bulk_insert', failing_review_insert):
+            upload_id = self.ingest(rows, dedupe_rows=False)
+        self.assertEqual(failures, ['high_reviews'])
+        self.assertAnalyticsMatchSales()
+
+        # Written again, as a resume would
+        self.ingest(rows, upload_id=upload_id, dedupe_rows=False)
+        self.assertAnalyticsMatchSales()
+
+
+class StagedMergeTests(IngestTestCase):
+    """Uploads written with the 'staged_merge' strategy (mongomock has no $merge, so the client fallback merges)"""
+
+    def test_order_repeated_in_a_later_chunk_keeps_its_last_version(self):
+        rows = retail_rows()
+        repeated = rows.iloc[:100].copy()
+        repeated['quantity'] += 1
+        self.ingest(pd.concat([rows, repeated], ignore_index=True), write_strategy='staged_merge', dedupe_rows=False)
+
+        quantities = {sale['id']: sale['quantity'] for sale in self.low_db.sales.find()}
+        self.assertEqual(len(quantities), len(rows))
+        self.assertEqual(sorted(quantities.values()),
+                         sorted([*repeated['quantity'], *rows['quantity'].iloc[100:]]))
+        self.assertDimensionsWritten(rows)
+        self.assertAnalyticsMatchSales()
+
+    def test_chunks_are_committed_only_once_merged(self):
+        rows = retail_rows()
+        upload_id = self.new_upload()
+        with mock.patch.object(BulkDataProcessor, '_upsert_from_staging', side_effect=RuntimeError('merge failed')):
+            with self.assertRaises(RuntimeError):
+                self.ingest(rows, upload_id=upload_id, write_strategy='staged_merge')
+        record = self.low_db.raw_data_uploads.find_one({'_id': upload_id})
+        self.assertFalse(record.get('checkpoints'))
+        self.assertEqual(self.low_db.ingested_row_hashes.count_documents({}), 0)
+
+        # The resumed upload stages every chunk again instead of skipping them as written
+        self.ingest(rows, upload_id=upload_id, write_strategy='staged_merge')
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+        self.assertEqual(self.low_db.ingested_row_hashes.count_documents({}), len(rows))
+        self.assertEqual(len(self.low_db.raw_data_uploads.find_one({'_id': upload_id})['checkpoints']), 4)
+        self.assertFalse([name for name in self.low_db.list_collection_names() if name.startswith('staging_')])
+        self.assertAnalyticsMatchSales()
+
+
+class DistributedIngestTests(IngestTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rows = retail_rows()
+        # Quoted fields spanning lines must not split a record between ranges
+        self.rows.loc[::7, 'product_name'] = 'Product\nwith "notes"'
+        self.path = self.csv_path(self.rows)
+
+    def test_csv_ranges_hold_whole_chunks_of_whole_records(self):
+        ranges = plan_ranges(self.path, 'csv', chunk_size=50, rows_per_task=120)
+        self.assertEqual([(task_range['offset'], task_range['row_count']) for task_range in ranges],
+                         [(0, 100), (100, 100)])
+        chunks = [chunk for task_range in ranges for chunk in iter_range_chunks(self.path, 'csv', task_range, 50)]
+        self.assertEqual([len(chunk) for chunk in chunks], [50, 50, 50, 50])
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), pd.read_csv(self.path))
+
+    def test_ranges_ingested_concurrently_match_a_single_ingest(self):
+        upload_id = self.new_upload()
+        ranges = plan_ranges(self.path, 'csv', chunk_size=50, rows_per_task=100)
+
+        def ingest_range(task_range):
+            return self.processor().process_range(
+                iter_range_chunks(self.path, 'csv', task_range, 50), upload_id, task_range['offset']
+            )
+
+        with ThreadPoolExecutor(len(ranges)) as executor:
+            stats = merge_range_stats(executor.map(ingest_range, ranges))
+        self.assertEqual(stats['processed_records'], len(self.rows))
+        checkpoints = self.low_db.raw_data_uploads.find_one({'_id': upload_id})['checkpoints']
+        self.assertEqual(sorted(checkpoint['offset'] for checkpoint in checkpoints), [0, 50, 100, 150])
+        self.assertEqual(self.low_db.sales.count_documents({}), len(self.rows))
+        self.assertAnalyticsMatchSales()
+
+
+class BatchIngestTests(IngestTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.post_upload_hook = mock.Mock()
+        for patcher in (
+            mock.patch('core.batch_ingest.get_db', self.dbs.__getitem__),
+            mock.patch.object(RawDataUpload, 'save_to_all', self.save_upload),
+            mock.patch.dict('sys.modules', {
+                'post_upload_hooks': types.SimpleNamespace(post_csv_upload_hook=self.post_upload_hook)
+            }),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def save_upload(self, data):
+        record = {('_id' if field == 'id' else field): value for field, value in data.items()}
+        for db in self.dbs.values():
+            db.raw_data_uploads.insert_one(dict(record))
+
+    def write_file(self, name, frame=None):
+        path = os.path.join(self.directory, name)
+        if frame is None:
+            with open(path, 'wb') as corrupt:
+                corrupt.write(b'not a parquet file')
+        else:
+            frame.to_csv(path, index=False)
+        return path
+
+    def test_archive_data_files_are_extracted_under_numbered_names(self):
+        archive_path = os.path.join(self.directory, 'export.zip')
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            archive.writestr('2024/part.csv', 'customer_id\n1\n')
+            archive.writestr('2025/part.csv', 'customer_id\n2\n')
+            archive.writestr('README.txt', 'notes')
+            archive.writestr('__MACOSX/2024/._part.csv', '')
+        paths = extract_archive(archive_path, os.path.join(self.directory, 'extracted'))
+        self.assertEqual([os.path.basename(path) for path in paths], ['0000_part.csv', '0001_part.csv'])
+        self.assertEqual(pd.read_csv(paths[1])['customer_id'].tolist(), [2])
+
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            archive.writestr('README.txt', 'notes')
+        with self.assertRaises(ValueError):
+            extract_archive(archive_path, os.path.join(self.directory, 'empty'))
+
+    def test_files_of_a_batch_share_dimensions_and_analytics(self):
+        rows = retail_rows()
+        paths = [self.write_file('a.csv', rows.iloc[:100]), self.write_file('b.csv', rows.iloc[100:]),
+                 self.write_file('c.parquet')]
+        parent_id = self.new_upload()
+        with mock.patch.dict('core.csv_processing_config.BULK_PROCESSING', {'CHUNK_SIZE': 50}):
+            stats = ingest_batch(parent_id, paths, max_parallel=3)
+
+        self.assertEqual([file_info['status'] for file_info in stats['files']], ['completed', 'completed', 'failed'])
+        self.assertEqual(stats['processed_records'], len(rows))
+        # Customers and products in both files are written once for the batch
+        self.assertEqual(stats['dimension_rows_written'],
+                         rows['customer_id'].nunique() + rows['product_id'].nunique())
+        self.assertDimensionsWritten(rows)
+        self.assertAnalyticsMatchSales()
+        self.post_upload_hook.assert_called_once_with()
+
+        parent = self.low_db.raw_data_uploads.find_one({'_id': parent_id})
+        self.assertEqual((parent['status'], parent['processed_records']), ('failed', len(rows)))
+        children = self.low_db.raw_data_uploads.find({'parent_upload': parent_id})
+        self.assertEqual(sorted(child['status'] for child in children), ['completed', 'completed', 'failed'])
+
+
+class AnalyticsIndexTests(IngestTestCase):
+
+    def test_ingest_makes_analytics_ids_unique(self):
+        self.ingest(retail_rows(count=50))
+        for alias, db in self.dbs.items():
+            for collection_name in ('sales_trends', 'customer_behavior'):
+                existing = db[collection_name].find_one({}, {'_id': 0})
+                with self.assertRaises(DuplicateKeyError, msg=f"{alias} {collection_name}"):
+                    db[collection_name].insert_one(existing)
+
+    def test_duplicate_ids_are_reported_instead_of_indexed(self):
+        self.low_db.sales_trends.insert_many([{'id': 'trend-yearly-2024'}, {'id': 'trend-yearly-2024'}])
+        with self.assertLogs('core.incremental_analytics', 'ERROR'):
+            self.assertFalse(ensure_analytics_indexes(self.low_db))
+        self.assertTrue(ensure_analytics_indexes(self.dbs['high_review_score_db']))
+
+
+class EventMicroBatchTests(IngestTestCase):
+
+    def test_retried_batch_keeps_the_totals_of_sales_written_before_it_failed(self):
+        events = retail_rows(count=60)
+        processor = self.processor(write_strategy='idempotent')
+        bulk_insert = BulkDataProcessor._bulk_insert
+
+        def failing_review_insert(processor, documents, collection_name, db=None):
+            if collection_name == 'high_reviews':
+                raise RuntimeError('connection reset')
+            return bulk_insert(processor, documents, collection_name, db)
+
+        with mock.patch.object(BulkDataProcessor, '_bulk_insert', failing_review_insert):
+            self.assertEqual(processor.write_micro_batch(events, 0)['failed_records'], len(events))
+        # Requeued and written again, as core.event_ingest.EventBatcher does
+        stats = processor.write_micro_batch(events, 1, refresh_analytics=True)
+
+        self.assertEqual(stats['failed_records'], 0)
+        self.assertEqual(self.low_db.sales.count_documents({}), len(events))
+        self.assertAnalyticsMatchSales()
+
+
+class EventBatcherTests(IngestTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.events = retail_rows(count=30)
+        self.valid, _ = parse_event_lines(self.event_lines(self.events))
+
+    @staticmethod
+    def event_lines(events):
+        return [json.dumps(event) for event in events.astype(object).to_dict('records')]
+
+    def batcher(self, **options):
+        settings = dict(processor=self.processor(write_strategy='idempotent'), max_events=20, max_seconds=60,
+                        max_buffered=50)
+        settings.update(options)
+        return EventBatcher(**settings)
+
+    def test_invalid_events_are_rejected_by_line(self):
+        lines = self.event_lines(self.events.iloc[:3])
+        missing_price = self.events.iloc[3].drop('price').astype(object).to_dict()
+        lines[1:1] = ['{"customer_id": ', '', '[1, 2]', json.dumps(missing_price)]
+        valid, errors = parse_event_lines(lines)
+        self.assertEqual(len(valid), 3)
+        self.assertEqual([error['line'] for error in errors], [2, 4, 5])
+        self.assertIn('invalid JSON', errors[0]['reason'])
+        self.assertEqual(errors[1]['reason'], 'not a JSON object')
+
+    def test_events_are_written_once_a_batch_fills(self):
+        batcher = self.batcher()
+        sequence = batcher.submit(self.valid.iloc[:10])
+        self.assertFalse(batcher.wait_written(sequence, timeout=0.2))
+        self.assertEqual(self.low_db.sales.count_documents({}), 0)
+
+        # Everything buffered is written, in batches of at most max_events
+        sequence = batcher.submit(self.valid.iloc[10:25])
+        self.assertTrue(batcher.wait_written(sequence, timeout=10))
+        self.assertEqual(self.low_db.sales.count_documents({}), 25)
+        self.assertEqual(batcher.stats['batches_written'], 2)
+
+    def test_events_are_written_once_the_oldest_has_waited(self):
+        batcher = self.batcher(max_seconds=0.2)
+        sequence = batcher.submit(self.valid.iloc[:5])
+        self.assertTrue(batcher.wait_written(sequence, timeout=10))
+        self.assertEqual(self.low_db.sales.count_documents({}), 5)
+
+    def test_submissions_beyond_the_buffer_are_refused(self):
+        batcher = self.batcher(max_events=100, max_buffered=20)
+        batcher.submit(self.valid.iloc[:15])
+        with self.assertRaises(EventBufferFull):
+            batcher.submit(self.valid.iloc[15:30])
+        self.assertEqual(batcher.buffered(), 15)
+
+    def test_failed_batch_is_written_again(self):
+        batcher = self.batcher(max_seconds=0.2)
+        write_micro_batch = batcher._processor.write_micro_batch
+        attempts = []
+
+        def failing_once(valid_df, batch_index, refresh_analytics=False):
+            attempts.append(batch_index)
+            if len(attempts) == 1:
+                raise RuntimeError('connection reset')
+            return write_micro_batch(valid_df, batch_index, refresh_analytics)
+
+        batcher._processor.write_micro_batch = failing_once
+        sequence = batcher.submit(self.valid)
+        self.assertTrue(batcher.wait_written(sequence, timeout=10))
+        self.assertEqual(batcher.stats['batches_failed'], 1)
+        self.assertEqual(self.low_db.sales.count_documents({}), len(self.valid))
+        self.assertAnalyticsMatchSales()
+
+
+class UploadCancellationTests(IngestTestCase):
+
+    def cancelled_upload(self, rows, rollback=False, after_chunks=3):
+        """
+        Stream rows as an upload that is cancelled while a chunk is transformed
+
+        The chunks transformed but not yet handed to the writers are dropped,
+        so with inline transforms all but the last two are written.
+        """
+        upload_id = self.new_upload()
+        self.addCleanup(clear_cancellation, self.dbs, upload_id)
+        path = self.csv_path(rows)
+        processor = self.processor()
+        transform = processor.transform
+        transformed = []
+
+        def cancelling_transform(chunk_df, upload_id=None):
+            transformed.append(len(chunk_df))
+            if len(transformed) == after_chunks:
+                request_cancellation(self.dbs, upload_id, rollback=rollback)
+            return transform(chunk_df, upload_id)
+
+        processor.transform = cancelling_transform
+        with self.assertRaises(UploadCancelled) as cancelled:
+            processor.process_csv_stream(path, upload_id)
+        finish_cancellation(self.dbs, upload_id)
+        return upload_id, path, cancelled.exception.stats
+
+    def test_cancelled_upload_keeps_only_committed_chunks_and_resumes(self):
+        rows = retail_rows()
+        upload_id, path, stats = self.cancelled_upload(rows)
+        record = self.low_db.raw_data_uploads.find_one({'_id': upload_id})
+        self.assertEqual(record['status'], 'cancelled')
+        committed_rows = sum(checkpoint['row_count'] for checkpoint in record['checkpoints'])
+        self.assertEqual(committed_rows, 50)
+        self.assertEqual(self.low_db.sales.count_documents({}), committed_rows)
+        self.assertEqual(stats['processed_records'], committed_rows)
+        self.assertAnalyticsMatchSales()
+
+        clear_cancellation(self.dbs, upload_id)
+        self.processor().process_csv_stream(path, upload_id, resume=True)
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+        self.assertAnalyticsMatchSales()
+
+    def test_cancellation_can_roll_back_the_upload(self):
+        upload_id, _, _ = self.cancelled_upload(retail_rows(), rollback=True)
+        self.assertEqual(self.low_db.raw_data_uploads.find_one({'_id': upload_id})['status'], 'cancelled')
+        for alias, db in self.dbs.items():
+            for collection_name in ('orders', 'sales', 'low_reviews', 'high_reviews'):
+                self.assertEqual(db[collection_name].count_documents({}), 0, msg=f"{alias} {collection_name}")
+        self.assertAnalyticsMatchSales()
+
+
+class UploadRollbackTests(IngestTestCase):
+
+    def test_rollback_keeps_rows_a_later_upload_contains(self):
+        rows = retail_rows()
+        first = self.ingest(rows)
+
+        # A later upload of the same orders, 50 of them corrected and the rest skipped as already ingested
+        corrected = rows.copy()
+        corrected.loc[:49, 'review_score'] = 6 - corrected.loc[:49, 'review_score']
+        second = self.ingest(corrected)
+
+        rollback_upload(self.dbs, first)
+        self.assertEqual(self.low_db.sales.count_documents({}), len(rows))
+        self.assertEqual(self.low_db.orders.count_documents({}), len(rows))
+        self.assertEqual(self.low_db.ingested_row_hashes.count_documents({'upload_ids': second}), len(rows))
+        self.assertEqual(self.low_db.sales.count_documents({'upload_ids': first}), 0)
+        self.assertAnalyticsMatchSales()
+        record = self.low_db.raw_data_uploads.find_one({'_id': first})
+        self.assertEqual(record['rollback_shared']['low_review_score_db']['sales'], len(rows))
+
+        # With nothing else containing them, rolling back the later upload removes the rows
+        rollback_upload(self.dbs, second)
+        self.assertEqual(self.low_db.sales.count_documents({}), 0)
+        self.assertEqual(self.low_db.orders.count_documents({}), 0)
+        self.assertAnalyticsMatchSales()
+
+
+class DeferredIndexTests(IngestTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for db in self.dbs.values():
+            db.orders.create_index('customer_id', name='customer_id_idx')
+            db.orders.create_index(UPLOAD_TAG, name=UPLOAD_INDEX_NAME)
+            db.orders.create_index(UPLOAD_OWNERS, name=UPLOAD_OWNERS_INDEX_NAME)
+
+    def deferral(self):
+        return DeferredIndexes(self.dbs, self.new_upload(), collections=['orders'])
+
+    def test_only_the_claiming_upload_drops_and_rebuilds(self):
+        first, second = self.deferral(), self.deferral()
+        self.assertEqual(first.defer(), 2)
+        self.assertEqual(second.defer(), 0)
+        # The second upload rebuilds nothing, so the indexes stay dropped until the first finishes
+        self.assertTrue(second.rebuild())
+        self.assertNotIn('customer_id_idx', self.low_db.orders.index_information())
+
+        self.assertTrue(first.rebuild())
+        self.assertIn('customer_id_idx', self.low_db.orders.index_information())
+        self.assertEqual(second.defer(), 2)
+
+    def test_upload_tag_indexes_are_kept(self):
+        deferral = self.deferral()
+        deferral.defer()
+        self.assertEqual({index['name'] for index in deferral.indexes}, {'customer_id_idx'})
+        for alias, db in self.dbs.items():
+            self.assertLessEqual({UPLOAD_INDEX_NAME, UPLOAD_OWNERS_INDEX_NAME}, set(db.orders.index_information()),
+                                 msg=alias)
+
+    def test_resumed_load_keeps_the_indexes_it_dropped(self):
+        first = self.deferral()
+        first.defer()
+        resumed = DeferredIndexes(self.dbs, first.upload_id, collections=['orders'])
+        self.assertEqual(resumed.defer(), 0)
+        self.assertEqual(len(resumed.indexes), 2)
+        resumed.rebuild()
+        self.assertIn('customer_id_idx', self.low_db.orders.index_information())
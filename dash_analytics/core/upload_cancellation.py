@@ -0,0 +1,166 @@
+"""
+Cooperative Upload Cancellation
+
+Cancelling an upload records a request on its record (``cancel_requested``).
+The process ingesting it checks for the request between chunks and before
+each transformed batch is handed to the writers. Once it sees one it stops
+reading, lets the batches already queued for the writers finish and records
+their checkpoints, and raises UploadCancelled; the write slots it was
+admitted with are released as the exception unwinds. An upload still
+waiting for admission stops waiting.
+
+Requests made in the ingesting process are seen at once. Requests made in
+another process (a web process cancelling a Celery ingest) are picked up by
+reading the record at most every ``UPLOAD_CANCELLATION['POLL_INTERVAL']``
+seconds.
+
+Whoever started the ingest catches UploadCancelled and calls
+finish_cancellation, which marks the upload cancelled and, when the request
+asked for it, rolls back what was committed (see core/upload_rollback.py).
+Without a rollback the committed chunks stay, and the upload can be resumed.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+from core.csv_processing_config import UPLOAD_CANCELLATION
+from core.upload_progress import TERMINAL_STATUSES, upload_progress
+from core.upload_rollback import rollback_upload
+
+logger = logging.getLogger(__name__)
+
+# Uploads whose cancellation was requested in this process
+_requested = set()
+_requested_lock = threading.Lock()
+
+
+class UploadCancelled(Exception):
+    """Raised by an ingest that stopped because its upload was cancelled"""
+    def __init__(self, upload_id, stats=None):
+        super().__init__(f"Upload {upload_id} was cancelled")
+        self.upload_id = upload_id
+        self.stats = stats
+
+
+def _object_id(upload_id):
+    return ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+
+
+def request_cancellation(dbs, upload_id, rollback=False):
+    """
+    Ask the ingest of an upload to stop
+
+    The request is also recorded on the unfinished files of a multi-file upload.
+
+    Args:
+        dbs: Dict of database alias to database
+        upload_id: ID of the upload record
+        rollback: Roll back what the upload committed once it has stopped
+
+    Returns:
+        list: IDs of the upload records the request was recorded on
+    """
+    object_id = _object_id(upload_id)
+    upload_ids = [object_id] + [child['_id'] for child in dbs['low_review_score_db'].raw_data_uploads.find(
+        {'parent_upload': object_id, 'status': {'$nin': list(TERMINAL_STATUSES)}}, {'_id': 1}
+    )]
+    update = {'$set': {'cancel_requested': {'requested_at': datetime.utcnow(), 'rollback': bool(rollback)}}}
+    for db in dbs.values():
+        db.raw_data_uploads.update_many({'_id': {'$in': upload_ids}}, update)
+    with _requested_lock:
+        _requested.update(str(upload_id) for upload_id in upload_ids)
+    logger.info(f"Cancellation requested for upload {object_id} ({len(upload_ids)} records)")
+    return upload_ids
+
+
+def clear_cancellation(dbs, upload_id):
+    """Withdraw a cancellation request, e.g. before a cancelled upload is resumed"""
+    object_id = _object_id(upload_id)
+    for db in dbs.values():
+        db.raw_data_uploads.update_one({'_id': object_id}, {'$unset': {'cancel_requested': ''}})
+    with _requested_lock:
+        _requested.discard(str(object_id))
+
+
+def cancellation_requested(db, upload_id):
+    """Return whether the cancellation of an upload was requested"""
+    with _requested_lock:
+        if str(upload_id) in _requested:
+            return True
+    upload = db.raw_data_uploads.find_one({'_id': _object_id(upload_id)}, {'cancel_requested': 1}) or {}
+    return bool(upload.get('cancel_requested'))
+
+
+class CancellationCheck:
+    """
+    Answers whether an upload's cancellation was requested, reading its record at a bounded rate
+    """
+    def __init__(self, upload_id, db, poll_interval=None):
+        """
+        Args:
+            upload_id: ID of the upload record
+            db: Database holding the upload record
+            poll_interval: Seconds between reads of the record
+                (defaults to UPLOAD_CANCELLATION['POLL_INTERVAL'])
+        """
+        self.upload_id = upload_id
+        self.db = db
+        self.poll_interval = poll_interval or UPLOAD_CANCELLATION['POLL_INTERVAL']
+        self._checked_at = time.monotonic()
+        self._requested = False
+
+    def requested(self):
+        """Return whether the upload should stop"""
+        if self._requested:
+            return True
+        with _requested_lock:
+            self._requested = str(self.upload_id) in _requested
+        if not self._requested and time.monotonic() - self._checked_at >= self.poll_interval:
+            self._checked_at = time.monotonic()
+            try:
+                self._requested = cancellation_requested(self.db, self.upload_id)
+            except Exception as e:
+                logger.error(f"Error checking for cancellation of upload {self.upload_id}: {str(e)}")
+        return self._requested
+
+
+def finish_cancellation(dbs, upload_id, source_alias='low_review_score_db'):
+    """
+    Mark an upload whose ingest stopped on request as cancelled, rolling it back if requested
+
+    With a rollback the retained copy of the file is removed too, as there
+    is nothing left to resume. The files of a multi-file upload are rolled
+    back one by one as they stop, so its parent record is only marked.
+
+    Args:
+        dbs: Dict of database alias to database
+        upload_id: ID of the upload record
+        source_alias: Database the upload's sales are read from for a rollback
+
+    Returns:
+        dict: Documents deleted per database and collection, or None without a rollback
+    """
+    object_id = _object_id(upload_id)
+    upload = dbs[source_alias].raw_data_uploads.find_one(
+        {'_id': object_id}, {'cancel_requested': 1, 'source_file_path': 1, 'batch_files': 1}
+    ) or {}
+    deleted = None
+    update_data = {'status': 'cancelled', 'cancelled_at': datetime.utcnow()}
+    if (upload.get('cancel_requested') or {}).get('rollback') and not upload.get('batch_files'):
+        deleted = rollback_upload(dbs, object_id, source_alias)
+        source_file_path = upload.get('source_file_path')
+        if source_file_path and os.path.exists(source_file_path):
+            os.remove(source_file_path)
+        update_data['source_file_path'] = None
+    for db in dbs.values():
+        db.raw_data_uploads.update_one({'_id': object_id}, {'$set': update_data})
+    upload_progress.publish(object_id, {'status': 'cancelled'})
+    with _requested_lock:
+        _requested.discard(str(object_id))
+    logger.info(f"Upload {object_id} cancelled" + (' and rolled back' if deleted is not None else ''))
+    return deleted
@@ -0,0 +1,180 @@
+"""
+Upload File Formats
+
+Maps upload file names to the format they are ingested as, and reads the
+columnar formats (Parquet, Feather and Arrow IPC) in chunks with pyarrow.
+Columnar files are memory-mapped where a path is available and converted to
+pandas one chunk at a time, so there is no text-parsing step. Compressed CSV
+files are kept compressed and decompressed as the chunked parser reads them.
+"""
+
+import logging
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    logging.warning("pyarrow not available, Parquet/Feather/Arrow uploads will be disabled")
+
+try:
+    import zstandard  # noqa: F401 (used by pandas for 'zstd' compression)
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# File name suffix -> upload format
+UPLOAD_FORMATS = {
+    '.csv': 'csv',
+    '.csv.gz': 'csv',
+    '.csv.bz2': 'csv',
+    '.csv.zst': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'arrow',
+    '.ipc': 'arrow',
+    '.arrows': 'arrow_stream',
+}
+
+COLUMNAR_FORMATS = ('parquet', 'feather', 'arrow', 'arrow_stream')
+
+# Compressed CSV suffix -> pandas compression codec
+CSV_COMPRESSIONS = {
+    '.csv.gz': 'gzip',
+    '.csv.bz2': 'bz2',
+    '.csv.zst': 'zstd',
+}
+
+
+def file_suffix(file_name):
+    """Return the recognised upload suffix of a file name, or None"""
+    name = file_name.lower()
+    for suffix in sorted(UPLOAD_FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def detect_file_format(file_name):
+    """Return the upload format of a file name ('csv', 'parquet', ...), or None"""
+    suffix = file_suffix(file_name)
+    return UPLOAD_FORMATS[suffix] if suffix else None
+
+
+def detect_compression(file_name):
+    """Return the compression codec of a compressed CSV file name, or None"""
+    return CSV_COMPRESSIONS.get(file_suffix(file_name))
+
+
+def compression_available(compression):
+    """Return whether the codec needed to read a compressed upload is installed"""
+    return compression != 'zstd' or ZSTD_AVAILABLE
+
+
+def _arrow_source(source):
+    """Open a path memory-mapped, or wrap a file-like object's bytes in an Arrow buffer"""
+    if isinstance(source, (str, os.PathLike)):
+        return pa.memory_map(os.fspath(source), 'r')
+    if hasattr(source, 'temporary_file_path'):
+        # Django spooled large uploads to disk already
+        return pa.memory_map(source.temporary_file_path(), 'r')
+    source.seek(0)
+    return pa.BufferReader(source.read())
+
+
+def _open_table(source, file_format):
+    """Load a Feather or Arrow IPC file as a table backed by the mapped file"""
+    arrow_source = _arrow_source(source)
+    if file_format == 'feather':
+        return feather.read_table(arrow_source, memory_map=True)
+    if file_format == 'arrow_stream':
+        return pa.ipc.open_stream(arrow_source).read_all()
+    return pa.ipc.open_file(arrow_source).read_all()
+
+
+def iter_columnar_chunks(source, file_format, chunk_size):
+    """
+    Yield a columnar file as pandas DataFrames of at most ``chunk_size`` rows
+
+    Args:
+        source: Path, Django uploaded file or binary file-like object
+        file_format: One of COLUMNAR_FORMATS
+        chunk_size: Maximum rows per chunk
+
+    Yields:
+        pandas.DataFrame: Consecutive chunks of the file
+    """
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow is required to read Parquet, Feather and Arrow files")
+
+    if file_format == 'parquet':
+        parquet_file = pq.ParquetFile(_arrow_source(source))
+        logger.info(f"Reading Parquet file with {parquet_file.metadata.num_rows} rows "
+                    f"in {parquet_file.num_row_groups} row groups")
+        # Batches are re-sliced so chunks do not depend on the row group layout
+        pending = []
+        pending_rows = 0
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= chunk_size:
+                table = pa.Table.from_batches(pending)
+                for offset in range(0, table.num_rows - chunk_size + 1, chunk_size):
+                    yield table.slice(offset, chunk_size).to_pandas()
+                remainder = table.num_rows % chunk_size
+                pending = table.slice(table.num_rows - remainder).to_batches() if remainder else []
+                pending_rows = remainder
+        if pending_rows:
+            yield pa.Table.from_batches(pending).to_pandas()
+        return
+
+    table = _open_table(source, file_format)
+    logger.info(f"Reading {file_format} file with {table.num_rows} rows")
+    for offset in range(0, table.num_rows, chunk_size):
+        # Slices are zero-copy views of the mapped table
+        yield table.slice(offset, chunk_size).to_pandas()
+
+
+def columnar_row_count(source, file_format):
+    """Return the number of rows in a columnar file, reading only its metadata where possible"""
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow is required to read Parquet, Feather and Arrow files")
+    if file_format == 'parquet':
+        return pq.ParquetFile(_arrow_source(source)).metadata.num_rows
+    return _open_table(source, file_format).num_rows
+
+
+def iter_columnar_range(source, file_format, offset, row_count, chunk_size):
+    """
+    Yield rows ``offset`` to ``offset + row_count`` of a columnar file as DataFrames of ``chunk_size`` rows
+
+    Only the Parquet row groups overlapping the range are read; Feather and
+    Arrow files are memory-mapped and sliced.
+    """
+    if not PYARROW_AVAILABLE:
+        raise ImportError("pyarrow is required to read Parquet, Feather and Arrow files")
+
+    if file_format == 'parquet':
+        parquet_file = pq.ParquetFile(_arrow_source(source))
+        row_groups = []
+        group_start = first_group_start = 0
+        for index in range(parquet_file.num_row_groups):
+            group_rows = parquet_file.metadata.row_group(index).num_rows
+            if group_start + group_rows > offset and group_start < offset + row_count:
+                if not row_groups:
+                    first_group_start = group_start
+                row_groups.append(index)
+            group_start += group_rows
+        if not row_groups:
+            return
+        table = parquet_file.read_row_groups(row_groups).slice(offset - first_group_start, row_count)
+    else:
+        table = _open_table(source, file_format).slice(offset, row_count)
+    for start in range(0, table.num_rows, chunk_size):
+        yield table.slice(start, chunk_size).to_pandas()
@@ -0,0 +1,85 @@
+"""
+In-Process Upload Progress Channel
+
+Bulk processors publish every progress update here as it happens, while only
+a coalesced subset is written to MongoDB at a bounded rate. Status streams
+in the same process wait on the channel instead of polling the database;
+streams served by another process fall back to reading the upload record at
+``UPLOAD_PROGRESS['STREAM_POLL_INTERVAL']``.
+"""
+
+import threading
+import time
+from core.csv_processing_config import UPLOAD_PROGRESS
+
+# Statuses after which an upload's progress no longer changes
+TERMINAL_STATUSES = ('completed', 'failed', 'rolled_back', 'cancelled')
+
+
+class UploadProgressChannel:
+    """
+    Latest known progress per upload, with blocking waits for changes
+    """
+    def __init__(self, retention=None):
+        """
+        Initialize the channel
+
+        Args:
+            retention: Seconds a finished upload's progress is kept for late
+                subscribers (defaults to UPLOAD_PROGRESS['RETENTION'])
+        """
+        self.retention = retention or UPLOAD_PROGRESS['RETENTION']
+        self._uploads = {}
+        self._condition = threading.Condition()
+
+    def publish(self, upload_id, update_data):
+        """Merge an update into an upload's progress and wake its subscribers"""
+        with self._condition:
+            entry = self._uploads.setdefault(str(upload_id), {'version': 0, 'progress': {}})
+            entry['progress'].update(update_data)
+            entry['version'] += 1
+            entry['updated_at'] = time.monotonic()
+            self._expire()
+            self._condition.notify_all()
+
+    def snapshot(self, upload_id):
+        """
+        Return the latest progress of an upload
+
+        Returns:
+            tuple: (version, progress dict), or (0, None) if nothing was published
+        """
+        with self._condition:
+            entry = self._uploads.get(str(upload_id))
+            if not entry:
+                return 0, None
+            return entry['version'], dict(entry['progress'])
+
+    def wait(self, upload_id, version, timeout):
+        """
+        Block until an upload's progress moves past ``version`` or ``timeout`` elapses
+
+        Returns:
+            tuple: (version, progress dict) as returned by snapshot()
+        """
+        upload_id = str(upload_id)
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._uploads.get(upload_id, {}).get('version', 0) != version,
+                timeout=timeout
+            )
+        return self.snapshot(upload_id)
+
+    def _expire(self):
+        """Drop finished uploads older than the retention period (lock held)"""
+        cutoff = time.monotonic() - self.retention
+        expired = [
+            upload_id for upload_id, entry in self._uploads.items()
+            if entry['updated_at'] < cutoff and entry['progress'].get('status') in TERMINAL_STATUSES
+        ]
+        for upload_id in expired:
+            del self._uploads[upload_id]
+
+
+# Shared by every processor and status stream in this process
+upload_progress = UploadProgressChannel()
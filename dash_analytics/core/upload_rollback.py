@@ -0,0 +1,225 @@
+"""
+Per-Upload Rollback
+
+Every customer, product, order, sale and review document an upload writes is
+tagged with its ``upload_id``, and each of those collections is indexed on
+the tag. Rolling an upload back deletes its documents with indexed
+``delete_many`` calls run in parallel in both databases, so it takes time in
+proportion to the upload rather than to the collections.
+
+A fact row (order, sale, review) and its row hash keep the tag of the
+upload that first wrote them, and list in ``upload_ids`` every upload that
+contains them: each upload that writes the row again, or skips it because
+it was already ingested (see delta ingestion in core/bulk_processor.py).
+Rolling an upload back only deletes the rows no other upload contains; it
+is taken out of the owners of the others, which are kept with a warning.
+Rows written before owners were recorded belong to their tagged upload.
+A customer or product belongs to the last upload that created or changed
+it, and is only deleted when no remaining order refers to it. Values an
+upload changed on rows that other uploads still use are kept, as earlier
+values are not recorded.
+
+Before the sales are deleted, the sales trend and customer behavior totals
+are decremented by them. Growth rates, shares and segments are then
+refreshed for the affected period types and customers.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from core.csv_processing_config import UPLOAD_ROLLBACK
+from core.incremental_analytics import AnalyticsPartials, customer_segment_updates, trend_ratio_updates
+
+logger = logging.getLogger(__name__)
+
+# Field every ingested document carries the ID of its upload in
+UPLOAD_TAG = 'upload_id'
+UPLOAD_INDEX_NAME = 'upload_id_idx'
+# Field listing every upload that contains a fact row
+UPLOAD_OWNERS = 'upload_ids'
+UPLOAD_OWNERS_INDEX_NAME = 'upload_ids_idx'
+
+# Collection -> database aliases it is written to
+TAGGED_COLLECTIONS = {
+    'customers': ('low_review_score_db', 'high_review_score_db'),
+    'products': ('low_review_score_db', 'high_review_score_db'),
+    'orders': ('low_review_score_db', 'high_review_score_db'),
+    'sales': ('low_review_score_db', 'high_review_score_db'),
+    'low_reviews': ('low_review_score_db',),
+    'high_reviews': ('high_review_score_db',),
+    # Row hashes of delta ingestion, so a corrected file is not skipped as already seen
+    'ingested_row_hashes': ('low_review_score_db',),
+}
+
+# Collections whose rows can be contained in several uploads
+OWNED_COLLECTIONS = ('orders', 'sales', 'low_reviews', 'high_reviews', 'ingested_row_hashes')
+
+# Dimension collection -> key field orders refer to it by
+DIMENSION_REFERENCES = {
+    'customers': 'customer_id',
+    'products': 'product_id',
+}
+
+
+def ensure_upload_indexes(dbs):
+    """Create the indexes on the upload tag and owners of every tagged collection, if missing"""
+    for alias, db in dbs.items():
+        for collection_name, aliases in TAGGED_COLLECTIONS.items():
+            if alias in aliases:
+                db[collection_name].create_index(UPLOAD_TAG, name=UPLOAD_INDEX_NAME)
+                if collection_name in OWNED_COLLECTIONS:
+                    db[collection_name].create_index(UPLOAD_OWNERS, name=UPLOAD_OWNERS_INDEX_NAME)
+
+
+def owned_upsert(collection_name, document):
+    """
+    Return the update that upserts an ingested document
+
+    A fact row keeps the tag of the upload that first wrote it, and the
+    upload writing it is added to its owners.
+    """
+    upload_id = document.get(UPLOAD_TAG)
+    if collection_name not in OWNED_COLLECTIONS or upload_id is None:
+        return {'$set': document}
+    fields = {field: value for field, value in document.items() if field != UPLOAD_TAG}
+    return {'$set': fields, '$setOnInsert': {UPLOAD_TAG: upload_id}, '$addToSet': {UPLOAD_OWNERS: upload_id}}
+
+
+def with_owners(document):
+    """Return a fact document to insert, owned by the upload it is tagged with"""
+    if document.get(UPLOAD_TAG) is None:
+        return document
+    return {**document, UPLOAD_OWNERS: [document[UPLOAD_TAG]]}
+
+
+def owned_by(upload_id):
+    """Return the query matching the rows an upload contains"""
+    return {'$or': [{UPLOAD_TAG: upload_id}, {UPLOAD_OWNERS: upload_id}]}
+
+
+def owned_only_by(upload_id):
+    """Return the query matching the rows an upload contains and no other upload does"""
+    return {'$and': [
+        owned_by(upload_id),
+        {UPLOAD_TAG: {'$in': [upload_id, None]}},
+        {'$or': [{UPLOAD_OWNERS: {'$exists': False}}, {UPLOAD_OWNERS: {'$size': 0}}, {UPLOAD_OWNERS: [upload_id]}]},
+    ]}
+
+
+def upload_partials(db, upload_id):
+    """Return the sales trend and customer behavior totals of the sales only an upload contains"""
+    sales = pd.DataFrame(list(db.sales.find(
+        owned_only_by(upload_id), {'_id': 0, 'customer_id': 1, 'quantity': 1, 'sale_date': 1, 'revenue': 1}
+    )), columns=['customer_id', 'quantity', 'sale_date', 'revenue'])
+    return AnalyticsPartials.from_frame(sales.rename(columns={'sale_date': 'order_date'}))
+
+
+def _unreferenced_keys(db, key_field, keys, batch_size):
+    """Return the keys no order refers to any more"""
+    referenced = set()
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        referenced.update(db.orders.distinct(key_field, {key_field: {'$in': batch}}))
+    return [key for key in keys if key not in referenced]
+
+
+def _delete_upload(db, alias, upload_id, batch_size):
+    """
+    Delete the documents of an upload from one database; dimensions go last, once orders are gone
+
+    Returns:
+        tuple: (collection name -> documents deleted,
+        collection name -> rows kept because other uploads contain them too)
+    """
+    deleted, shared = {}, {}
+    for collection_name, aliases in TAGGED_COLLECTIONS.items():
+        if alias in aliases and collection_name not in DIMENSION_REFERENCES:
+            collection = db[collection_name]
+            deleted[collection_name] = collection.delete_many(owned_only_by(upload_id)).deleted_count
+            shared[collection_name] = collection.count_documents(owned_by(upload_id))
+            if shared[collection_name]:
+                # Left to the other uploads that contain them
+                collection.update_many({UPLOAD_OWNERS: upload_id}, {'$pull': {UPLOAD_OWNERS: upload_id}})
+                collection.update_many({UPLOAD_TAG: upload_id}, {'$unset': {UPLOAD_TAG: ''}})
+    for collection_name, key_field in DIMENSION_REFERENCES.items():
+        keys = db[collection_name].distinct(key_field, {UPLOAD_TAG: upload_id})
+        orphans = _unreferenced_keys(db, key_field, keys, batch_size)
+        deleted[collection_name] = 0
+        for start in range(0, len(orphans), batch_size):
+            deleted[collection_name] += db[collection_name].delete_many(
+                {UPLOAD_TAG: upload_id, key_field: {'$in': orphans[start:start + batch_size]}}
+            ).deleted_count
+    return deleted, {collection_name: count for collection_name, count in shared.items() if count}
+
+
+def _revert_analytics(dbs, source_alias, partials):
+    """Subtract an upload's totals from the incremental analytics and refresh what depends on them"""
+    if partials.is_empty():
+        return
+    undo = partials.negated()
+    trend_ids = [f"trend-{period_type}-{period_value}" for period_type, period_value in partials.trends]
+    behavior_ids = [f"behavior-{customer_id}" for customer_id in partials.customers]
+    for db in dbs.values():
+        db.sales_trends.bulk_write(undo.trend_operations(), ordered=False)
+        db.customer_behavior.bulk_write(undo.customer_operations(), ordered=False)
+        # Periods and customers that only had sales from this upload
+        db.sales_trends.delete_many({'id': {'$in': trend_ids}, 'total_orders': {'$lte': 0}})
+        db.customer_behavior.delete_many({'id': {'$in': behavior_ids}, 'total_purchases': {'$lte': 0}})
+
+    source = dbs[source_alias]
+    for collection_name, updates in (
+        ('sales_trends', trend_ratio_updates(source, partials.period_types())),
+        ('customer_behavior', customer_segment_updates(source, behavior_ids)),
+    ):
+        if updates:
+            operations = [UpdateOne({'id': update['id']}, {'$set': update}) for update in updates]
+            for db in dbs.values():
+                db[collection_name].bulk_write(operations, ordered=False)
+
+
+def rollback_upload(dbs, upload_id, source_alias='low_review_score_db'):
+    """
+    Remove everything an upload wrote and take its sales out of the analytics
+
+    Rows other uploads contain too are kept; they are counted in the
+    upload record's ``rollback_shared`` and logged as a warning.
+
+    Args:
+        dbs: Dict of database alias to database
+        upload_id: ID of the upload record
+        source_alias: Database the upload's sales are read from
+
+    Returns:
+        dict: Database alias -> collection name -> documents deleted
+    """
+    upload_id = ObjectId(upload_id) if isinstance(upload_id, str) else upload_id
+    batch_size = UPLOAD_ROLLBACK['KEY_BATCH_SIZE']
+    ensure_upload_indexes(dbs)
+
+    # Read before the sales are deleted
+    partials = upload_partials(dbs[source_alias], upload_id)
+
+    with ThreadPoolExecutor(max_workers=len(dbs), thread_name_prefix='upload-rollback') as executor:
+        futures = {
+            alias: executor.submit(_delete_upload, db, alias, upload_id, batch_size)
+            for alias, db in dbs.items()
+        }
+        results = {alias: future.result() for alias, future in futures.items()}
+    deleted = {alias: result[0] for alias, result in results.items()}
+    shared = {alias: result[1] for alias, result in results.items() if result[1]}
+
+    _revert_analytics(dbs, source_alias, partials)
+
+    if shared:
+        logger.warning(f"Kept rows of upload {upload_id} that other uploads contain too: {shared}")
+    update = {'$set': {'status': 'rolled_back', 'rolled_back_at': datetime.utcnow(), 'rollback': deleted,
+                       'rollback_shared': shared, 'checkpoints': []}}
+    for db in dbs.values():
+        db.raw_data_uploads.update_one({'_id': upload_id}, update)
+    logger.info(f"Rolled back upload {upload_id}: {deleted}")
+    return deleted
@@ -185,6 +185,10 @@ def initialize_databases():
             # Create any unique compound indexes here if needed
             logger.info(f"Initialized collections and indexes in {db_alias}")
 
+        # Indexes on the upload tag, so an upload can be rolled back in time proportional to its size
+        from core.upload_rollback import ensure_upload_indexes
+        ensure_upload_indexes({'low_review_score_db': low_db, 'high_review_score_db': high_db})
+
         # Validate all collections and indexes
         validate_database_setup()
         logger.info("Successfully initialized all databases and collections")
@@ -145,6 +145,18 @@ for db_key, db_config in MONGODB_DATABASES.items():
         uuidRepresentation='standard'
     )
 
+# Celery broker and result backend (see celery_app.py). The defaults run tasks
+# eagerly in-process. For a worker fleet point them at Redis, e.g.
+# CELERY_BROKER_URL=redis://host:6379/0, and set CELERY_TASK_ALWAYS_EAGER=False.
+# Without any services, CELERY_BROKER_URL=filesystem:// (messages in
+# CELERY_BROKER_FILESYSTEM_DIR) with CELERY_RESULT_BACKEND=file:///some/dir or
+# db+sqlite:///results.sqlite lets local workers share tasks.
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default='memory://')
+CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND', default='db+sqlite:///results.sqlite')
+CELERY_BROKER_FILESYSTEM_DIR = config('CELERY_BROKER_FILESYSTEM_DIR', default=str(BASE_DIR / 'celery_broker'))
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=True, cast=bool)
+CELERY_TASK_EAGER_PROPAGATES = True
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
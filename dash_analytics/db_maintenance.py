@@ -4,7 +4,7 @@ Database Maintenance Utility
 This script provides maintenance operations for the DashAnalytics MongoDB databases:
 1. Cleans up old log files
 2. Optimizes database collections
-3. Removes temporary data
+3. Removes temporary data and expired parsed upload spools
 
 Usage:
     python db_maintenance.py [--clean-logs] [--optimize-db] [--clean-temp]
@@ -92,6 +92,12 @@ def optimize_database():
                 except Exception as e:
                     logger.warning(f"  - Error optimizing {collection_name}: {str(e)}")
         
+        # Restore secondary indexes left dropped by interrupted bulk loads
+        from core.bulk_load import rebuild_deferred_indexes
+        rebuilt = rebuild_deferred_indexes({db_name: get_db(db_name) for db_name in databases})
+        if rebuilt:
+            logger.info(f"Rebuilt deferred indexes of {rebuilt} interrupted bulk loads")
+        
         logger.info(f"Optimized {collections_optimized} collections")
         return collections_optimized
         
@@ -130,6 +136,20 @@ def clean_temp_data():
                 except Exception as e:
                     logger.error(f"Error removing {file_path}: {str(e)}")
     
+    # Remove parsed upload spools past their retention
+    try:
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dash_analytics.settings')
+        django.setup()
+        
+        from mongoengine.connection import get_db
+        from core.parsed_spool import remove_expired_spools
+        
+        databases = ['high_review_score_db', 'low_review_score_db']
+        count += remove_expired_spools({db_name: get_db(db_name) for db_name in databases})
+    except Exception as e:
+        logger.error(f"Error removing expired parsed spools: {str(e)}")
+    
     logger.info(f"Cleaned {count} temporary files/directories")
     return count
 